@@ -0,0 +1,375 @@
+"""
+
+Array backed Profile for very large numbers of groups
+
+A Profile holds a list of pydantic Groups, which is fine for the tens of
+groups made in the GUI but costs a validated model and dicts per group.
+ColumnarProfile keeps every group as one row of a structured numpy array and
+computes totals, active outputs, timelines and the SeqTable over the whole
+array at once. Groups are still available through light Group-like views.
+
+"""
+
+from collections.abc import Sequence
+
+import numpy as np
+from ophyd_async.fastcs.panda import SeqTable, SeqTrigger
+
+from SAS_bluesky.ProfileGroups import SEQ_TRIGGERS, Group, Profile
+from SAS_bluesky.ProfileTimeline import (
+    CompactTimeline,
+    TriggerTimeline,
+    timeline_from_columns,
+)
+from SAS_bluesky.SeqCompiler import compile_seq_table, raw_seq_columns
+from SAS_bluesky.utils.ncdcore import CLOCK_FREQUENCY, ncdcore
+
+TRIGGER_NAMES = list(SeqTrigger.__members__)
+MAX_PULSES = 16 #bits in the pulse masks
+
+GROUP_DTYPE = np.dtype([("frames", np.int64),
+                        ("wait_time", np.int64),
+                        ("wait_units", "U8"),
+                        ("run_time", np.int64),
+                        ("run_units", "U8"),
+                        ("trigger", np.uint8), #index into TRIGGER_NAMES
+                        ("wait_mask", np.uint16), #bit n is pulse n
+                        ("run_mask", np.uint16),
+                        ("wait_ticks", np.int64),
+                        ("run_ticks", np.int64)])
+
+
+def pulses_to_mask(pulses: np.ndarray) -> np.ndarray:
+
+    """
+
+    (n_groups, n_pulses) array of 0/1 -> uint16 bitmask per group
+
+    """
+
+    pulses = np.asarray(pulses, dtype=np.uint16)
+
+    if pulses.shape[-1] > MAX_PULSES:
+        raise ValueError(f"At most {MAX_PULSES} pulses are supported, "
+                         f"got {pulses.shape[-1]}")
+
+    bits = np.arange(pulses.shape[-1], dtype=np.uint16)
+
+    return (pulses << bits).sum(axis=-1, dtype=np.uint16)
+
+
+def mask_to_pulses(mask: np.ndarray, n_pulses: int) -> np.ndarray:
+
+    """
+
+    uint16 bitmask per group -> (n_groups, n_pulses) boolean array
+
+    """
+
+    mask = np.asarray(mask, dtype=np.uint16)
+
+    return ((mask[..., None] >> np.arange(n_pulses, dtype=np.uint16)) & 1).astype(bool)
+
+
+class GroupView:
+
+    """
+
+    Read only Group-like view of one row of a ColumnarProfile
+
+    """
+
+    __slots__ = ("_profile", "_index")
+
+    def __init__(self, profile: "ColumnarProfile", index: int):
+        self._profile = profile
+        self._index = index
+
+    @property
+    def _row(self):
+        return self._profile.array[self._index]
+
+    def __getattr__(self, name):
+
+        if name not in GROUP_DTYPE.names:
+            raise AttributeError(name)
+
+        return self._row[name].item()
+
+    @property
+    def pause_trigger(self) -> str:
+        return TRIGGER_NAMES[self._row["trigger"]]
+
+    def _pulses(self, mask: str) -> list[int]:
+        pulses = mask_to_pulses(self._row[mask], self._profile.n_pulses)
+
+        return pulses.astype(int).tolist()
+
+    @property
+    def wait_pulses(self) -> list[int]:
+        return self._pulses("wait_mask")
+
+    @property
+    def run_pulses(self) -> list[int]:
+        return self._pulses("run_mask")
+
+    @property
+    def group_ticks(self) -> int:
+        return (self.wait_ticks+self.run_ticks)*self.frames
+
+    @property
+    def wait_time_s(self) -> float:
+        return self.wait_ticks/CLOCK_FREQUENCY
+
+    @property
+    def run_time_s(self) -> float:
+        return self.run_ticks/CLOCK_FREQUENCY
+
+    @property
+    def group_duration(self) -> float:
+        return self.group_ticks/CLOCK_FREQUENCY
+
+    def to_group(self) -> Group:
+
+        return Group(frames=self.frames,
+                     wait_time=self.wait_time,
+                     wait_units=self.wait_units,
+                     run_time=self.run_time,
+                     run_units=self.run_units,
+                     pause_trigger=self.pause_trigger,
+                     wait_pulses=self.wait_pulses,
+                     run_pulses=self.run_pulses)
+
+    def seq_row(self) -> SeqTable:
+        return self.to_group().seq_row()
+
+    def __repr__(self):
+        return f"GroupView({self._index}, {self.to_group()!r})"
+
+
+class GroupViews(Sequence):
+
+    __slots__ = ("_profile",)
+
+    def __init__(self, profile: "ColumnarProfile"):
+        self._profile = profile
+
+    def __len__(self):
+        return len(self._profile.array)
+
+    def __getitem__(self, index):
+
+        if isinstance(index, slice):
+            return [GroupView(self._profile, i)
+                    for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("group index out of range")
+
+        return GroupView(self._profile, index)
+
+
+class ColumnarProfile:
+
+    """
+
+    Profile whose groups are held in a structured numpy array (GROUP_DTYPE)
+
+    """
+
+    def __init__(self,
+                 array: np.ndarray | None = None,
+                 cycles: int = 1,
+                 seq_trigger: str = "IMMEDIATE",
+                 multiplier: list[int] | None = None,
+                 n_pulses: int = 4):
+
+        self.array = np.zeros(0, dtype=GROUP_DTYPE) if array is None else array
+        self.cycles = cycles
+        self.seq_trigger = seq_trigger
+        self.multiplier = [1, 1, 1, 1] if multiplier is None else multiplier
+        self.n_pulses = n_pulses
+
+    @staticmethod
+    def group_array(frames,
+                    wait_time,
+                    wait_units,
+                    run_time,
+                    run_units,
+                    pause_trigger,
+                    wait_pulses,
+                    run_pulses) -> np.ndarray:
+
+        """
+
+        Builds a GROUP_DTYPE array from columns, scalars are broadcast
+
+        """
+
+        frames = np.atleast_1d(np.asarray(frames, dtype=np.int64))
+        n_groups = len(frames)
+
+        def column(values):
+            return np.broadcast_to(np.asarray(values), (n_groups,))
+
+        def pulse_column(values):
+            return np.broadcast_to(np.atleast_2d(np.asarray(values)),
+                                   (n_groups, np.shape(values)[-1]))
+
+        def lookup(values, convert):
+            #only convert each distinct value once
+            unique, inverse = np.unique(column(values).astype(str), return_inverse=True)
+            return np.array([convert(u) for u in unique])[inverse.reshape(-1)]
+
+        trigger_index = {name: TRIGGER_NAMES.index(t.name)
+                         for name, t in SEQ_TRIGGERS.items()}
+
+        array = np.empty(n_groups, dtype=GROUP_DTYPE)
+        array["frames"] = frames
+        array["wait_time"] = column(wait_time)
+        array["wait_units"] = lookup(wait_units, str.upper)
+        array["run_time"] = column(run_time)
+        array["run_units"] = lookup(run_units, str.upper)
+        array["trigger"] = lookup(pause_trigger, lambda t: trigger_index[t.upper()])
+        array["wait_mask"] = pulses_to_mask(pulse_column(wait_pulses))
+        array["run_mask"] = pulses_to_mask(pulse_column(run_pulses))
+        array["wait_ticks"] = ncdcore.to_ticks_array(array["wait_time"],
+                                                     array["wait_units"])
+        array["run_ticks"] = ncdcore.to_ticks_array(array["run_time"],
+                                                    array["run_units"])
+
+        return array
+
+    @classmethod
+    def from_profile(cls, profile: Profile) -> "ColumnarProfile":
+
+        groups = profile.groups
+        n_pulses = max((len(p) for g in groups for p in (g.wait_pulses, g.run_pulses)),
+                       default=len(profile.multiplier))
+
+        def pulses(attr):
+            return [list(getattr(g, attr)) + [0]*(n_pulses-len(getattr(g, attr)))
+                    for g in groups] or np.zeros((0, n_pulses))
+
+        array = cls.group_array(frames=[g.frames for g in groups],
+                                wait_time=[g.wait_time for g in groups],
+                                wait_units=[g.wait_units for g in groups],
+                                run_time=[g.run_time for g in groups],
+                                run_units=[g.run_units for g in groups],
+                                pause_trigger=[g.pause_trigger or "IMMEDIATE"
+                                               for g in groups],
+                                wait_pulses=pulses("wait_pulses"),
+                                run_pulses=pulses("run_pulses"))
+
+        return cls(array,
+                   cycles=profile.cycles,
+                   seq_trigger=profile.seq_trigger,
+                   multiplier=list(profile.multiplier),
+                   n_pulses=n_pulses)
+
+    def to_profile(self) -> Profile:
+
+        return Profile(cycles=self.cycles,
+                       seq_trigger=self.seq_trigger,
+                       groups=[view.to_group() for view in self.groups],
+                       multiplier=list(self.multiplier))
+
+    @property
+    def groups(self) -> GroupViews:
+        return GroupViews(self)
+
+    def append_group(self, group: Group):
+        self.insert_group(len(self.array), group)
+
+    def insert_group(self, id: int, group: Group):
+
+        """
+
+        Inserts group before id. n_pulses is widened to fit its pulse lists,
+
+        so no pulse is lost
+
+        """
+
+        self.n_pulses = max(self.n_pulses,
+                            len(group.wait_pulses),
+                            len(group.run_pulses))
+
+        row = self.group_array(group.frames, group.wait_time, group.wait_units,
+                               group.run_time, group.run_units,
+                               group.pause_trigger or "IMMEDIATE",
+                               [group.wait_pulses], [group.run_pulses])
+
+        self.array = np.insert(self.array, id, row)
+
+    def delete_group(self, id: int):
+        self.array = np.delete(self.array, id)
+
+    @property
+    def total_frames(self) -> int:
+        return int(self.array["frames"].sum())
+
+    @property
+    def ticks_per_cycle(self) -> int:
+        frame_ticks = self.array["wait_ticks"] + self.array["run_ticks"]
+
+        return int(np.sum(frame_ticks*self.array["frames"]))
+
+    @property
+    def duration_per_cycle(self) -> float:
+        return self.ticks_per_cycle/CLOCK_FREQUENCY
+
+    @property
+    def duration_ticks(self) -> int:
+        return self.ticks_per_cycle*self.cycles
+
+    @property
+    def duration(self) -> float:
+        return self.duration_ticks/CLOCK_FREQUENCY
+
+    @property
+    def active_mask(self) -> int:
+        masks = self.array["wait_mask"] | self.array["run_mask"]
+
+        return int(np.bitwise_or.reduce(masks, initial=0))
+
+    @property
+    def active_out(self) -> np.ndarray:
+        return np.flatnonzero(mask_to_pulses(self.active_mask, self.n_pulses))
+
+    def group_columns(self) -> dict[str, np.ndarray]:
+
+        """
+
+        Same columns as ProfileTimeline.group_columns, without touching any Group
+
+        """
+
+        return {"frames": self.array["frames"],
+                "wait_ticks": self.array["wait_ticks"],
+                "run_ticks": self.array["run_ticks"],
+                "wait_pulses": mask_to_pulses(self.array["wait_mask"], self.n_pulses),
+                "run_pulses": mask_to_pulses(self.array["run_mask"], self.n_pulses)}
+
+    def build_trigger_timeline(self, include_cycles=True) -> TriggerTimeline:
+        return timeline_from_columns(self.group_columns(),
+                                     self.cycles if include_cycles else 1)
+
+    def compact_timeline(self) -> CompactTimeline:
+        return CompactTimeline(cycles=self.cycles, **self.group_columns())
+
+    def seq_table(self) -> SeqTable:
+
+        columns = self.group_columns()
+        triggers = np.array([SeqTrigger[name] for name in TRIGGER_NAMES],
+                            dtype=object)
+
+        return SeqTable(**compile_seq_table(raw_seq_columns(
+            frames=columns["frames"],
+            triggers=triggers[self.array["trigger"]],
+            wait_ticks=columns["wait_ticks"],
+            run_ticks=columns["run_ticks"],
+            wait_pulses=columns["wait_pulses"],
+            run_pulses=columns["run_pulses"])))
@@ -161,14 +161,15 @@ class PandAGUI(tk.Tk):
 
     def save_config(self):
 
-        panda_config_yaml = fd.asksaveasfile(mode='w',
-                                             defaultextension=".yaml",
-                                             filetypes=[("yaml", ".yaml")])
+        #only ask for the name, opening the file here would truncate it
+        #before save_to_yaml replaces it
+        panda_config_yaml = fd.asksaveasfilename(defaultextension=".yaml",
+                                                 filetypes=[("yaml", ".yaml")])
 
         if panda_config_yaml:
 
             self.commit_config()
-            self.configuration.save_to_yaml(panda_config_yaml.name)
+            self.configuration.save_to_yaml(panda_config_yaml)
 
 
     def show_start_value(self):
@@ -183,7 +184,7 @@ class PandAGUI(tk.Tk):
         index = self.notebook.index("current")
 
         profile_to_upload = self.configuration.profiles[index]
-        json_schema_profile = profile_to_upload.model_dump_json()
+        json_schema_profile = profile_to_upload.to_wire()
 
         try:
             self.client.run_plan(f"setup_panda {json_schema_profile}")
@@ -271,7 +272,7 @@ class PandAGUI(tk.Tk):
         current_profile = self.notebook.index("current")
 
         profile = self.configuration.profiles[current_profile]
-        json_schema_profile = profile.model_dump_json()
+        json_schema_profile = profile.to_wire()
         print(json_schema_profile)
 
         experiment = "cm40643-3"
@@ -485,10 +486,11 @@ class PandAGUI(tk.Tk):
         self.panda_config_yaml = panda_config_yaml
         self.default_config_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),"profile_yamls","default_panda_config.yaml") #noqa
 
+        #every profile gets a tab holding on to it, so none are evicted
         if self.panda_config_yaml is None:
-            self.configuration = ProfileLoader.read_from_yaml(self.default_config_path)
+            self.configuration = ProfileLoader.read_from_yaml(self.default_config_path, max_cached=None) #noqa
         else:
-            self.configuration = ProfileLoader.read_from_yaml(self.panda_config_yaml)
+            self.configuration = ProfileLoader.read_from_yaml(self.panda_config_yaml, max_cached=None) #noqa
 
 
         if self.configuration.experiment is None:
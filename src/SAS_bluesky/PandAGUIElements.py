@@ -21,7 +21,7 @@ from ophyd_async.fastcs.panda._block import PandaTimeUnits
 
 from dodal.utils import get_beamline_name
 
-from SAS_bluesky.ProfileGroups import Group, Profile
+from SAS_bluesky.ProfileGroups import Profile
 from SAS_bluesky.utils.ncdcore import ncdcore
 
 
@@ -494,34 +494,26 @@ class ProfileTab(ttk.Frame):
 
     def edit_config_for_profile(self):
 
-        group_list = []
-
-        for group_id, group_rowid in enumerate(self.profile_config_tree.get_children()): #noqa
-            group = (self.profile_config_tree.item(group_rowid)["values"])
-
-            wait_pulses = [int(f) for f in list(group[7].replace(" ",""))]
-            run_pulses = [int(f) for f in list(group[8].replace(" ",""))]
-
-            n_group =  Group(frames=int(group[1]),
-                            wait_time=int(group[2]),
-                            wait_units=group[3],
-                            run_time=int(group[4]),
-                            run_units=group[5],
-                            pause_trigger=group[6],
-                            wait_pulses=wait_pulses,
-                            run_pulses=run_pulses)
-
-            group_list.append(n_group)
+        groups = [self.profile_config_tree.item(group_rowid)["values"]
+                  for group_rowid in self.profile_config_tree.get_children()]
 
         cycles = self.get_n_cycles_value()
         profile_trigger = self.get_start_value()
 
         multiplier = [int(f.get()) for f in self.multiplier_var_options]
 
-        new_profile = Profile(cycles=cycles,
-                        seq_trigger=profile_trigger,
-                        groups=group_list,
-                        multiplier=multiplier)
+        new_profile = Profile.from_columns(
+            frames=[int(group[1]) for group in groups],
+            wait_time=[int(group[2]) for group in groups],
+            wait_units=[group[3] for group in groups],
+            run_time=[int(group[4]) for group in groups],
+            run_units=[group[5] for group in groups],
+            pause_trigger=[group[6] for group in groups],
+            wait_pulses=[[int(f) for f in group[7].replace(" ","")] for group in groups], #noqa
+            run_pulses=[[int(f) for f in group[8].replace(" ","")] for group in groups], #noqa
+            cycles=cycles,
+            seq_trigger=profile_trigger,
+            multiplier=multiplier)
 
         self.profile = new_profile
         self.configuration.profiles[self.n_profile] = new_profile
@@ -0,0 +1,331 @@
+"""
+
+Caches for profiles
+
+Compiled sidecar cache for profile yaml files
+
+Parsing a yaml config and validating every group is the slow part of opening
+a config. Once a config has been read, its profiles are written as columns
+(the kwargs of Profile.from_columns) to an NPZ file in the user cache directory, keyed by
+the path of the yaml file. The sidecar records the mtime, size and sha256 of
+the yaml it was built from and is only used while these still match, so
+reopening an unchanged config skips parsing. Only valid profiles are
+written, so they are read back with validate=False and are only built, not
+validated again, when they are used.
+
+Compiled artifact cache
+
+Things compiled from a profile (SeqTable columns, timelines...) are kept in
+an ArtifactCache keyed by Profile.content_hash and the artifact name, so an
+unchanged profile is never compiled twice. Artifacts are dicts of numpy
+arrays, held in memory up to max_bytes (least recently used dropped first)
+and optionally also written to a directory as npz files.
+
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+
+import numpy as np
+
+CACHE_VERSION = 1
+GROUP_PULSES = ("wait_pulses", "run_pulses")
+
+
+def cache_dir(kind: str = "profiles") -> str:
+
+    """
+
+    $XDG_CACHE_HOME/SAS_bluesky/kind, or ~/.cache/SAS_bluesky/kind
+
+    """
+
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache") #noqa
+
+    return os.path.join(base, "SAS_bluesky", kind)
+
+
+def sidecar_path(config_filepath: str) -> str:
+
+    key = hashlib.sha1(os.path.abspath(config_filepath).encode()).hexdigest()
+
+    return os.path.join(cache_dir(), key+".npz")
+
+
+def file_digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def _file_stamp(config_filepath: str) -> dict:
+
+    stat = os.stat(config_filepath)
+
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def _pack_pulses(pulses: list[list[int]]) -> tuple[np.ndarray, np.ndarray]:
+
+    #pulse lists can be ragged, store them padded along with their lengths
+    lengths = np.array([len(p) for p in pulses], dtype=np.int64)
+    matrix = np.zeros((len(pulses), int(lengths.max(initial=0))), dtype=np.uint8)
+
+    for n, p in enumerate(pulses):
+        matrix[n, :len(p)] = p
+
+    return matrix, lengths
+
+
+def _unpack_pulses(matrix: np.ndarray, lengths: np.ndarray) -> list[list[int]]:
+    return [row[:n] for row, n in zip(matrix.tolist(), lengths.tolist(), strict=True)]
+
+
+def save_sidecar(config_filepath: str,
+                 digest: str,
+                 meta: dict,
+                 profiles: list[dict],
+                 group_columns: Iterable[str]):
+
+    """
+
+    Writes the sidecar for config_filepath. meta holds the json-able
+
+    config fields, profiles the columns and fields of every profile, which
+
+    must already be validated (ProfileGroups.validate_section) as the sidecar
+
+    is read back without validating. group_columns names the group fields
+
+    (ProfileGroups.GROUP_INPUTS), the other keys of a profile are its fields
+
+    """
+
+    group_columns = tuple(group_columns)
+
+    #the groups of every profile are stored one after another in a few arrays,
+    #every member of an npz is read separately so fewer arrays load faster
+    fields = [{key: value for key, value in profile.items() if key not in group_columns}
+              for profile in profiles]
+
+    arrays = {"header": np.array(json.dumps({"version": CACHE_VERSION,
+                                             "digest": digest,
+                                             "meta": meta,
+                                             "profiles": fields,
+                                             **_file_stamp(config_filepath)})),
+              "n_groups": np.array([len(profile["frames"]) for profile in profiles], dtype=np.int64)} #noqa
+
+    path = sidecar_path(config_filepath)
+
+    try:
+        for key in group_columns:
+
+            column = [value for profile in profiles for value in profile[key]]
+
+            if key in GROUP_PULSES:
+                arrays[key], arrays[key+"_lengths"] = _pack_pulses(column)
+            elif all(isinstance(value, int) for value in column):
+                arrays[key] = np.asarray(column, dtype=np.int64)
+            else:
+                arrays[key] = np.asarray(column, dtype=str)
+
+    except (ValueError, TypeError, OverflowError) as e:
+        #valid but can't be stored in these dtypes, eg ints too big for int64
+        print(f"Not caching {config_filepath}: {e}")
+        return
+
+    _write_npz(path, arrays)
+
+
+def _write_npz(path: str, arrays: dict[str, np.ndarray]):
+
+    """
+
+    Writes arrays to a temporary file and moves it into place, so a reader
+
+    never sees half a file. Failing to write is not an error.
+
+    """
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".npz", delete=False) as tmp: #noqa
+            np.savez(tmp, **arrays)
+
+        os.replace(tmp.name, path)
+
+    except OSError as e:
+        print(f"Could not write profile cache {path}: {e}")
+
+
+def load_sidecar(config_filepath: str,
+                 group_columns: Iterable[str],
+                 content: bytes | None = None) -> tuple[dict, list[dict]] | None:
+
+    """
+
+    Returns (meta, profiles) as passed to save_sidecar (with the same
+
+    group_columns) if there is an up to date sidecar for config_filepath,
+
+    otherwise None. Every profile has validate=False, they were validated
+
+    before they were saved.
+
+    The sidecar is trusted if the mtime and size of the yaml match, otherwise
+
+    the yaml content (read here if not given) must match the stored sha256
+
+    """
+
+    path = sidecar_path(config_filepath)
+
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with np.load(path, allow_pickle=False) as sidecar:
+
+            header = json.loads(sidecar["header"].item())
+
+            if header["version"] != CACHE_VERSION:
+                return None
+
+            stamp = _file_stamp(config_filepath)
+
+            if (stamp["mtime_ns"], stamp["size"]) != (header["mtime_ns"], header["size"]):
+                if content is None:
+                    with open(config_filepath, "rb") as file:
+                        content = file.read()
+                if file_digest(content) != header["digest"]:
+                    return None
+
+            columns = {}
+            for key in group_columns:
+                if key in GROUP_PULSES:
+                    columns[key] = _unpack_pulses(sidecar[key], sidecar[key+"_lengths"]) #noqa
+                else:
+                    columns[key] = sidecar[key].tolist()
+
+            ends = np.cumsum(sidecar["n_groups"]).tolist()
+
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring unreadable profile cache {path}: {e}")
+        return None
+
+    profiles = [{**fields, **{key: value[start:end] for key, value in columns.items()}, "validate": False} #noqa
+                for fields, start, end in zip(header["profiles"], [0, *ends], ends, strict=False)] #noqa
+
+    return header["meta"], profiles
+
+
+Artifact = dict[str, np.ndarray]
+
+
+def artifact_size(artifact: Artifact) -> int:
+    return sum(np.asarray(value).nbytes for value in artifact.values())
+
+
+class ArtifactCache:
+
+    """
+
+    Size bounded LRU cache of compiled profile artifacts, keyed by
+
+    (content hash, artifact name). If disk_dir is set artifacts are also
+
+    written there and read back when they are no longer in memory.
+
+    Cached arrays are read only, as they are shared between callers.
+
+    """
+
+    def __init__(self, max_bytes: int = 64*2**20, disk_dir: str | None = None):
+
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.n_bytes = 0
+        self._entries: OrderedDict[tuple[str, str], tuple[Artifact, int]] = OrderedDict() #noqa
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: tuple[str, str]):
+        return key in self._entries
+
+    def _path(self, content_hash: str, name: str) -> str:
+        return os.path.join(self.disk_dir, f"{content_hash}-{name}.npz")
+
+    def get(self, content_hash: str, name: str) -> Artifact | None:
+
+        key = (content_hash, name)
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+        if self.disk_dir is None:
+            return None
+
+        try:
+            with np.load(self._path(content_hash, name), allow_pickle=False) as stored:
+                artifact = {k: stored[k] for k in stored.files}
+        except (OSError, ValueError):
+            return None
+
+        self._remember(key, artifact)
+
+        return artifact
+
+    def put(self, content_hash: str, name: str, artifact: Artifact) -> Artifact:
+
+        artifact = {k: np.asarray(v) for k, v in artifact.items()}
+        self._remember((content_hash, name), artifact)
+
+        if self.disk_dir is not None:
+            _write_npz(self._path(content_hash, name), artifact)
+
+        return artifact
+
+    def get_or_build(self, content_hash: str, name: str, build: Callable[[], Artifact]) -> Artifact: #noqa
+
+        artifact = self.get(content_hash, name)
+
+        if artifact is None:
+            artifact = self.put(content_hash, name, build())
+
+        return artifact
+
+    def _remember(self, key: tuple[str, str], artifact: Artifact):
+
+        for value in artifact.values():
+            value.flags.writeable = False
+
+        size = artifact_size(artifact)
+
+        if key in self._entries:
+            self.n_bytes -= self._entries.pop(key)[1]
+
+        #too big to keep, the caller still gets it
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = (artifact, size)
+        self.n_bytes += size
+
+        while self.n_bytes > self.max_bytes:
+            _, (_, dropped) = self._entries.popitem(last=False)
+            self.n_bytes -= dropped
+
+    def clear(self):
+
+        self._entries.clear()
+        self.n_bytes = 0
+
+
+#shared by every profile, set ARTIFACT_CACHE.disk_dir (eg cache_dir("artifacts"))
+#or SAS_BLUESKY_ARTIFACT_DIR to keep artifacts between sessions
+ARTIFACT_CACHE = ArtifactCache(disk_dir=os.environ.get("SAS_BLUESKY_ARTIFACT_DIR"))
@@ -0,0 +1,349 @@
+"""
+
+Feasibility checks for a Profile, run before any hardware is touched
+
+Every group is checked at once from the columns of the profile (to_columns),
+so even a profile with a very large number of groups is checked in
+milliseconds. The result is a ProfileReport with one record per group
+(GROUP_REPORT_DTYPE) holding a flag per failed check, the clock ticks of the
+group, how many sequencer rows it needs and how much spare time it leaves
+the detectors, plus any profile wide problems.
+
+Per group checks
+
+- no_frames: frames must be at least 1
+- negative_time: wait and run times can't be negative
+- units: the time units must be known to ncdcore
+- trigger: the pause trigger must be a SeqTrigger
+- pulse_length: wait and run pulse lists must have n_pulses entries
+- pulse_values: pulses must be 0 or 1
+- deadtime: a group which gates the detectors (any run pulse) must wait at
+  least the largest detector deadtime between exposures
+
+The deadtime is checked against the wait time, not the run time. With
+CONSTANT_GATE triggering (as configure_panda_triggering uses) a detector
+exposes while its gate is high, the run phase, and reads out while it is low,
+the wait phase. return_deadtime gives the readout time needed between
+exposures, so it has to fit in the wait. A short run is a short exposure,
+which the detectors can take, while a run longer than the deadtime says
+nothing about whether the readout has finished before the next frame.
+
+Profile checks
+
+- cycles must be at least 1
+- the compiled SeqTable must fit in the sequencer (max_rows), unless it is
+  run across two sequencers
+
+"""
+
+from collections.abc import Mapping
+from itertools import chain
+
+import numpy as np
+from ophyd_async.fastcs.panda import SeqTrigger
+
+from SAS_bluesky.ProfileGroups import SEQ_TRIGGERS, Profile
+from SAS_bluesky.SeqCompiler import (
+    SEQ_MAX_ROWS,
+    count_rows,
+    prepare_rows,
+    raw_seq_columns,
+    row_counts,
+)
+from SAS_bluesky.utils.ncdcore import CLOCK_FREQUENCY, ncdcore
+
+GROUP_CHECKS = {"no_frames": "frames must be at least 1",
+                "negative_time": "wait and run times can't be negative",
+                "units": "unknown time units",
+                "trigger": "unknown pause trigger",
+                "pulse_length": "wrong number of pulses",
+                "pulse_values": "pulses must be 0 or 1",
+                "deadtime": "wait time is shorter than the detector deadtime"}
+
+GROUP_REPORT_DTYPE = np.dtype([("group", np.int64),
+                               ("frames", np.int64),
+                               ("wait_ticks", np.int64),
+                               ("run_ticks", np.int64),
+                               ("seq_rows", np.int64), #before merging
+                               #wait_ticks - deadtime, if gating
+                               ("slack_ticks", np.int64),
+                               *[(check, np.bool_) for check in GROUP_CHECKS]])
+
+
+def _lookup(values, convert) -> np.ndarray:
+
+    #only convert each distinct value once
+    unique, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+
+    return np.array([convert(u) for u in unique])[inverse.reshape(-1)]
+
+
+def _unit_ns(unit: str) -> int:
+
+    """
+
+    Nanoseconds in unit, 0 if ncdcore doesn't know it
+
+    """
+
+    try:
+        return ncdcore.to_nanoseconds(unit)
+    except KeyError:
+        return 0
+
+
+def deadtime_ticks(deadtime) -> tuple[list[str], np.ndarray]:
+
+    """
+
+    Takes the deadtimes (s) of the detectors, as a dict of name: deadtime,
+
+    an array (as return_deadtime gives) or a single value, and returns the
+
+    detector names and their deadtimes in clock ticks, rounded up
+
+    """
+
+    if deadtime is None:
+        return [], np.zeros(0, dtype=np.int64)
+
+    if isinstance(deadtime, Mapping):
+        names = [str(name) for name in deadtime]
+        seconds = np.asarray(list(deadtime.values()), dtype=float)
+    else:
+        seconds = np.atleast_1d(np.asarray(deadtime, dtype=float))
+        names = [f"detector {n}" for n in range(len(seconds))]
+
+    return names, np.ceil(seconds*CLOCK_FREQUENCY).astype(np.int64)
+
+
+def _pulse_checks(pulses: list,
+                  n_pulses: int | None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+
+    """
+
+    Returns the pulse lists as a (n_groups, n_out) boolean array, and which
+
+    groups have the wrong number of pulses and which have values other than 0/1
+
+    """
+
+    n_groups = len(pulses)
+    lengths = np.fromiter((len(p) for p in pulses), dtype=np.int64, count=n_groups)
+
+    flat = np.fromiter(chain.from_iterable(pulses), dtype=np.int64,
+                       count=int(lengths.sum()))
+    owner = np.repeat(np.arange(n_groups), lengths)
+
+    not_binary = ~np.isin(flat, (0, 1))
+    bad_values = np.bincount(owner, weights=not_binary, minlength=n_groups) > 0
+    if n_pulses is not None:
+        bad_length = lengths != n_pulses
+    else:
+        bad_length = np.zeros(n_groups, dtype=bool)
+
+    #position of every pulse within its own list
+    position = np.arange(len(flat)) - np.repeat(np.cumsum(lengths)-lengths, lengths)
+    matrix = np.zeros((n_groups, int(lengths.max(initial=0))), dtype=bool)
+    matrix[owner, position] = flat != 0
+
+    return matrix, bad_length, bad_values
+
+
+class ProfileReport:
+
+    """
+
+    Result of check_profile. groups is a GROUP_REPORT_DTYPE array,
+
+    errors the profile wide problems
+
+    """
+
+    def __init__(self,
+                 groups: np.ndarray,
+                 errors: list[str],
+                 seq_rows: int,
+                 max_rows: int | None,
+                 detectors: list[str],
+                 detector_deadtime_ticks: np.ndarray):
+
+        self.groups = groups
+        self.errors = errors
+        self.seq_rows = seq_rows
+        self.max_rows = max_rows
+        self.detectors = detectors
+        self.detector_deadtime_ticks = detector_deadtime_ticks
+
+    @property
+    def failed(self) -> np.ndarray:
+
+        """
+
+        Boolean per group, True if any check failed
+
+        """
+
+        failed = np.zeros(len(self.groups), dtype=bool)
+        for check in GROUP_CHECKS:
+            failed |= self.groups[check]
+
+        return failed
+
+    @property
+    def failed_groups(self) -> np.ndarray:
+        return np.flatnonzero(self.failed)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors and not self.failed.any()
+
+    def messages(self, max_groups: int = 10) -> list[str]:
+
+        """
+
+        Human readable problems, at most max_groups groups are listed per check
+
+        """
+
+        messages = list(self.errors)
+
+        for check, text in GROUP_CHECKS.items():
+
+            bad = np.flatnonzero(self.groups[check])
+            if len(bad) == 0:
+                continue
+
+            listed = ", ".join(str(n) for n in bad[:max_groups].tolist())
+            more = f" and {len(bad)-max_groups} more" if len(bad) > max_groups else ""
+
+            if check == "deadtime":
+                wait = self.groups["wait_ticks"][bad]
+                detector_ticks = zip(self.detectors, self.detector_deadtime_ticks,
+                                     strict=True)
+                slow = [name for name, ticks in detector_ticks if (wait < ticks).any()]
+                text = f"{text} of {', '.join(slow)}"
+
+            messages.append(f"Group {listed}{more}: {text}")
+
+        return messages
+
+    def raise_for_errors(self):
+
+        """
+
+        Raises ValueError listing every problem if any check failed
+
+        """
+
+        if not self.ok:
+            raise ValueError("Profile is not feasible:\n" + "\n".join(self.messages()))
+
+    def __repr__(self):
+        return (f"ProfileReport(ok={self.ok}, "
+                f"failed_groups={len(self.failed_groups)}, "
+                f"seq_rows={self.seq_rows})")
+
+
+def check_profile(profile: Profile | dict,
+                  deadtime=None,
+                  n_pulses: int | None = None,
+                  max_rows: int | None = SEQ_MAX_ROWS) -> ProfileReport:
+
+    """
+
+    Checks every group of profile (a Profile, or its to_columns) at once.
+
+    deadtime is the deadtime (s) of each detector, as a dict of
+
+    name: deadtime or the array return_deadtime gives, if None the deadtime
+
+    isn't checked. n_pulses is the number of pulse blocks (PULSEBLOCKS in
+
+    the beamline config), if None the pulse list lengths aren't checked.
+
+    max_rows None allows any number of sequencer rows (SeqDoubleBuffer)
+
+    """
+
+    columns = profile.to_columns() if isinstance(profile, Profile) else profile
+    n_groups = len(columns["frames"])
+
+    report = np.zeros(n_groups, dtype=GROUP_REPORT_DTYPE)
+    report["group"] = np.arange(n_groups)
+
+    frames = np.asarray(columns["frames"], dtype=np.int64).reshape(n_groups)
+    wait_time = np.asarray(columns["wait_time"], dtype=np.int64).reshape(n_groups)
+    run_time = np.asarray(columns["run_time"], dtype=np.int64).reshape(n_groups)
+
+    report["frames"] = frames
+    report["no_frames"] = frames < 1
+    report["negative_time"] = (wait_time < 0) | (run_time < 0)
+
+    wait_ns = _lookup(columns["wait_units"], _unit_ns).astype(np.int64)
+    run_ns = _lookup(columns["run_units"], _unit_ns).astype(np.int64)
+    report["units"] = (wait_ns == 0) | (run_ns == 0)
+
+    trigger_names = list(SEQ_TRIGGERS)
+
+    def trigger_number(name: str) -> int:
+        name = name.upper()
+        return trigger_names.index(name) if name in SEQ_TRIGGERS else -1
+
+    trigger_index = _lookup(columns["pause_trigger"], trigger_number)
+    report["trigger"] = trigger_index < 0
+
+    wait_pulses, bad_wait_length, bad_wait_values = _pulse_checks(
+        columns["wait_pulses"], n_pulses)
+    run_pulses, bad_run_length, bad_run_values = _pulse_checks(
+        columns["run_pulses"], n_pulses)
+    report["pulse_length"] = bad_wait_length | bad_run_length
+    report["pulse_values"] = bad_wait_values | bad_run_values
+
+    #same rounding as ncdcore.to_ticks, groups with unknown units are left at 0
+    report["wait_ticks"] = ncdcore.ns_to_ticks(wait_time*wait_ns)
+    report["run_ticks"] = ncdcore.ns_to_ticks(run_time*run_ns)
+
+    #detectors are gated by the run pulses and read out while the next frame waits
+    detectors, dead_ticks = deadtime_ticks(deadtime)
+    if run_pulses.size:
+        gating = run_pulses.any(axis=1)
+    else:
+        gating = np.zeros(n_groups, dtype=bool)
+
+    if len(dead_ticks):
+        slack = report["wait_ticks"] - dead_ticks.max()
+        report["slack_ticks"] = np.where(gating, slack, 0)
+        report["deadtime"] = gating & (slack < 0) & ~report["units"]
+
+    errors = []
+
+    if int(columns.get("cycles", 1)) < 1:
+        errors.append("Profile cycles must be at least 1")
+
+    #sequencer rows, only meaningful for groups which compile
+    seq_rows = 0
+    compiles = ~(report["units"] | report["trigger"] | report["negative_time"])
+
+    if n_groups:
+        #unknown triggers (index -1) are compiled as IMMEDIATE
+        n_out = max(wait_pulses.shape[1], run_pulses.shape[1])
+        triggers = np.array([*SEQ_TRIGGERS.values(), SeqTrigger.IMMEDIATE],
+                            dtype=object)
+        seq_columns = raw_seq_columns(
+            frames=np.maximum(frames, 0),
+            triggers=triggers[trigger_index],
+            wait_ticks=np.maximum(report["wait_ticks"], 0),
+            run_ticks=np.maximum(report["run_ticks"], 0),
+            wait_pulses=np.pad(wait_pulses, ((0, 0), (0, n_out-wait_pulses.shape[1]))),
+            run_pulses=np.pad(run_pulses, ((0, 0), (0, n_out-run_pulses.shape[1]))))
+
+        report["seq_rows"] = np.where(compiles, row_counts(seq_columns), 0)
+
+        if compiles.all():
+            seq_rows = count_rows(prepare_rows(seq_columns))
+            if max_rows is not None and seq_rows > max_rows:
+                errors.append(f"Profile needs {seq_rows} sequencer rows, "
+                              f"the sequencer table only holds {max_rows}")
+
+    return ProfileReport(report, errors, seq_rows, max_rows, detectors, dead_ticks)
@@ -0,0 +1,206 @@
+"""
+
+Frame time sequences for building profiles programmatically
+
+Time resolved experiments often want many frames whose exposure changes
+from frame to frame, eg ms frames straight after a stopped flow mix slowing
+to seconds. The functions here give run (exposure) times per frame in
+seconds, and frames_to_columns turns per frame wait and run times into the
+group columns of Profile.from_columns:
+
+- times are quantised to the sequencer resolution (whole us, the SeqTable
+  time1/time2 unit), so what is stored is exactly what the PandA runs
+- consecutive frames with the same quantised wait and run times become one
+  group with frames > 1
+- each group's times are written in the largest PandA time unit that holds
+  them exactly (MIN, S, MS or US)
+
+Profile.linear, Profile.geometric, Profile.piecewise and Profile.from_callback
+wrap these.
+
+"""
+
+from collections.abc import Callable, Sequence
+
+import numpy as np
+
+#PandaTimeUnits, largest first, in us
+TIME_UNITS_US = {"MIN": 60_000_000, "S": 1_000_000, "MS": 1_000, "US": 1}
+
+
+def linear_times(n_frames: int, start: float, stop: float) -> np.ndarray:
+
+    """
+
+    n_frames times (s) evenly spaced from start to stop
+
+    """
+
+    return np.linspace(start, stop, n_frames)
+
+
+def geometric_times(n_frames: int, start: float, stop: float) -> np.ndarray:
+
+    """
+
+    n_frames times (s) from start to stop, each a constant factor longer
+
+    than the last (logarithmic spacing)
+
+    """
+
+    if start <= 0 or stop <= 0:
+        raise ValueError("Geometric times must start and stop above 0")
+
+    return np.geomspace(start, stop, n_frames)
+
+
+def callback_times(callback: Callable, n_frames: int) -> tuple[np.ndarray, np.ndarray | None]: #noqa
+
+    """
+
+    Calls callback with the array of frame numbers 0..n_frames-1, it returns
+
+    the run times (s) of every frame, or a tuple of (run times, wait times).
+
+    Numpy expressions work as they are eg lambda n: 1e-3*2**(n//100)
+
+    """
+
+    frame_numbers = np.arange(n_frames)
+    times = callback(frame_numbers)
+
+    if isinstance(times, tuple):
+        run_times, wait_times = times
+    else:
+        run_times, wait_times = times, None
+
+    run_times = np.broadcast_to(np.asarray(run_times, dtype=float), (n_frames,))
+
+    if wait_times is not None:
+        wait_times = np.broadcast_to(np.asarray(wait_times, dtype=float), (n_frames,))
+
+    return run_times, wait_times
+
+
+def piecewise_times(segments: Sequence[tuple]) -> tuple[np.ndarray, np.ndarray]:
+
+    """
+
+    Joins segments of (run times, wait time) one after the other, the run
+
+    times are an array (eg from linear_times) and the wait time one value or
+
+    one per frame. Returns the run and wait times (s) of every frame
+
+    """
+
+    run_times = []
+    wait_times = []
+
+    for run, wait in segments:
+        run = np.atleast_1d(np.asarray(run, dtype=float))
+        run_times.append(run)
+        wait_times.append(np.broadcast_to(np.asarray(wait, dtype=float), run.shape))
+
+    if not run_times:
+        return np.zeros(0), np.zeros(0)
+
+    return np.concatenate(run_times), np.concatenate(wait_times)
+
+
+def quantise_us(seconds, resolution_us: int = 1) -> np.ndarray:
+
+    """
+
+    Rounds times (s) to the nearest multiple of resolution_us microseconds,
+
+    returning whole microseconds as int64
+
+    """
+
+    seconds = np.asarray(seconds, dtype=float)
+
+    if np.any(~np.isfinite(seconds)) or np.any(seconds < 0):
+        raise ValueError("Frame times must be finite and not negative")
+
+    return np.rint(seconds*1e6/resolution_us).astype(np.int64)*resolution_us
+
+
+def exact_units(times_us: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+
+    """
+
+    Writes each time (us) in the largest unit of TIME_UNITS_US that holds
+
+    it exactly, returns (times, units)
+
+    """
+
+    times_us = np.asarray(times_us, dtype=np.int64)
+    times = times_us.copy()
+    units = np.full(times_us.shape, "US", dtype="U3")
+    chosen = np.zeros(times_us.shape, dtype=bool)
+
+    for unit, unit_us in TIME_UNITS_US.items():
+        fits = ~chosen & (times_us % unit_us == 0) & (times_us > 0)
+        times[fits] = times_us[fits] // unit_us
+        units[fits] = unit
+        chosen |= fits
+
+    return times, units
+
+
+def frames_to_columns(run_times,
+                      wait_times,
+                      pause_trigger: str = "IMMEDIATE",
+                      wait_pulses: list[int] | None = None,
+                      run_pulses: list[int] | None = None,
+                      resolution_us: int = 1) -> dict:
+
+    """
+
+    Turns per frame run and wait times (s, wait_times may be a single value)
+
+    into group columns for Profile.from_columns, with equal consecutive
+
+    frames merged into one group. pause_trigger is waited on before the
+
+    first frame only, every other group is IMMEDIATE. The pulses default to
+
+    wait_pulses=[0, 0, 0, 0], run_pulses=[1, 1, 1, 1]
+
+    """
+
+    run_us = quantise_us(run_times, resolution_us).reshape(-1)
+    wait_us = np.broadcast_to(quantise_us(wait_times, resolution_us), run_us.shape)
+
+    if len(run_us) == 0:
+        raise ValueError("A profile needs at least one frame")
+
+    #a new group starts wherever the wait or run time changes
+    starts = np.flatnonzero(np.r_[True, (run_us[1:] != run_us[:-1]) | (wait_us[1:] != wait_us[:-1])]) #noqa
+    frames = np.diff(np.r_[starts, len(run_us)])
+
+    wait_time, wait_units = exact_units(wait_us[starts])
+    run_time, run_units = exact_units(run_us[starts])
+
+    #the trigger has to stay on a group of its own, or every frame of a merged
+    #group would wait for it
+    if pause_trigger.upper() not in ("IMMEDIATE", "", "FALSE") and frames[0] > 1:
+        frames = np.r_[1, frames[0]-1, frames[1:]]
+        rows = np.r_[0, np.arange(len(wait_time))]
+        wait_time, wait_units = wait_time[rows], wait_units[rows]
+        run_time, run_units = run_time[rows], run_units[rows]
+
+    triggers = ["IMMEDIATE"]*len(frames)
+    triggers[0] = pause_trigger
+
+    return {"frames": frames.tolist(),
+            "wait_time": wait_time.tolist(),
+            "wait_units": wait_units.tolist(),
+            "run_time": run_time.tolist(),
+            "run_units": run_units.tolist(),
+            "pause_trigger": triggers,
+            "wait_pulses": [0, 0, 0, 0] if wait_pulses is None else list(wait_pulses),
+            "run_pulses": [1, 1, 1, 1] if run_pulses is None else list(run_pulses)}
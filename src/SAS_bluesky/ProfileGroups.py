@@ -1,27 +1,52 @@
 import os #noqa
+import hashlib
+import json
+import stat
+import tempfile
 # import copy
 import yaml
 from datetime import datetime
 import numpy as np
-import matplotlib.pyplot as plt
 
 from ophyd_async.fastcs.panda import (
     SeqTable,
     SeqTrigger)
 
-from ophyd_async.core import in_micros #DetectorTrigger, TriggerInfo, wait_for_value,
+# from ophyd_async.core import DetectorTrigger, TriggerInfo, wait_for_value,
 # from ophyd_async.plan_stubs import store_settings
 
 # import bluesky.plan_stubs as bps
 # from bluesky import RunEngine
 # from dodal.beamlines.i22 import panda1
 
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator, MutableSequence
 from typing import Any
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, PrivateAttr, ValidationError
 from pydantic_core import from_json
 from pydantic.dataclasses import dataclass
-from SAS_bluesky.utils.ncdcore import ncdcore
+from SAS_bluesky.utils.ncdcore import CLOCK_FREQUENCY, ncdcore
+from SAS_bluesky.SeqCompiler import (SEQ_MAX_ROWS,
+                                     compile_seq_chunks,
+                                     compile_seq_table,
+                                     raw_seq_columns)
+from SAS_bluesky.ProfileCache import (ARTIFACT_CACHE,
+                                      GROUP_PULSES,
+                                      file_digest,
+                                      load_sidecar,
+                                      save_sidecar)
+from SAS_bluesky.ProfilePlot import TriggerPlot
+from SAS_bluesky.ProfileGenerators import (callback_times,
+                                          frames_to_columns,
+                                          geometric_times,
+                                          linear_times,
+                                          piecewise_times)
+from SAS_bluesky.ProfileTimeline import (CompactTimeline,
+                                         TriggerTimeline,
+                                         build_trigger_timeline,
+                                         pulse_matrix,
+                                         step_signal)
 
 
 """
@@ -46,10 +71,68 @@ Group and Profile BaseModels
 """
 
 
+#libyaml's loader and dumper if pyyaml was built with it
+YAML_LOADER = getattr(yaml, "CFullLoader", yaml.FullLoader)
+YAML_DUMPER = getattr(yaml, "CDumper", yaml.Dumper)
+
 time_units = {"ns": 1e-9, "nsec": 1e-9, "usec": 1e-6, "ms": 1e-3, "msec": 1e-3,
     "s": 1, "sec": 1, "min": 60, "m": 60, "hour": 60*60, "h": 60*60 }
 
 
+def best_time_unit(trigger_time: np.ndarray) -> str:
+
+    """
+
+    Returns the key of time_units closest to the first non zero trigger time,
+
+    used to choose the units when plotting
+
+    """
+
+    trigger_time = np.asarray(trigger_time)
+    trigger_time = trigger_time[trigger_time > 0]
+
+    if len(trigger_time) == 0:
+        return "s"
+
+    close_list = [np.abs(1-np.log10(np.amin(trigger_time)/time_units[i])) for i in time_units.keys()] #noqa
+
+    return list(time_units)[np.argmin(close_list)]
+
+
+SEQ_TRIGGERS = {trigger.name: trigger for trigger in SeqTrigger}
+SEQ_TRIGGERS.update({"": SeqTrigger.IMMEDIATE, "FALSE": SeqTrigger.IMMEDIATE})
+
+def seq_table_columns(groups: list["Group"]) -> dict:
+
+    """
+
+    Builds every column of a SeqTable for a list of groups at once,
+
+    one row per group. repeats and times are int64 so that values which
+
+    overflow the sequencer can be split by SeqCompiler.compile_seq_table.
+
+    The times come from wait_time/run_time and their units, not the derived
+
+    fields, so a group edited in place compiles with its new times
+
+    """
+
+    n_groups = len(groups)
+    pulses = pulse_matrix([g.wait_pulses for g in groups] + [g.run_pulses for g in groups]) #noqa
+
+    return raw_seq_columns(
+        frames=np.fromiter((g.frames for g in groups), dtype=np.int64, count=n_groups),
+        triggers=[SEQ_TRIGGERS[g.pause_trigger.upper()] for g in groups],
+        wait_ticks=ncdcore.to_ticks_array([g.wait_time for g in groups],
+                                          [g.wait_units for g in groups]),
+        run_ticks=ncdcore.to_ticks_array([g.run_time for g in groups],
+                                         [g.run_units for g in groups]),
+        wait_pulses=pulses[:n_groups],
+        run_pulses=pulses[n_groups:])
+
+
 class Group(BaseModel):
 
     frames: int
@@ -65,6 +148,10 @@ class Group(BaseModel):
     wait_time_s: float = None
     run_time_s: float = None
     group_duration: float = None
+    #PandA clock ticks, times above are derived from these
+    wait_ticks: int = None
+    run_ticks: int = None
+    group_ticks: int = None
 
 
     def model_post_init(self, __context: Any) -> None:
@@ -75,35 +162,48 @@ class Group(BaseModel):
         self.recalc_times()
 
     def recalc_times(self):
-        self.wait_time_s = self.wait_time*ncdcore.to_seconds(self.wait_units)
-        self.run_time_s = self.run_time*ncdcore.to_seconds(self.run_units)
-        self.group_duration = (self.wait_time_s+self.run_time_s)*self.frames
+        self.wait_ticks = ncdcore.to_ticks(self.wait_time, self.wait_units)
+        self.run_ticks = ncdcore.to_ticks(self.run_time, self.run_units)
+        self.group_ticks = (self.wait_ticks+self.run_ticks)*self.frames
 
+        self.wait_time_s = self.wait_ticks/CLOCK_FREQUENCY
+        self.run_time_s = self.run_ticks/CLOCK_FREQUENCY
+        self.group_duration = self.group_ticks/CLOCK_FREQUENCY
+
+
+    def content_hash(self) -> str:
+
+        """
+
+        sha256 of the user set fields, the derived fields are ignored
+
+        """
+
+        fields = [getattr(self, name) for name in GROUP_INPUTS]
+
+        return hashlib.sha256(json.dumps(fields, separators=(",", ":")).encode()).hexdigest() #noqa
 
     def seq_row(self):
 
         self.recalc_times()
 
-        if not self.pause_trigger:
-            trigger = SeqTrigger.IMMEDIATE
-        elif self.pause_trigger == "FALSE":
-            trigger = SeqTrigger.IMMEDIATE
+        trigger = SEQ_TRIGGERS[self.pause_trigger]
+
+        if self.pause_trigger == "FALSE":
             self.pause_trigger = "IMMEDIATE"
-        else:
-            trigger = eval(f"SeqTrigger.{self.pause_trigger}")
 
         seq_row  = SeqTable.row(
             repeats = self.frames,
             trigger = trigger,
             position = 0,
-            time1 = in_micros(self.wait_time_s),
+            time1 = ncdcore.ticks_to_micros(self.wait_ticks),
             outa1 = self.wait_pulses[0],
             outb1 = self.wait_pulses[1],
             outc1 = self.wait_pulses[2],
             outd1 = self.wait_pulses[3],
             # oute1 = self.wait_pulses[4],
             # outf1 = self.wait_pulses[5],
-            time2 = in_micros(self.run_time_s),
+            time2 = ncdcore.ticks_to_micros(self.run_ticks),
             outa2 = self.run_pulses[0],
             outb2 = self.run_pulses[1],
             outc2 = self.run_pulses[2],
@@ -116,6 +216,108 @@ class Group(BaseModel):
 
 
 
+class GroupColumns(BaseModel):
+
+    """
+
+    The user set fields of Group as columns, one entry per group.
+
+    Validating this once checks every group, errors are located by
+
+    (field, group number)
+
+    """
+
+    frames: list[int]
+    wait_time: list[int]
+    wait_units: list[str]
+    run_time: list[int]
+    run_units: list[str]
+    pause_trigger: list[str]
+    wait_pulses: list[list[int]]
+    run_pulses: list[list[int]]
+
+
+GROUP_INPUTS = tuple(GroupColumns.model_fields)
+PROFILE_INPUTS = ("cycles", "seq_trigger", "multiplier")
+
+#Profile.to_wire/from_wire
+WIRE_SCHEMA = "SAS_bluesky.Profile"
+WIRE_VERSION = 1
+WIRE_CACHE_SIZE = 8
+#sha256 of the payload: validated columns (to_columns) with pulses as tuples
+_WIRE_CACHE: OrderedDict[str, dict] = OrderedDict()
+GROUP_FIELDS = tuple(Group.model_fields)
+
+
+def records_to_columns(records: list[dict]) -> dict | None:
+
+    """
+
+    Transposes group dicts into GroupColumns style columns,
+
+    None if any record is missing a field
+
+    """
+
+    if not all(set(GROUP_INPUTS) <= record.keys() for record in records):
+        return None
+
+    return {name: [record[name] for record in records] for name in GROUP_INPUTS}
+
+
+def validate_section(section: dict) -> dict:
+
+    """
+
+    Validates a profile section (the kwargs of Profile.from_columns, one list
+
+    per group field) as from_columns would, returning the validated values.
+
+    Raises ValidationError
+
+    """
+
+    columns = GroupColumns.model_validate({name: section[name] for name in GROUP_INPUTS}) #noqa
+    fields = Profile.model_validate({name: section[name] for name in PROFILE_INPUTS})
+
+    return {**columns.model_dump(), **fields.model_dump(include=set(PROFILE_INPUTS))}
+
+
+def _upper_column(values: list[str]) -> list[str]:
+
+    #lookup table so each distinct string is only converted once
+    lookup = {value: value.upper() for value in set(values)}
+
+    return [lookup[value] for value in values]
+
+
+def _construct_groups(rows) -> list[Group]:
+
+    """
+
+    Group.model_construct without model_post_init for many groups,
+
+    every row holds the values of GROUP_FIELDS including the derived ones
+
+    """
+
+    new = Group.__new__
+    setattr_ = object.__setattr__
+    fields_set = set(GROUP_FIELDS)
+    groups = []
+
+    for row in rows:
+        group = new(Group)
+        setattr_(group, "__dict__", dict(zip(GROUP_FIELDS, row, strict=True)))
+        setattr_(group, "__pydantic_fields_set__", fields_set.copy())
+        setattr_(group, "__pydantic_extra__", None)
+        setattr_(group, "__pydantic_private__", None)
+        groups.append(group)
+
+    return groups
+
+
 class Profile(BaseModel):
 
     cycles: int = 1
@@ -125,6 +327,14 @@ class Profile(BaseModel):
 
     total_frames: int = 0
     duration_per_cycle: float = 0
+    ticks_per_cycle: int = 0
+
+    #prefix sums of frames and durations, index n is the start of group n
+    _frame_prefix: list[int] = PrivateAttr(default_factory=lambda: [0])
+    _ticks_prefix: list[int] = PrivateAttr(default_factory=lambda: [0])
+    #number of groups using each output, an output is active if non zero
+    _out_counts: list[int] = PrivateAttr(default_factory=list)
+    _n_indexed: int = PrivateAttr(default=0)
 
     def model_post_init(self, __context: Any):
 
@@ -132,6 +342,15 @@ class Profile(BaseModel):
 
             self.analyse_profile()
 
+    def __eq__(self, other):
+
+        #the private indexes are caches and are rebuilt lazily,
+        #so two profiles with the same fields are equal whatever their state
+        if not isinstance(other, Profile):
+            return NotImplemented
+
+        return self.__dict__ == other.__dict__
+
     # def re_group_id_groups(self):
 
     #     iter_group = copy.deepcopy(self.groups)
@@ -147,9 +366,27 @@ class Profile(BaseModel):
 
     def analyse_profile(self):
 
-        self.calc_total_frames()
-        self.calc_duration_per_cycle()
+        """
+
+        Rescans every group, rebuilding total_frames, duration_per_cycle
+
+        and the prefix sum and active output indexes
+
+        """
 
+        self._frame_prefix = [0]
+        self._ticks_prefix = [0]
+        self._out_counts = []
+
+        for group in self.groups:
+            self._count_outputs(group, 1)
+
+        self._n_indexed = len(self.groups)
+        self._extend_prefix()
+
+        self.total_frames = self._frame_prefix[-1]
+        self.ticks_per_cycle = self._ticks_prefix[-1]
+        self.duration_per_cycle = self.ticks_per_cycle/CLOCK_FREQUENCY
 
 
     def calc_total_frames(self):
@@ -161,26 +398,125 @@ class Profile(BaseModel):
 
     def calc_duration_per_cycle(self):
 
-        self.duration_per_cycle = 0
+        self.ticks_per_cycle = 0
 
         for n_group in self.groups:
-            self.duration_per_cycle+=n_group.group_duration
+            self.ticks_per_cycle+=n_group.group_ticks
+
+        self.duration_per_cycle = self.ticks_per_cycle/CLOCK_FREQUENCY
         return self.duration_per_cycle
 
+    def _count_outputs(self, group: Group, sign: int):
+
+        pulses = [w or r for w, r in zip(group.wait_pulses, group.run_pulses, strict=False)] #noqa
+        out_counts = self._out_counts
+
+        if len(pulses) > len(out_counts):
+            out_counts.extend([0]*(len(pulses)-len(out_counts)))
+
+        for n, pulse in enumerate(pulses):
+            if pulse:
+                out_counts[n] += sign
+
+    def _extend_prefix(self):
+
+        """
+
+        The prefix sums are only valid up to the first edited group,
+
+        this extends them to cover every group
+
+        """
+
+        for group in self.groups[len(self._frame_prefix)-1:]:
+            self._frame_prefix.append(self._frame_prefix[-1]+group.frames)
+            self._ticks_prefix.append(self._ticks_prefix[-1]+group.group_ticks)
+
+    def _check_index(self):
+
+        #groups has been changed without append/insert/delete_group
+        if self._n_indexed != len(self.groups):
+            self.analyse_profile()
+
+    def _edit_index(self, id: int, group: Group, sign: int, analyse_profile=True):
+
+        """
+
+        Updates the totals and active outputs for one added (sign=1)
+
+        or removed (sign=-1) group at position id
+
+        """
+
+        if not analyse_profile:
+            #rebuilt on next use
+            self._n_indexed = -1
+            return
+        elif self._n_indexed+sign != len(self.groups):
+            self.analyse_profile()
+            return
+
+        self._n_indexed += sign
+        self._count_outputs(group, sign)
+        self.total_frames += sign*group.frames
+        self.ticks_per_cycle += sign*group.group_ticks
+        self.duration_per_cycle = self.ticks_per_cycle/CLOCK_FREQUENCY
+
+        #everything after the edited group needs new prefix sums
+        del self._frame_prefix[id+1:]
+        del self._ticks_prefix[id+1:]
+
+    def group_start_ticks(self) -> np.ndarray:
+
+        """
+
+        Returns the start of each group within a cycle in PandA clock ticks
+
+        """
+
+        self._check_index()
+        self._extend_prefix()
+
+        return np.asarray(self._ticks_prefix[:-1], dtype=np.int64)
+
+    def group_start_times(self) -> np.ndarray:
+
+        """
+
+        Returns the start time (s) of each group within a cycle
+
+        """
+
+        return self.group_start_ticks()/CLOCK_FREQUENCY
+
+    def group_frame_offsets(self) -> np.ndarray:
+
+        """
+
+        Returns the number of frames before each group within a cycle
+
+        """
+
+        self._check_index()
+        self._extend_prefix()
+
+        return np.asarray(self._frame_prefix[:-1], dtype=np.int64)
+
+    @property
+    def duration_ticks(self) -> int:
+        return self.ticks_per_cycle*self.cycles
+
     @property
     def duration(self):
-        duration = self.duration_per_cycle*self.cycles
+        duration = self.duration_ticks/CLOCK_FREQUENCY
         return duration
 
     @property
     def active_out(self):
 
-        wait_matrix = np.array([g.wait_pulses for g in self.groups])
-        run_matrix = np.array([g.run_pulses for g in self.groups])
-        active_matrix = wait_matrix+run_matrix
-        active_out = np.where((np.sum(active_matrix,axis=0)) != 0)[0]
+        self._check_index()
 
-        return active_out
+        return np.flatnonzero(np.asarray(self._out_counts, dtype=np.int64) > 0)
 
 
     def analyse_profile_legacy(self):
@@ -207,8 +543,7 @@ class Profile(BaseModel):
         self.n_groups = len(self.groups)
         self.veto_trigger_time, self.veto_signal, self.active_out = self.build_veto_signal() #noqa
 
-        close_list = [np.abs(1-np.log10(np.amin(np.asarray(self.veto_trigger_time[self.veto_trigger_time!=0])/time_units[i]))) for i in time_units.keys()] #noqa
-        self.best_time_unit = list(time_units)[np.argmin(close_list)]
+        self.best_time_unit = best_time_unit(self.veto_trigger_time)
 
 
     def append_group(self, Group, analyse_profile=True):
@@ -216,142 +551,135 @@ class Profile(BaseModel):
         self.groups.append(Group)
         # self.re_group_id_groups()
 
-        if analyse_profile:
-            self.analyse_profile()
+        self._edit_index(len(self.groups)-1, Group, 1, analyse_profile)
 
 
     def delete_group(self, id, analyse_profile=True):
 
-        self.groups.pop(id)
+        id = id if id >= 0 else len(self.groups)+id
+        group = self.groups.pop(id)
         # self.re_group_id_groups()
 
-        if analyse_profile:
-            self.analyse_profile()
+        self._edit_index(id, group, -1, analyse_profile)
 
     def insert_group(self, id, Group, analyse_profile=True):
 
+        id = min(id if id >= 0 else max(len(self.groups)+id, 0), len(self.groups))
         self.groups.insert(id, Group)
         # self.re_group_id_groups()
-        if analyse_profile:
-            self.analyse_profile()
 
+        self._edit_index(id, Group, 1, analyse_profile)
 
-    def build_veto_signal(self):
 
-        trigger_time = [0]
-        veto_signal = [0] #starts low and ends low
-        current_time = 0
+    def build_trigger_timeline(self, include_cycles=True) -> TriggerTimeline:
 
-        profile_wait_matrix = self.wait_matrix
-        profile_run_matrix = self.run_matrix
+        """
 
-        active_matrix = profile_wait_matrix+profile_run_matrix
-        active_out = np.where((np.sum(active_matrix,axis=0)) != 0)[0]
+        Builds the edge times and the states of the veto and every active output
 
-        # active_wait_matrix = profile_wait_matrix[:,active_out]
-        # active_run_matrix = profile_run_matrix[:,active_out]
+        for the whole profile (all cycles) as arrays, see ProfileTimeline
 
+        """
 
-        for g in range(self.n_groups):
-            group = self.groups[g]
-            veto_active = np.sum(profile_run_matrix[g,:])
+        def build():
+            #edge_times are derived from edge_ticks, no need to keep both
+            timeline = build_trigger_timeline(self, include_cycles=include_cycles)._asdict() #noqa
+            del timeline["edge_times"]
+            return timeline
 
-            for f in range(group.frames): #noqa
+        name = "timeline" if include_cycles else "timeline-cycle"
+        timeline = ARTIFACT_CACHE.get_or_build(self.content_hash(), name, build)
 
-                ###wait phase
+        return TriggerTimeline(edge_times=timeline["edge_ticks"]/CLOCK_FREQUENCY, **timeline) #noqa
 
-                current_time += group.wait_time*ncdcore.to_seconds(group.wait_units)
-                trigger_time.append(current_time)
-                veto_signal.append(0)
 
-                #run phase
+    def compact_timeline(self) -> CompactTimeline:
 
-                current_time += group.run_time*ncdcore.to_seconds(group.run_units)
-                trigger_time.append(current_time)
+        """
 
-                if veto_active != 0:
-                    veto_signal.append(1)
-                else:
-                    veto_signal.append(0)
+        Returns a run length encoded timeline of the profile (one record per group)
 
+        which answers "what is happening at time t" without expanding the frames
 
-        trigger_time.append(current_time+(current_time)/10)
-        veto_signal.append(0)  #starts low and ends low
+        """
 
-        self.trigger_time = np.asarray(trigger_time)
-        self.veto_signal = np.asarray(veto_signal)
-        self.active_out = active_out
+        return CompactTimeline.from_profile(self)
 
-        return np.asarray(trigger_time), np.asarray(veto_signal), active_out
+    def frame_index(self) -> np.ndarray:
 
-    def build_usr_signal(self,usr):
+        """
 
-        trigger_time = [-1*time_units[self.best_time_unit]]
-        usr_signal = [0] #starts low and ends low
+        Planned timing of every frame of every cycle, one
 
-        trigger_time.append(0)
-        usr_signal.append(0) #starts low and ends low
-        current_time = 0
+        ProfileTimeline.FRAME_INDEX_DTYPE record per frame (frame, cycle,
 
-        for g in range(self.n_groups):
-            group = self.groups[g]
+        group, frame_in_group, start/run_start/end ticks and output masks)
 
-            usr_run_active = group.run_pulses[usr]
-            usr_wait_active = group.wait_pulses[usr]
-            usr_active = usr_run_active+usr_wait_active
+        """
 
-            for f in range(group.frames): #noqa
+        return self.compact_timeline().frame_index()
 
-                ###wait phase
+    def write_frame_index(self, path: str, chunk_frames: int = 2**20) -> str:
 
-                current_time += group.wait_time*ncdcore.to_seconds(group.wait_units)
-                trigger_time.append(current_time)
+        """
 
-                if (usr_active!=0):
-                    usr_signal.append(1)
-                else:
-                    usr_signal.append(0)
+        Writes frame_index to a memory mappable .npy or a .npz at path
 
-                #run phase
+        without holding every frame in memory (.npy), see
 
-                current_time += group.run_time*ncdcore.to_seconds(group.run_units)
-                trigger_time.append(current_time)
+        CompactTimeline.write_frame_index
 
-                if usr_run_active != 0:
-                    usr_signal.append(1)
-                else:
-                    usr_signal.append(0)
+        """
+
+        return self.compact_timeline().write_frame_index(path, chunk_frames)
 
-        trigger_time.append(current_time+(current_time)/10)
-        usr_signal.append(0)  #starts low and ends low
 
-        self.trigger_time = np.asarray(trigger_time)
-        self.usr_signal = np.asarray(usr_signal)
+    def build_veto_signal(self):
 
-        return np.asarray(trigger_time), np.asarray(usr_signal)
+        timeline = self.build_trigger_timeline()
+        trigger_time, veto_signal = step_signal(timeline.edge_times, timeline.veto)
 
+        return trigger_time, veto_signal, timeline.active_out
 
-    def plot_triggering(self,blocking=True):
+    def build_usr_signal(self,usr):
 
+        timeline = self.build_trigger_timeline()
+        usr_states = timeline.outputs[np.flatnonzero(timeline.active_out == usr)]
 
-        self.veto_trigger_time, self.veto_signal, self.active_out = self.build_veto_signal() #noqa
+        if len(usr_states) == 0:
+            usr_states = np.zeros(len(timeline.veto), dtype=bool)
+        else:
+            usr_states = usr_states[0]
+
+        return step_signal(timeline.edge_times, usr_states)
+
+
+    def plot_triggering(self,blocking=True,max_bins=2000):
+
+        """
+
+        Plots the veto and every active usr output. Only the visible window
+
+        is drawn, as a min/max envelope of max_bins bins when it holds more
+
+        phases than that, so long profiles stay interactive (see ProfilePlot)
+
+        """
 
-        print("plotting in:", self.best_time_unit)
+        timeline = self.compact_timeline()
+        active_out = timeline.active_out
 
-        figure, axes = plt.subplots(len(self.active_out)+1, 1,sharex=True,figsize=(10,len(self.active_out)*4)) #noqa
+        phase_ticks = np.concatenate([timeline.wait_ticks, timeline.run_ticks])
+        unit = best_time_unit(phase_ticks/CLOCK_FREQUENCY)
 
-        if len(self.active_out) > 0:
+        print("plotting in:", unit)
 
-            axes[0].step(self.veto_trigger_time/time_units[self.best_time_unit],self.veto_signal)
-            axes[0].set_ylabel("Veto Signal")
+        if len(active_out) > 0:
 
-            for u in range(len(self.active_out)):
-                usr_trigger_time, usr_signal = self.build_usr_signal(u)
-                axes[u+1].step(usr_trigger_time/time_units[self.best_time_unit],usr_signal)
-                axes[u+1].set_ylabel(f"Usr{u} Signal")
+            plot = TriggerPlot(timeline, unit=unit, scale=time_units[unit], max_bins=max_bins) #noqa
+            plot.show(blocking=blocking)
 
-            plt.xlabel(f"Time ({self.best_time_unit})")
-            plt.show(block=blocking)
+            return plot
 
         else:
 
@@ -359,11 +687,385 @@ class Profile(BaseModel):
 
     def seq_table(self):
 
-        table = SeqTable()
+        """
+
+        Builds the SeqTable for the profile in one allocation, compiled by
+
+        SeqCompiler so equivalent groups are merged and anything which would
+
+        overflow the sequencer is split. Raises ValueError if the profile
+
+        doesn't fit in the sequencer table.
+
+        The compiled columns are kept in ARTIFACT_CACHE under content_hash,
+
+        so they are only compiled again once the profile has been edited
+
+        """
+
+        def build():
+            columns = compile_seq_table(seq_table_columns(self.groups))
+            columns["trigger"] = np.array([t.name for t in columns["trigger"]], dtype=str) #noqa
+            return columns
+
+        columns = ARTIFACT_CACHE.get_or_build(self.content_hash(), "seq_table", build)
+
+        return SeqTable(**(columns | {"trigger": [SeqTrigger[t] for t in columns["trigger"].tolist()]})) #noqa
+
+    def seq_chunks(self, max_rows: int = SEQ_MAX_ROWS) -> list[SeqTable]:
+
+        """
+
+        The SeqTable of the profile cut into tables of less than max_rows
+
+        rows, for profiles too long for one sequencer (SeqDoubleBuffer)
+
+        """
+
+        return [SeqTable(**chunk)
+                for chunk in compile_seq_chunks(seq_table_columns(self.groups), max_rows=max_rows)] #noqa
+
+    def trigger_events(self) -> np.ndarray:
+
+        """
+
+        Number of frames of every group, repeated for every cycle,
+
+        the number_of_events of the detectors TriggerInfo
+
+        """
+
+        def build():
+            frames = np.fromiter((g.frames for g in self.groups), dtype=np.int64, count=len(self.groups)) #noqa
+            return {"events": np.tile(frames, self.cycles)}
+
+        return ARTIFACT_CACHE.get_or_build(self.content_hash(), "trigger_events", build)["events"] #noqa
+
+    def content_hash(self) -> str:
+
+        """
+
+        sha256 of the fields set by the user (not the derived ones),
+
+        equal profiles have the same hash in every process. Used as the key
+
+        of ProfileCache.ARTIFACT_CACHE
+
+        """
+
+        columns = self.to_columns()
+
+        return hashlib.sha256(json.dumps(columns, sort_keys=True, separators=(",", ":")).encode()).hexdigest() #noqa
+
+    @classmethod
+    def from_columns(cls,
+                     frames,
+                     wait_time,
+                     wait_units,
+                     run_time,
+                     run_units,
+                     pause_trigger,
+                     wait_pulses,
+                     run_pulses,
+                     cycles: int = 1,
+                     seq_trigger: str = "IMMEDIATE",
+                     multiplier: list[int] | None = None,
+                     validate: bool = True) -> "Profile":
+
+        """
 
-        [table := table + group.seq_row() for group in self.groups]
+        Builds a Profile from columns of group fields (lists or arrays, one
 
-        return table
+        entry per group) in one pass, instead of validating every Group.
+
+        Single values and a single pulse list are used for every group.
+
+        Gives the same Profile and raises the same errors as building each
+
+        Group and passing them to Profile. validate=False skips validation
+
+        for columns which are already known to be good (eg from to_columns)
+
+        """
+
+        columns = {"frames": frames,
+                   "wait_time": wait_time,
+                   "wait_units": wait_units,
+                   "run_time": run_time,
+                   "run_units": run_units,
+                   "pause_trigger": pause_trigger,
+                   "wait_pulses": wait_pulses,
+                   "run_pulses": run_pulses}
+
+        def is_column(name, value):
+            if isinstance(value, np.ndarray):
+                return value.ndim == (2 if name.endswith("pulses") else 1)
+            if isinstance(value, str) or not hasattr(value, "__len__"):
+                return False
+            if name.endswith("pulses"):
+                return len(value) > 0 and hasattr(value[0], "__len__")
+            return True
+
+        n_groups = max((len(v) for k, v in columns.items() if is_column(k, v)), default=1) #noqa
+
+        for name, value in columns.items():
+            if isinstance(value, np.ndarray):
+                value = value.tolist()
+            columns[name] = list(value) if is_column(name, value) else [value]*n_groups
+
+        if validate:
+            columns = GroupColumns.model_validate(columns)
+        else:
+            columns = GroupColumns.model_construct(**columns)
+
+        wait_units = _upper_column(columns.wait_units)
+        run_units = _upper_column(columns.run_units)
+        pause_trigger = _upper_column(columns.pause_trigger)
+
+        frames = np.array(columns.frames, dtype=np.int64)
+        wait_ticks = ncdcore.to_ticks_array(columns.wait_time, wait_units)
+        run_ticks = ncdcore.to_ticks_array(columns.run_time, run_units)
+        group_ticks = (wait_ticks+run_ticks)*frames
+
+        #in the order of GROUP_FIELDS
+        groups = _construct_groups(zip(columns.frames, columns.wait_time, wait_units,
+                                       columns.run_time, run_units, pause_trigger,
+                                       columns.wait_pulses, columns.run_pulses,
+                                       (wait_ticks/CLOCK_FREQUENCY).tolist(),
+                                       (run_ticks/CLOCK_FREQUENCY).tolist(),
+                                       (group_ticks/CLOCK_FREQUENCY).tolist(),
+                                       wait_ticks.tolist(), run_ticks.tolist(),
+                                       group_ticks.tolist(),
+                                       strict=True))
+
+        profile = cls(cycles=cycles,
+                      seq_trigger=seq_trigger,
+                      multiplier=[1, 1, 1, 1] if multiplier is None else multiplier)
+
+        profile.groups = groups
+        profile._index_columns(frames, group_ticks, columns.wait_pulses, columns.run_pulses) #noqa
+
+        return profile
+
+    @classmethod
+    def from_records(cls, records, **profile_fields) -> "Profile":
+
+        """
+
+        Builds a Profile from a list of group dicts (as in the yaml or json
+
+        of a Profile) with from_columns, profile_fields are cycles,
+
+        seq_trigger and multiplier
+
+        """
+
+        records = list(records)
+        columns = records_to_columns(records)
+
+        if columns is None:
+            for record in records:
+                #raise the usual missing field error
+                Group.model_validate(record)
+
+        return cls.from_columns(**columns, **profile_fields)
+
+    @classmethod
+    def from_frame_times(cls,
+                         run_times,
+                         wait_times,
+                         pause_trigger: str = "IMMEDIATE",
+                         wait_pulses: list[int] | None = None,
+                         run_pulses: list[int] | None = None,
+                         resolution_us: int = 1,
+                         **profile_fields) -> "Profile":
+
+        """
+
+        Builds a Profile from the run and wait time (s) of every frame, see
+
+        ProfileGenerators.frames_to_columns. Times are quantised to
+
+        resolution_us and equal consecutive frames become one group.
+
+        profile_fields are cycles, seq_trigger and multiplier
+
+        """
+
+        columns = frames_to_columns(run_times, wait_times, pause_trigger,
+                                    wait_pulses, run_pulses, resolution_us)
+
+        return cls.from_columns(**columns, **profile_fields)
+
+    @classmethod
+    def linear(cls, n_frames: int, start: float, stop: float, wait_time: float, **kwargs) -> "Profile": #noqa
+
+        """
+
+        n_frames frames with run times (s) evenly spaced from start to stop,
+
+        kwargs as for from_frame_times
+
+        """
+
+        return cls.from_frame_times(linear_times(n_frames, start, stop), wait_time, **kwargs) #noqa
+
+    @classmethod
+    def geometric(cls, n_frames: int, start: float, stop: float, wait_time: float, **kwargs) -> "Profile": #noqa
+
+        """
+
+        n_frames frames with run times (s) growing geometrically from start
+
+        to stop, eg Profile.geometric(1000, 1e-3, 1, wait_time=1e-3)
+
+        """
+
+        return cls.from_frame_times(geometric_times(n_frames, start, stop), wait_time, **kwargs) #noqa
+
+    @classmethod
+    def piecewise(cls, segments, **kwargs) -> "Profile":
+
+        """
+
+        Frames from segments of (run times, wait time) one after the other, eg
+
+        Profile.piecewise([(linear_times(100, 1e-3, 1e-3), 1e-3),
+
+                           (geometric_times(50, 1e-3, 1), 10e-3)])
+
+        """
+
+        run_times, wait_times = piecewise_times(segments)
+
+        return cls.from_frame_times(run_times, wait_times, **kwargs)
+
+    @classmethod
+    def from_callback(cls, callback, n_frames: int, wait_time: float | None = None, **kwargs) -> "Profile": #noqa
+
+        """
+
+        Frames from callback(frame_numbers), which returns the run times (s) of
+
+        every frame or (run times, wait times). wait_time is used if the
+
+        callback gives no wait times
+
+        """
+
+        run_times, wait_times = callback_times(callback, n_frames)
+
+        if wait_times is None:
+            if wait_time is None:
+                raise ValueError("Give a wait_time or return (run times, wait times) from the callback") #noqa
+            wait_times = wait_time
+
+        return cls.from_frame_times(run_times, wait_times, **kwargs)
+
+    def to_columns(self) -> dict:
+
+        """
+
+        The profile as the arguments of from_columns, one list per group field
+
+        """
+
+        columns = {name: [getattr(g, name) for g in self.groups] for name in GROUP_INPUTS}
+
+        return {**columns,
+                "cycles": self.cycles,
+                "seq_trigger": self.seq_trigger,
+                "multiplier": list(self.multiplier)}
+
+    def to_wire(self) -> str:
+
+        """
+
+        Compact json of the profile for sending to a plan: versioned, one
+
+        list per group field and no derived fields. Decode with from_wire
+
+        """
+
+        columns = self.to_columns()
+        wire = {"schema": WIRE_SCHEMA,
+                "version": WIRE_VERSION,
+                **{name: columns.pop(name) for name in PROFILE_INPUTS},
+                "groups": columns}
+
+        return json.dumps(wire, separators=(",", ":"))
+
+    @classmethod
+    def from_wire(cls, payload: str | bytes) -> "Profile":
+
+        """
+
+        Decodes to_wire json, or the model_dump_json of a Profile.
+
+        The last few decoded profiles are cached by the sha256 of the payload,
+
+        so sending the same profile again skips parsing and validation. Every
+
+        call returns a new Profile, which the caller is free to edit
+
+        """
+
+        if isinstance(payload, str):
+            payload = payload.encode()
+
+        key = hashlib.sha256(payload).hexdigest()
+
+        if key in _WIRE_CACHE:
+            _WIRE_CACHE.move_to_end(key)
+            columns = _WIRE_CACHE[key]
+            #new lists, so no edit of the profile reaches the cache
+            return cls.from_columns(**(columns | {name: [list(p) for p in columns[name]] for name in GROUP_PULSES}), #noqa
+                                    validate=False)
+
+        wire = from_json(payload)
+
+        if "version" not in wire:
+            #model_dump_json of a Profile, groups are a list of records
+            profile = cls.from_records(wire.get("groups", []),
+                                       **{name: wire[name] for name in PROFILE_INPUTS if name in wire}) #noqa
+        elif wire.get("schema") != WIRE_SCHEMA or wire["version"] > WIRE_VERSION:
+            raise ValueError(f"Can't decode profile {wire.get('schema')} version {wire['version']}, " #noqa
+                             f"expected {WIRE_SCHEMA} version <= {WIRE_VERSION}")
+        else:
+            profile = cls.from_columns(**wire["groups"],
+                                       **{name: wire[name] for name in PROFILE_INPUTS})
+
+        columns = profile.to_columns()
+        _WIRE_CACHE[key] = columns | {name: [tuple(p) for p in columns[name]] for name in GROUP_PULSES} | {"multiplier": tuple(columns["multiplier"])} #noqa
+        if len(_WIRE_CACHE) > WIRE_CACHE_SIZE:
+            _WIRE_CACHE.popitem(last=False)
+
+        return profile
+
+    def _index_columns(self, frames, group_ticks, wait_pulses, run_pulses):
+
+        """
+
+        analyse_profile for groups already held as columns
+
+        """
+
+        #outputs are counted up to the shorter of wait/run pulses, as in _count_outputs
+        n_groups = len(frames)
+        n_pulses = np.array([min(len(w), len(r)) for w, r in zip(wait_pulses, run_pulses, strict=True)], dtype=np.int64) #noqa
+        width = int(n_pulses.max(initial=0))
+
+        pulses = pulse_matrix(list(wait_pulses) + list(run_pulses))[:, :width]
+        pulses = (pulses[:n_groups] | pulses[n_groups:]) & (np.arange(width) < n_pulses[:, None]) #noqa
+
+        self._frame_prefix = [0, *np.cumsum(frames).tolist()]
+        self._ticks_prefix = [0, *np.cumsum(group_ticks).tolist()]
+        self._out_counts = pulses.sum(axis=0).tolist()
+        self._n_indexed = len(frames)
+
+        self.total_frames = self._frame_prefix[-1]
+        self.ticks_per_cycle = self._ticks_prefix[-1]
+        self.duration_per_cycle = self.ticks_per_cycle/CLOCK_FREQUENCY
 
     @staticmethod
     def inputs():
@@ -389,10 +1091,136 @@ class Profile(BaseModel):
 
 
 
-@dataclass #pydantic dataclass
+class LazyProfiles(MutableSequence):
+
+    """
+
+    List of Profiles which are only built when they are first indexed.
+
+    Each entry starts as a raw section, the kwargs of Profile.from_columns
+
+    or Profile.from_records. At most max_cached built profiles are kept
+
+    (max_cached=None keeps them all), the least recently used is dropped
+
+    first. A dropped profile which was changed since it was built is turned
+
+    back into columns, so no edit is lost. Profiles put in the list by the
+
+    caller are never dropped.
+
+    """
+
+    def __init__(self, sections: Iterable[dict] = (), max_cached: int | None = 16):
+
+        self._slots = [_ProfileSlot(section) for section in sections]
+        self._built: OrderedDict[int, _ProfileSlot] = OrderedDict()
+        self.max_cached = max_cached
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __getitem__(self, index):
+
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        slot = self._slots[index]
+
+        if slot.profile is None:
+            slot.build()
+            self._built[id(slot)] = slot
+            self._evict()
+        elif not slot.pinned:
+            self._built.move_to_end(id(slot))
+
+        return slot.profile
+
+    def __setitem__(self, index, profile: Profile):
+
+        self._drop(self._slots[index])
+        self._slots[index] = _ProfileSlot(profile=profile)
+
+    def __delitem__(self, index):
+
+        self._drop(self._slots[index])
+        del self._slots[index]
+
+    def insert(self, index, profile: Profile):
+        self._slots.insert(index, _ProfileSlot(profile=profile))
+
+    def is_built(self, index) -> bool:
+        return self._slots[index].profile is not None
+
+    def section(self, index) -> dict | None:
+
+        """
+
+        The raw section of an unbuilt profile, None once it is built
+
+        """
+
+        slot = self._slots[index]
+
+        return None if slot.profile is not None else slot.section
+
+    def _drop(self, slot: "_ProfileSlot"):
+        self._built.pop(id(slot), None)
+
+    def _evict(self):
+
+        if self.max_cached is None:
+            return
+
+        while len(self._built) > self.max_cached:
+            _, slot = self._built.popitem(last=False)
+            slot.release()
+
+    def __repr__(self):
+
+        built = sum(slot.profile is not None for slot in self._slots)
+
+        return f"LazyProfiles({len(self)} profiles, {built} built)"
+
+
+class _ProfileSlot:
+
+    __slots__ = ("section", "profile", "built_key")
+
+    def __init__(self, section: dict | None = None, profile: Profile | None = None):
+
+        self.section = section
+        self.profile = profile
+        self.built_key = None
+
+    @property
+    def pinned(self) -> bool:
+        return self.section is None
+
+    def build(self):
+
+        if "groups" in self.section:
+            section = dict(self.section)
+            self.profile = Profile.from_records(section.pop("groups"), **section)
+        else:
+            self.profile = Profile.from_columns(**self.section)
+
+        self.built_key = self.profile.content_hash()
+
+    def release(self):
+
+        #changed since it was built
+        if self.profile.content_hash() != self.built_key:
+            self.section = {**self.profile.to_columns(), "validate": False}
+
+        self.profile = None
+        self.built_key = None
+
+
+@dataclass(config=ConfigDict(arbitrary_types_allowed=True)) #pydantic dataclass
 class ProfileLoader:
 
-    profiles: list[Profile]
+    profiles: LazyProfiles | list[Profile]
     instrument: str
     experiment: str
     detectors: list[str]
@@ -405,65 +1233,129 @@ class ProfileLoader:
                                      "data",str(self.year),
                                      self.experiment)
 
+        if not isinstance(self.profiles, LazyProfiles):
+            profiles = self.profiles
+            self.profiles = LazyProfiles()
+            self.profiles.extend(profiles)
+
         self.n_profiles = len(self.profiles)
 
     @staticmethod
-    def read_from_yaml(config_filepath):
+    def read_from_yaml(config_filepath, use_cache=True, max_cached=16):
+
+        """
+
+        Reads a config yaml, using the compiled sidecar (see ProfileCache)
+
+        if the yaml hasn't changed since it was last read. Profiles are
+
+        built when first indexed, see LazyProfiles for max_cached
+
+        """
+
+        if not os.path.exists(config_filepath):
+            raise FileNotFoundError(f"Cannot find file: {config_filepath}")
+
+        print("Using config:",config_filepath)
+
+        if use_cache:
+
+            cached = load_sidecar(config_filepath, GROUP_INPUTS)
+
+            if cached is not None:
+                meta, sections = cached
+
+                return ProfileLoader(LazyProfiles(sections, max_cached), meta["instrument"], meta["experiment"], meta["detectors"]) #noqa
 
         with open(config_filepath, 'rb') as file:
-            print("Using config:",config_filepath)
+            content = file.read()
+
+        if config_filepath.endswith('.yaml') or config_filepath.endswith('.yml'):
+            try:
+                config = yaml.load(content, Loader=YAML_LOADER)
+            except TypeError:
+                print("Must be a yaml file")
+
+        instrument = config["instrument"]
+        experiment = config["experiment"]
+        detectors = config["detectors"]
+
+        profile_names = [f for f in config if f.startswith("profile")]
+        sections = []
+
+        #profiles are only indexed here, they are validated and built by LazyProfiles
+        for profile_name in profile_names:
+
+            groups = [config[profile_name][key] for key in config[profile_name].keys() if key.startswith("group")] #noqa
+            columns = records_to_columns(groups)
 
-            if config_filepath.endswith('.yaml') or config_filepath.endswith('.yml'):
-                try:
-                    config = yaml.full_load(file)
-                except TypeError:
-                    print("Must be a yaml file")
+            section = {"cycles": config[profile_name]["cycles"],
+                       "seq_trigger": config[profile_name]["seq_trigger"],
+                       "multiplier": config[profile_name]["multiplier"]}
 
-            if not os.path.exists(config_filepath):
-                raise FileNotFoundError(f"Cannot find file: {config_filepath}")
+            if columns is None:
+                #from_records raises the missing field error when it is built
+                section["groups"] = groups
+            else:
+                section.update(columns)
 
+            sections.append(section)
 
-            instrument = config["instrument"]
-            experiment = config["experiment"]
-            detectors = config["detectors"]
+        self = ProfileLoader(LazyProfiles(sections, max_cached), instrument, experiment, detectors) #noqa
 
-            profile_names = [f for f in config if f.startswith("profile")]
-            profiles = []
+        if use_cache and all("groups" not in section for section in sections):
 
-            for profile_name in profile_names:
+            try:
+                #the sidecar is trusted without validating, so only valid sections go in it #noqa
+                validated = [validate_section(section) for section in sections]
+            except ValidationError as e:
+                #left for the profile to report when it is built
+                print(f"Not caching {config_filepath}: {e.error_count()} invalid fields")
+            else:
+                save_sidecar(config_filepath,
+                             file_digest(content),
+                             {"instrument": instrument,
+                              "experiment": experiment,
+                              "detectors": detectors},
+                             validated,
+                             GROUP_INPUTS)
 
-                profile_cycles = config[profile_name]["cycles"]
-                profile_trigger = config[profile_name]["seq_trigger"]
-                multiplier = config[profile_name]["multiplier"]
-                groups = {key: config[profile_name][key] for key in config[profile_name].keys() if key.startswith("group")} #noqa
-                group_list = []
+        return self
 
-                for group_name in groups.keys():
 
-                    group = config[profile_name][group_name]
+    def _profile_sections(self) -> Iterator[tuple[str, dict, Iterator[dict]]]:
 
-                    n_Group  = Group(frames=group["frames"],
-                                    wait_time=group["wait_time"],
-                                    wait_units=group["wait_units"],
-                                    run_time=group["run_time"],
-                                    run_units=group["run_units"],
-                                    pause_trigger=group["pause_trigger"],
-                                    wait_pulses=group["wait_pulses"],
-                                    run_pulses=group["run_pulses"])
+        """
 
-                    group_list.append(n_Group)
+        Yields (name, profile fields, group dicts) for every profile, without
 
-                n_profile = Profile(cycles=profile_cycles,
-                        seq_trigger=profile_trigger,
-                        groups=group_list,
-                        multiplier=multiplier)
+        the derived fields. Profiles which haven't been built are written
 
-                profiles.append(n_profile)
+        straight from their raw section
 
-            self = ProfileLoader(profiles, instrument, experiment, detectors)
+        """
 
-            return self
+        for p in range(len(self.profiles)):
 
+            section = self.profiles.section(p)
+
+            if section is None:
+                profile = self.profiles[p]
+                fields = {"cycles": profile.cycles,
+                          "seq_trigger": profile.seq_trigger,
+                          "multiplier": list(profile.multiplier)}
+                groups = ({name: getattr(group, name) for name in GROUP_INPUTS}
+                          for group in profile.groups)
+            else:
+                fields = {name: section[name] for name in PROFILE_INPUTS if name in section} #noqa
+                if "groups" in section:
+                    groups = ({name: record[name] for name in GROUP_INPUTS if name in record} #noqa
+                              for record in section["groups"])
+                else:
+                    groups = (dict(zip(GROUP_INPUTS, values, strict=True))
+                              for values in zip(*(section[name] for name in GROUP_INPUTS), strict=True)) #noqa
+
+            yield "profile-"+str(p), fields, groups
 
     def to_dict(self) -> dict:
 
@@ -472,34 +1364,87 @@ class ProfileLoader:
                     "instrument": self.instrument,
                     "detectors": self.detectors}
 
+        for name, fields, groups in self._profile_sections():
 
-        for p,profile in enumerate(self.profiles):
+            profile_dict = dict(fields)
 
-            profile_dict = profile.model_dump()
-            del profile_dict["groups"]
+            for g,group in enumerate(groups):
+                profile_dict["group-"+str(g)] = group
 
-            for g,group in enumerate(profile.groups):
-                group_dict = group.model_dump()
-                profile_dict["group-"+str(g)] = group_dict
-
-            exp_dict["profile-"+str(p)] = profile_dict
+            exp_dict[name] = profile_dict
 
         return exp_dict
 
 
-    def save_to_yaml(self, filepath: str):
+    def save_to_yaml(self, filepath: str, chunk_size: int = 256):
+
+        """
+
+        Writes the config one profile, and chunk_size groups, at a time
+
+        through the C dumper if there is one. The yaml is written to a
+
+        temporary file next to filepath and then moved over it, so filepath
+
+        is either the old or the new config, never half written
+
+        """
 
         print("Saving configuration to:",filepath)
 
-        config_dict  = self.to_dict()
+        def dump(data, **kwargs):
+            return yaml.dump(data,
+                             Dumper=YAML_DUMPER,
+                             default_flow_style=None,
+                             sort_keys=False,
+                             indent=2,
+                             **kwargs)
+
+        def indent(text):
+            return "".join("  "+line for line in text.splitlines(keepends=True))
+
+        header = {"title": "Panda Configure",
+                  "experiment": self.experiment,
+                  "instrument": self.instrument,
+                  "detectors": self.detectors}
+
+        directory = os.path.dirname(os.path.abspath(filepath))
+
+        with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".yaml", delete=False) as outfile: #noqa
+            try:
+                outfile.write(dump(header, explicit_start=True))
+
+                for name, fields, groups in self._profile_sections():
+
+                    outfile.write(dump({name: fields}))
+
+                    #groups are nested in the profile, so indented by one level
+                    chunk = {}
+                    for g, group in enumerate(groups):
+                        chunk["group-"+str(g)] = group
+                        if len(chunk) == chunk_size:
+                            outfile.write(indent(dump(chunk)))
+                            chunk = {}
+                    if chunk:
+                        outfile.write(indent(dump(chunk)))
+
+                outfile.flush()
+                os.fsync(outfile.fileno())
+
+            except BaseException:
+                outfile.close()
+                os.unlink(outfile.name)
+                raise
+
+        #keep the permissions of the file being replaced
+        if os.path.exists(filepath):
+            os.chmod(outfile.name, stat.S_IMODE(os.stat(filepath).st_mode))
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(outfile.name, 0o666 & ~umask)
 
-        with open(filepath, 'w') as outfile:
-            yaml.dump(config_dict,
-                      outfile,
-                      default_flow_style=None,
-                      sort_keys=False,
-                      indent=2,
-                      explicit_start=True)
+        os.replace(outfile.name, filepath)
 
 
     def delete_profile(self, n):
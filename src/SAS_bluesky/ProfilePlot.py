@@ -0,0 +1,157 @@
+"""
+
+Interactive plot of the veto and usr outputs of a Profile
+
+Only the visible window is drawn. Windows with few enough phase edges are
+drawn exactly from CompactTimeline.slice, longer ones as a min/max envelope
+(CompactTimeline.envelope) with max_bins bins, so a multi hour profile is
+never more than a few thousand points. Panning or zooming recomputes the
+window and the signal lines are redrawn by blitting.
+
+"""
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from SAS_bluesky.ProfileTimeline import CompactTimeline
+
+
+class TriggerPlot:
+
+    """
+
+    Plots a CompactTimeline, times are divided by scale (the seconds in
+
+    unit) for display
+
+    """
+
+    def __init__(self,
+                 timeline: CompactTimeline,
+                 unit: str = "s",
+                 scale: float = 1,
+                 max_bins: int = 2000,
+                 blit: bool = True):
+
+        self.timeline = timeline
+        self.unit = unit
+        self.scale = scale
+        self.max_bins = max_bins
+        self.blit = blit
+        self._background = None
+
+        active_out = timeline.active_out
+
+        self.figure, self.axes = plt.subplots(len(active_out)+1, 1, sharex=True,
+                                              figsize=(10, max(len(active_out), 1)*4),
+                                              squeeze=False)
+        self.axes = self.axes[:, 0]
+
+        self.lines = [ax.plot([], [], drawstyle="steps-post", animated=blit)[0]
+                      for ax in self.axes]
+
+        self.axes[0].set_ylabel("Veto Signal")
+        for ax, usr in zip(self.axes[1:], active_out, strict=True):
+            ax.set_ylabel(f"Usr{usr} Signal")
+
+        for ax in self.axes:
+            ax.set_ylim(-0.1, 1.1)
+        self.axes[-1].set_xlabel(f"Time ({unit})")
+
+        end = timeline.duration/scale
+        self.axes[0].set_xlim(0, end + end/10 or 1)
+
+        self.update()
+        self.axes[0].callbacks.connect("xlim_changed", self._on_xlim_changed)
+        self.figure.canvas.mpl_connect("draw_event", self._on_draw)
+
+    def window_signals(self, t_start: float, t_end: float):
+
+        """
+
+        Returns the x values and the y values of the veto and each active output
+
+        between t_start and t_end (s), exact if there are at most max_bins
+
+        frames (2*max_bins phase edges) in the window, otherwise a min/max
+
+        envelope of max_bins bins
+
+        """
+
+        timeline = self.timeline
+
+        if timeline.duration_ticks == 0:
+            return np.zeros(0), [np.zeros(0)]*len(self.lines)
+
+        t_start = min(max(t_start, 0), timeline.duration)
+        t_end = min(max(t_end, t_start), timeline.duration)
+
+        first, last = timeline.locate([t_start, min(t_end, np.nextafter(timeline.duration, 0))]).frame_index #noqa
+
+        if last - first + 1 <= self.max_bins:
+            window = timeline.slice(t_start, t_end)
+            x = window.edge_times
+            states = [window.veto, *window.outputs]
+            #one value per edge for steps-post, low after the last edge
+            return x, [np.append(s, False).astype(np.int8) for s in states]
+
+        edges, veto_min, veto_max, outputs_min, outputs_max = timeline.envelope(t_start, t_end, self.max_bins) #noqa
+
+        #each bin goes from its min to its max then holds the max until the next bin
+        x = np.append(np.repeat(edges[:-1], 2), edges[-1])
+        signals = []
+        for low, high in zip([veto_min, *outputs_min], [veto_max, *outputs_max], strict=True): #noqa
+            y = np.stack([low, high], axis=1).ravel()
+            signals.append(np.append(y, high[-1]).astype(np.int8))
+
+        return x, signals
+
+    def update(self):
+
+        """
+
+        Recomputes the signals for the current x limits
+
+        """
+
+        x_min, x_max = self.axes[0].get_xlim()
+        x, signals = self.window_signals(x_min*self.scale, x_max*self.scale)
+
+        for line, y in zip(self.lines, signals, strict=True):
+            line.set_data(x/self.scale, y)
+
+    def refresh(self):
+
+        """
+
+        Redraws only the signal lines over the last full draw
+
+        """
+
+        if not self.blit or self._background is None:
+            self.figure.canvas.draw_idle()
+            return
+
+        canvas = self.figure.canvas
+        canvas.restore_region(self._background)
+        for ax, line in zip(self.axes, self.lines, strict=True):
+            ax.draw_artist(line)
+        canvas.blit(self.figure.bbox)
+
+    def _on_xlim_changed(self, ax):
+
+        self.update()
+        self.refresh()
+
+    def _on_draw(self, event):
+
+        #animated lines aren't part of a full draw, keep it as the background
+        #and put the lines on top
+        if self.blit:
+            self._background = self.figure.canvas.copy_from_bbox(self.figure.bbox)
+            for ax, line in zip(self.axes, self.lines, strict=True):
+                ax.draw_artist(line)
+
+    def show(self, blocking: bool = True):
+        plt.show(block=blocking)
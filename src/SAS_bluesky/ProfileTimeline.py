@@ -0,0 +1,577 @@
+"""
+
+Vectorised trigger timelines for Profiles
+
+The sequencer runs every frame of a group as two phases, the wait phase
+(outputs set by wait_pulses) followed by the run phase (outputs set by
+run_pulses). These helpers build the phase edges and output states for a
+whole Profile in one pass with numpy, instead of looping over every frame.
+
+All timing is done in int64 PandA clock ticks, times in seconds are only
+derived at the end so edges never accumulate rounding errors.
+
+CompactTimeline.frame_index gives the planned timing of every frame as
+FRAME_INDEX_DTYPE records, which can be joined to detector frames by frame
+number, and write_frame_index writes it to a memory mappable .npy or a .npz.
+
+"""
+
+import os
+import tempfile
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy as np
+
+from SAS_bluesky.utils.ncdcore import CLOCK_FREQUENCY, ncdcore
+
+if TYPE_CHECKING:
+    from SAS_bluesky.ProfileGroups import Profile
+
+
+class TriggerTimeline(NamedTuple):
+
+    """
+
+    edge_times: time (s) of every phase edge, starting at 0, length n_phases+1
+
+    veto: state of the veto signal during each phase, length n_phases
+
+    outputs: state of each active output during each phase,
+    shape (len(active_out), n_phases)
+
+    active_out: index of the outputs which are used anywhere in the profile
+
+    edge_ticks: edge_times in PandA clock ticks (int64)
+
+    """
+
+    edge_times: np.ndarray
+    veto: np.ndarray
+    outputs: np.ndarray
+    active_out: np.ndarray
+    edge_ticks: np.ndarray
+
+
+def pulse_matrix(pulses: list[list[int]]) -> np.ndarray:
+
+    """
+
+    Takes a list of pulse lists (one per group) and returns them as a
+    (n_groups, n_outputs) boolean array, padding short lists with zeros
+
+    """
+
+    lengths = {len(p) for p in pulses}
+
+    if len(lengths) == 1:
+        #not ragged, numpy can convert it in one go
+        return np.array(pulses, dtype=bool).reshape(len(pulses), lengths.pop())
+
+    n_outputs = max(lengths, default=0)
+    matrix = np.zeros((len(pulses), n_outputs), dtype=bool)
+
+    for n, p in enumerate(pulses):
+        matrix[n, :len(p)] = np.asarray(p, dtype=bool)
+
+    return matrix
+
+
+def group_columns(profile: "Profile") -> dict[str, np.ndarray]:
+
+    """
+
+    Returns the groups of a profile as columns:
+    frames, wait_ticks, run_ticks, wait_pulses and run_pulses
+
+    The ticks are converted from wait_time/run_time and their units, the
+    fields Profile.content_hash is made from, not the derived fields which
+    a group edited in place doesn't update
+
+    """
+
+    groups = profile.groups
+    pulses = pulse_matrix([g.wait_pulses for g in groups] +
+                          [g.run_pulses for g in groups])
+
+    return {"frames": np.fromiter((g.frames for g in groups),
+                                  dtype=np.int64, count=len(groups)),
+            "wait_ticks": ncdcore.to_ticks_array([g.wait_time for g in groups],
+                                                 [g.wait_units for g in groups]),
+            "run_ticks": ncdcore.to_ticks_array([g.run_time for g in groups],
+                                                [g.run_units for g in groups]),
+            "wait_pulses": pulses[:len(groups)],
+            "run_pulses": pulses[len(groups):]}
+
+
+def build_trigger_timeline(profile: "Profile",
+                           include_cycles: bool = True) -> TriggerTimeline:
+
+    """
+
+    Builds the phase edges and the states of the veto and every active
+    output for the whole profile in one batched pass.
+
+    Every group contributes frames*2 phases, these are expanded with
+    np.repeat and the edge times are the cumulative sum of the phase
+    durations. If include_cycles the per-cycle phases are tiled
+    profile.cycles times.
+
+    """
+
+    cycles = profile.cycles if include_cycles else 1
+
+    return timeline_from_columns(group_columns(profile), cycles)
+
+
+def timeline_from_columns(columns: dict[str, np.ndarray],
+                          cycles: int = 1) -> TriggerTimeline:
+
+    """
+
+    build_trigger_timeline for groups already held as columns (see group_columns)
+
+    """
+
+    frames = columns["frames"]
+    wait_pulses = columns["wait_pulses"]
+    run_pulses = columns["run_pulses"]
+
+    active_out = np.flatnonzero((wait_pulses | run_pulses).any(axis=0))
+
+    #(n_groups, 2) -> wait phase then run phase for each group
+    phase_durations = np.stack([columns["wait_ticks"], columns["run_ticks"]], axis=1)
+    phase_outputs = np.stack([wait_pulses[:, active_out],
+                              run_pulses[:, active_out]], axis=1)
+    phase_veto = np.zeros((len(frames), 2), dtype=bool)
+    phase_veto[:, 1] = run_pulses.any(axis=1)
+
+    #expand every group by its number of frames, flattening to phase order
+    durations = np.repeat(phase_durations, frames, axis=0).ravel()
+    veto = np.repeat(phase_veto, frames, axis=0).ravel()
+    #explicit shape, -1 can't be inferred for a profile with no groups
+    outputs = np.repeat(phase_outputs, frames, axis=0).reshape(len(durations), len(active_out)).T #noqa
+
+    if cycles > 1:
+        durations = np.tile(durations, cycles)
+        veto = np.tile(veto, cycles)
+        outputs = np.tile(outputs, (1, cycles))
+
+    edge_ticks = np.zeros(len(durations)+1, dtype=np.int64)
+    np.cumsum(durations, out=edge_ticks[1:])
+
+    return TriggerTimeline(edge_ticks/CLOCK_FREQUENCY, veto, outputs, active_out, edge_ticks) #noqa
+
+
+def step_signal(edge_times: np.ndarray, states: np.ndarray):
+
+    """
+
+    Converts phase edges and states into arrays for plt.step (where="pre"),
+    the signal starts low at t=0 and ends low after the final edge
+
+    """
+
+    end_time = edge_times[-1] + edge_times[-1]/10
+
+    step_time = np.concatenate([edge_times, [end_time]])
+    step_signal = np.concatenate([[0], states.astype(np.int8), [0]])
+
+    return step_time, step_signal
+
+
+class FrameLocation(NamedTuple):
+
+    """
+
+    Where in a profile a time falls, every field is -1 outside the profile
+
+    cycle: cycle number, group: group number, frame: frame within the group,
+
+    frame_index: frame number counted from the start of the profile,
+
+    phase: 0 for the wait phase, 1 for the run phase
+
+    """
+
+    cycle: np.ndarray
+    group: np.ndarray
+    frame: np.ndarray
+    frame_index: np.ndarray
+    phase: np.ndarray
+
+
+#one record per frame, times in PandA clock ticks from the start of the profile,
+#outputs are bitmasks (bit n is output n) of the outputs high in each phase
+FRAME_INDEX_DTYPE = np.dtype([("frame", np.int64),
+                              ("cycle", np.int64),
+                              ("group", np.int64),
+                              ("frame_in_group", np.int64),
+                              ("start_ticks", np.int64),
+                              ("run_start_ticks", np.int64),
+                              ("end_ticks", np.int64),
+                              ("wait_outputs", np.uint16),
+                              ("run_outputs", np.uint16)])
+
+
+def output_mask(pulses: np.ndarray) -> np.ndarray:
+
+    """
+
+    (n_groups, n_outputs) boolean array -> uint16 bitmask per group
+
+    """
+
+    pulses = np.asarray(pulses, dtype=np.uint16)
+
+    return (pulses << np.arange(pulses.shape[-1], dtype=np.uint16)).sum(axis=-1, dtype=np.uint16) #noqa
+
+
+class CompactTimeline:
+
+    """
+
+    Run length encoded timeline of a Profile
+
+    One record per group (frames, wait and run ticks and pulses) plus
+    prefix sums of the group durations and frames. Point queries, range
+    slices and frame lookups bisect the prefix sums, so no frames are
+    expanded unless they are inside the requested range. Times passed in
+    are in seconds and are floored to the clock tick they fall in.
+
+    """
+
+    def __init__(self,
+                 frames: np.ndarray,
+                 wait_ticks: np.ndarray,
+                 run_ticks: np.ndarray,
+                 wait_pulses: np.ndarray,
+                 run_pulses: np.ndarray,
+                 cycles: int = 1):
+
+        self.frames = np.asarray(frames, dtype=np.int64)
+        self.wait_ticks = np.asarray(wait_ticks, dtype=np.int64)
+        self.run_ticks = np.asarray(run_ticks, dtype=np.int64)
+        self.wait_pulses = np.asarray(wait_pulses, dtype=bool)
+        self.run_pulses = np.asarray(run_pulses, dtype=bool)
+        self.cycles = int(cycles)
+
+        self.frame_period = self.wait_ticks + self.run_ticks
+        self.group_start_ticks = np.zeros(len(self.frames)+1, dtype=np.int64)
+        np.cumsum(self.frame_period*self.frames, out=self.group_start_ticks[1:])
+        self.frame_start = np.zeros(len(self.frames)+1, dtype=np.int64)
+        np.cumsum(self.frames, out=self.frame_start[1:])
+
+        self.active_out = np.flatnonzero((self.wait_pulses | self.run_pulses).any(axis=0)) #noqa
+
+    @classmethod
+    def from_profile(cls, profile: "Profile") -> "CompactTimeline":
+
+        columns = group_columns(profile)
+
+        return cls(cycles=profile.cycles, **columns)
+
+    @property
+    def group_start(self) -> np.ndarray:
+        return self.group_start_ticks/CLOCK_FREQUENCY
+
+    @property
+    def cycle_ticks(self) -> int:
+        return int(self.group_start_ticks[-1])
+
+    @property
+    def cycle_period(self) -> float:
+        return self.cycle_ticks/CLOCK_FREQUENCY
+
+    @property
+    def frames_per_cycle(self) -> int:
+        return int(self.frame_start[-1])
+
+    @property
+    def duration_ticks(self) -> int:
+        return self.cycle_ticks*self.cycles
+
+    @property
+    def duration(self) -> float:
+        return self.duration_ticks/CLOCK_FREQUENCY
+
+    def locate(self, t) -> FrameLocation:
+
+        """
+
+        Returns the cycle, group, frame and phase active at time(s) t
+
+        """
+
+        return self.locate_ticks(np.floor(np.asarray(t, dtype=np.float64)*CLOCK_FREQUENCY)) #noqa
+
+    def locate_ticks(self, tick) -> FrameLocation:
+
+        """
+
+        Returns the cycle, group, frame and phase active at clock tick(s) tick
+
+        """
+
+        tick = np.asarray(tick).astype(np.int64)
+        inside = (tick >= 0) & (tick < self.duration_ticks)
+        outside = -np.ones(tick.shape, dtype=np.int64)
+
+        if not inside.any():
+            return FrameLocation(*[outside]*5)
+
+        cycle = np.clip(tick // self.cycle_ticks, 0, self.cycles-1)
+        t_cycle = tick - cycle*self.cycle_ticks
+
+        group = np.searchsorted(self.group_start_ticks, t_cycle, side="right") - 1
+        group = np.clip(group, 0, len(self.frames)-1)
+
+        period = self.frame_period[group]
+        t_group = t_cycle - self.group_start_ticks[group]
+        frame = np.floor_divide(t_group, np.maximum(period, 1))
+        frame = np.clip(frame, 0, np.maximum(self.frames[group]-1, 0))
+
+        phase = (t_group - frame*period >= self.wait_ticks[group]).astype(np.int64)
+        frame_index = cycle*self.frames_per_cycle + self.frame_start[group] + frame
+
+        return FrameLocation(*(np.where(inside, f, outside)
+                               for f in (cycle, group, frame, frame_index, phase)))
+
+    def state_at(self, t) -> tuple[np.ndarray, np.ndarray]:
+
+        """
+
+        Returns the veto state and the states of the active outputs at time(s) t,
+
+        outputs has shape (len(active_out), *np.shape(t))
+
+        """
+
+        location = self.locate(t)
+        inside = location.group >= 0
+
+        if len(self.frames) == 0:
+            return inside, np.zeros((0, *inside.shape), dtype=bool)
+
+        group = np.where(inside, location.group, 0)
+        run_phase = location.phase == 1
+
+        veto = inside & run_phase & self.run_pulses[group].any(axis=-1)
+
+        wait_state = self.wait_pulses[group][..., self.active_out]
+        run_state = self.run_pulses[group][..., self.active_out]
+        outputs = np.where(run_phase[..., None], run_state, wait_state) & inside[..., None] #noqa
+
+        return veto, np.moveaxis(outputs, -1, 0)
+
+    def frame_ticks(self, first_frame: int, last_frame: int):
+
+        """
+
+        Returns the group, start, wait end and run end tick of frames
+
+        first_frame to last_frame (inclusive), counted from the start of the profile
+
+        """
+
+        frame_index = np.arange(max(first_frame, 0),
+                                min(last_frame, self.frames_per_cycle*self.cycles-1)+1,
+                                dtype=np.int64)
+
+        cycle, frame_in_cycle = np.divmod(frame_index, max(self.frames_per_cycle, 1))
+        group = np.searchsorted(self.frame_start, frame_in_cycle, side="right") - 1
+
+        start = (cycle*self.cycle_ticks + self.group_start_ticks[group] +
+                 (frame_in_cycle - self.frame_start[group])*self.frame_period[group])
+
+        return group, start, start + self.wait_ticks[group], start + self.frame_period[group] #noqa
+
+    @property
+    def n_frames(self) -> int:
+        return self.frames_per_cycle*self.cycles
+
+    def frame_index(self, first_frame: int = 0, last_frame: int | None = None, out: np.ndarray | None = None) -> np.ndarray: #noqa
+
+        """
+
+        Returns the FRAME_INDEX_DTYPE records of frames first_frame to
+
+        last_frame (inclusive, default the last frame), written into out if given
+
+        """
+
+        last_frame = self.n_frames-1 if last_frame is None else last_frame
+        group, start, run_start, end = self.frame_ticks(first_frame, last_frame)
+
+        frame = np.arange(max(first_frame, 0), max(first_frame, 0)+len(group), dtype=np.int64) #noqa
+        cycle, frame_in_cycle = np.divmod(frame, max(self.frames_per_cycle, 1))
+
+        index = np.empty(len(frame), dtype=FRAME_INDEX_DTYPE) if out is None else out
+        index["frame"] = frame
+        index["cycle"] = cycle
+        index["group"] = group
+        index["frame_in_group"] = frame_in_cycle - self.frame_start[group]
+        index["start_ticks"] = start
+        index["run_start_ticks"] = run_start
+        index["end_ticks"] = end
+        index["wait_outputs"] = output_mask(self.wait_pulses)[group]
+        index["run_outputs"] = output_mask(self.run_pulses)[group]
+
+        return index
+
+    def write_frame_index(self, path: str, chunk_frames: int = 2**20) -> str:
+
+        """
+
+        Writes the index of every frame to path, a .npy file of
+
+        FRAME_INDEX_DTYPE records filled chunk_frames at a time (open it with
+
+        np.load(path, mmap_mode="r") to read only what is needed), or a .npz
+
+        with one array per field for smaller profiles. The file is written
+
+        next to path and moved into place once complete
+
+        """
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        suffix = os.path.splitext(path)[1]
+
+        with tempfile.NamedTemporaryFile(dir=directory, suffix=suffix, delete=False) as tmp: #noqa
+            pass
+
+        try:
+            if suffix == ".npz":
+                index = self.frame_index()
+                np.savez(tmp.name, clock_frequency=CLOCK_FREQUENCY,
+                         **{name: index[name] for name in FRAME_INDEX_DTYPE.names})
+            elif suffix == ".npy":
+                index = np.lib.format.open_memmap(tmp.name, mode="w+",
+                                                  dtype=FRAME_INDEX_DTYPE,
+                                                  shape=(self.n_frames,))
+                for first in range(0, self.n_frames, chunk_frames):
+                    last = min(first+chunk_frames, self.n_frames)
+                    self.frame_index(first, last-1, out=index[first:last])
+                index.flush()
+                del index
+            else:
+                raise ValueError(f"Frame index must be a .npy or .npz file, not {path}")
+
+            os.replace(tmp.name, path)
+
+        finally:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+
+        return path
+
+    def slice(self, t_start: float, t_end: float) -> TriggerTimeline:
+
+        """
+
+        Returns the TriggerTimeline of only the frames between t_start and t_end,
+
+        only these frames are expanded
+
+        """
+
+        last_tick = self.duration_ticks-1
+        tick_start = min(max(int(np.floor(t_start*CLOCK_FREQUENCY)), 0), last_tick)
+        tick_end = min(max(int(np.floor(t_end*CLOCK_FREQUENCY)), tick_start), last_tick)
+
+        first = self.locate_ticks(tick_start).frame_index
+        last = self.locate_ticks(tick_end).frame_index
+
+        group, start, wait_end, run_end = self.frame_ticks(int(first), int(last))
+
+        edge_ticks = np.empty(2*len(group)+1, dtype=np.int64)
+        edge_ticks[0:-1:2] = start
+        edge_ticks[1::2] = wait_end
+        edge_ticks[-1] = run_end[-1] if len(group) else max(tick_start, 0)
+
+        veto = np.zeros((len(group), 2), dtype=bool)
+        veto[:, 1] = self.run_pulses[group].any(axis=1)
+
+        outputs = np.stack([self.wait_pulses[group][:, self.active_out],
+                            self.run_pulses[group][:, self.active_out]], axis=1)
+
+        return TriggerTimeline(edge_ticks/CLOCK_FREQUENCY,
+                               veto.ravel(),
+                               outputs.reshape(-1, len(self.active_out)).T,
+                               self.active_out,
+                               edge_ticks)
+
+    def envelope(self, t_start: float, t_end: float, n_bins: int):
+
+        """
+
+        Min/max envelope of the veto and the active outputs in n_bins equal
+
+        bins between t_start and t_end (s), without expanding any frames.
+
+        A bin holds the state at its start, unless it crosses a phase edge,
+
+        then it holds the min and max over every group it touches.
+
+        Returns bin_edges (s), veto_min, veto_max, outputs_min and outputs_max,
+
+        the outputs with shape (len(active_out), n_bins)
+
+        """
+
+        tick_start = min(max(int(np.floor(t_start*CLOCK_FREQUENCY)), 0), self.duration_ticks) #noqa
+        tick_end = min(max(int(np.floor(t_end*CLOCK_FREQUENCY)), tick_start), self.duration_ticks) #noqa
+        edges = np.linspace(tick_start, tick_end, n_bins+1).astype(np.int64)
+
+        n_groups = len(self.frames)
+        veto_min = veto_max = np.zeros(n_bins, dtype=bool)
+        outputs_min = outputs_max = np.zeros((len(self.active_out), n_bins), dtype=bool)
+
+        if n_groups == 0 or self.duration_ticks == 0:
+            return edges/CLOCK_FREQUENCY, veto_min, veto_max, outputs_min, outputs_max
+
+        last_tick = self.duration_ticks-1
+        first = self.locate_ticks(np.minimum(edges[:-1], last_tick))
+        last = self.locate_ticks(np.clip(edges[1:]-1, edges[:-1], last_tick))
+
+        #(n_groups, 2, 1+n_active) states of the veto then the outputs in each phase
+        states = np.zeros((n_groups, 2, 1+len(self.active_out)), dtype=bool)
+        states[:, 1, 0] = self.run_pulses.any(axis=1)
+        states[:, 0, 1:] = self.wait_pulses[:, self.active_out]
+        states[:, 1, 1:] = self.run_pulses[:, self.active_out]
+
+        group_min = states.min(axis=1)
+        group_max = states.max(axis=1)
+
+        start_state = states[first.group, first.phase]
+        end_state = states[last.group, last.phase]
+
+        #groups touched by each bin, counted from the start of the profile
+        first_group = first.cycle*n_groups + first.group
+        n_touched = last.cycle*n_groups + last.group - first_group + 1
+        crosses_edge = 2*last.frame_index+last.phase > 2*first.frame_index+first.phase #noqa
+
+        range_min = np.broadcast_to(group_min.min(axis=0), start_state.shape).copy()
+        range_max = np.broadcast_to(group_max.max(axis=0), start_state.shape).copy()
+
+        partial = n_touched < n_groups
+        if partial.any():
+            #groups repeat every cycle, so reduce over the groups twice over
+            starts = first_group[partial] % n_groups
+            bounds = np.stack([starts, starts+n_touched[partial]], axis=1).ravel()
+            range_min[partial] = np.logical_and.reduceat(np.concatenate([group_min, group_min, group_min[:1]]), bounds)[::2] #noqa
+            range_max[partial] = np.logical_or.reduceat(np.concatenate([group_max, group_max, group_max[:1]]), bounds)[::2] #noqa
+
+        crosses_edge = crosses_edge[:, None]
+        env_min = np.where(crosses_edge, start_state & end_state & range_min, start_state)
+        env_max = np.where(crosses_edge, start_state | end_state | range_max, start_state)
+
+        #nothing is high after the end of the profile
+        inside = (edges[:-1] < self.duration_ticks)[:, None]
+        env_min &= inside
+        env_max &= inside
+
+        return (edges/CLOCK_FREQUENCY,
+                env_min[:, 0], env_max[:, 0],
+                env_min[:, 1:].T, env_max[:, 1:].T)
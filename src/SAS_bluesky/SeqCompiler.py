@@ -0,0 +1,332 @@
+"""
+
+Sequencer table compiler
+
+Sits between a Profile and the SeqTable written to the PandA. Takes the raw
+one-row-per-group columns from seq_table_columns and
+
+- merges adjacent equivalent rows into repeats
+- splits rows whose repeats or time1/time2 overflow the sequencer fields
+- checks the result fits in the sequencer table, or cuts it into chunks
+  for running on two sequencers in turn (compile_seq_chunks)
+
+Rows with a pause trigger other than IMMEDIATE are never merged, so every
+trigger the user asked for is still waited on.
+
+"""
+
+import numpy as np
+from ophyd_async.fastcs.panda import SeqTrigger
+
+from SAS_bluesky.utils.ncdcore import ncdcore
+
+SEQ_MAX_ROWS = 4096 #rows in a PandA SEQ table
+SEQ_MAX_REPEATS = int(np.iinfo(np.uint16).max) #repeats=0 means repeat forever
+SEQ_MAX_TIME = int(np.iinfo(np.uint32).max) #in prescale units (us)
+
+SEQ_OUTPUTS = ["a", "b", "c", "d", "e", "f"]
+SEQ_COLUMN_DTYPES = {"repeats": np.uint16,
+                     "position": np.int32,
+                     "time1": np.uint32,
+                     "time2": np.uint32,
+                     **{f"out{o}{p}": np.bool_ for o in SEQ_OUTPUTS for p in (1, 2)}}
+
+
+def raw_seq_columns(frames: np.ndarray,
+                    triggers: list[SeqTrigger],
+                    wait_ticks: np.ndarray,
+                    run_ticks: np.ndarray,
+                    wait_pulses: np.ndarray,
+                    run_pulses: np.ndarray) -> dict:
+
+    """
+
+    Builds the uncompiled SeqTable columns, one row per group, from group
+
+    columns. repeats and times are int64 so that values which overflow the
+
+    sequencer can be split by compile_seq_table
+
+    """
+
+    n_groups = len(frames)
+
+    def outputs(pulses):
+        pulses = np.asarray(pulses, dtype=bool)[:, :len(SEQ_OUTPUTS)]
+        return np.pad(pulses, ((0, 0), (0, len(SEQ_OUTPUTS)-pulses.shape[1])))
+
+    wait_outputs = outputs(wait_pulses)
+    run_outputs = outputs(run_pulses)
+
+    columns = {"repeats": np.asarray(frames, dtype=np.int64),
+               "trigger": list(triggers),
+               "position": np.zeros(n_groups, dtype=np.int32),
+               "time1": ncdcore.ticks_to_micros(np.asarray(wait_ticks, dtype=np.int64)),
+               "time2": ncdcore.ticks_to_micros(np.asarray(run_ticks, dtype=np.int64))}
+
+    for n, out in enumerate(SEQ_OUTPUTS):
+        columns[f"out{out}1"] = wait_outputs[:, n]
+        columns[f"out{out}2"] = run_outputs[:, n]
+
+    return columns
+
+
+def _take(columns: dict, rows: np.ndarray) -> dict:
+
+    return {key: ([value[r] for r in rows] if key == "trigger" else value[rows])
+            for key, value in columns.items()}
+
+
+def merge_rows(columns: dict) -> dict:
+
+    """
+
+    Merges runs of adjacent rows which are identical apart from repeats,
+
+    only rows with an IMMEDIATE trigger are merged
+
+    """
+
+    n_rows = len(columns["repeats"])
+
+    if n_rows < 2:
+        return columns
+
+    immediate = np.array([t == SeqTrigger.IMMEDIATE for t in columns["trigger"]])
+    same = immediate[1:] & immediate[:-1]
+
+    for key, value in columns.items():
+        if key not in ("repeats", "trigger"):
+            same &= value[1:] == value[:-1]
+
+    starts = np.flatnonzero(np.concatenate([[True], ~same]))
+
+    merged = _take(columns, starts)
+    repeats = np.asarray(columns["repeats"], dtype=np.int64)
+    merged["repeats"] = np.add.reduceat(repeats, starts)
+
+    return merged
+
+
+def _split_phase(duration: int, n_chunks: int) -> list[int]:
+
+    chunk, remainder = divmod(duration, n_chunks)
+
+    return [chunk+1]*remainder + [chunk]*(n_chunks-remainder)
+
+
+def _frame_rows(row: dict) -> list[dict]:
+
+    """
+
+    Splits one frame whose time1 or time2 is too long into several rows,
+
+    each phase is cut into chunks holding the same outputs and the chunks
+
+    are paired up into rows. Only the first row keeps the trigger.
+
+    """
+
+    phases = [(int(row["time1"]), {o: row[f"out{o}1"] for o in SEQ_OUTPUTS}),
+              (int(row["time2"]), {o: row[f"out{o}2"] for o in SEQ_OUTPUTS})]
+
+    n_chunks = [max(-(-t // SEQ_MAX_TIME), 1) for t, _ in phases]
+
+    #every row has two phases, so an even number of chunks is needed
+    if sum(n_chunks) % 2:
+        longest = int(np.argmax([t for t, _ in phases]))
+        n_chunks[longest] += 1
+
+    chunks = [(t, outs) for (duration, outs), n in zip(phases, n_chunks, strict=True)
+              for t in _split_phase(duration, n)]
+
+    rows = []
+    for n in range(0, len(chunks), 2):
+        (time1, outs1), (time2, outs2) = chunks[n], chunks[n+1]
+        rows.append({"repeats": 1,
+                     "trigger": row["trigger"] if n == 0 else SeqTrigger.IMMEDIATE,
+                     "position": row["position"],
+                     "time1": time1,
+                     "time2": time2,
+                     **{f"out{o}1": outs1[o] for o in SEQ_OUTPUTS},
+                     **{f"out{o}2": outs2[o] for o in SEQ_OUTPUTS}})
+
+    return rows
+
+
+def count_rows(columns: dict) -> int:
+
+    """
+
+    Returns the number of sequencer rows split_rows would produce
+
+    """
+
+    return int(np.sum(row_counts(columns)))
+
+
+def row_counts(columns: dict) -> np.ndarray:
+
+    """
+
+    Returns the number of sequencer rows split_rows would turn each row into
+
+    """
+
+    repeats = np.asarray(columns["repeats"], dtype=np.int64)
+    long_time = ((np.asarray(columns["time1"]) > SEQ_MAX_TIME) |
+                 (np.asarray(columns["time2"]) > SEQ_MAX_TIME))
+
+    rows_per_frame = np.ones(len(repeats), dtype=np.int64)
+
+    for n in np.flatnonzero(long_time):
+        rows_per_frame[n] = len(_frame_rows({k: v[n] for k, v in columns.items()}))
+
+    return np.where(long_time, repeats*rows_per_frame, -(-repeats // SEQ_MAX_REPEATS))
+
+
+def split_rows(columns: dict) -> dict:
+
+    """
+
+    Splits rows whose repeats don't fit in 16 bits into several rows
+
+    (all keeping the trigger), and rows whose time1/time2 don't fit in
+
+    32 bits into one set of rows per frame
+
+    """
+
+    repeats = np.asarray(columns["repeats"], dtype=np.int64)
+    long_time = ((np.asarray(columns["time1"]) > SEQ_MAX_TIME) |
+                 (np.asarray(columns["time2"]) > SEQ_MAX_TIME))
+
+    if not long_time.any() and not (repeats > SEQ_MAX_REPEATS).any():
+        return columns
+
+    rows = []
+
+    for n in range(len(repeats)):
+
+        row = {key: value[n] for key, value in columns.items()}
+
+        if long_time[n]:
+            rows.extend(_frame_rows(row)*int(repeats[n]))
+        else:
+            n_rows = -(-int(repeats[n]) // SEQ_MAX_REPEATS)
+            for r in _split_phase(int(repeats[n]), n_rows):
+                rows.append(row | {"repeats": r})
+
+    return {key: ([r[key] for r in rows] if key == "trigger"
+                  else np.array([r[key] for r in rows]))
+            for key in columns}
+
+
+def prepare_rows(columns: dict, merge: bool = True) -> dict:
+
+    """
+
+    Drops rows with no repeats and, if merge, merges equivalent rows.
+
+    count_rows of the result is the size of the compiled table
+
+    """
+
+    columns = dict(columns)
+    columns["trigger"] = list(columns["trigger"])
+
+    #repeats=0 would run forever on the PandA, a group with no frames has no row
+    keep = np.flatnonzero(np.asarray(columns["repeats"]) > 0)
+    if len(keep) != len(columns["repeats"]):
+        columns = _take(columns, keep)
+
+    if merge:
+        columns = merge_rows(columns)
+
+    return columns
+
+
+def compile_seq_table(columns: dict,
+                      merge: bool = True,
+                      max_rows: int = SEQ_MAX_ROWS) -> dict:
+
+    """
+
+    Turns the raw one-row-per-group columns into the columns of a SeqTable
+
+    which fits on the PandA, raising a ValueError if it can't
+
+    """
+
+    columns = prepare_rows(columns, merge)
+    n_rows = count_rows(columns)
+
+    if n_rows > max_rows:
+        raise ValueError(f"Profile needs {n_rows} sequencer rows, "
+                         f"the sequencer table only holds {max_rows}")
+
+    return _compile_rows(columns, merge)
+
+
+def _compile_rows(columns: dict, merge: bool) -> dict:
+
+    columns = split_rows(columns)
+
+    if merge:
+        #merging can push repeats back over 16 bits
+        columns = split_rows(merge_rows(columns))
+
+    return {key: (value if key == "trigger"
+                  else np.asarray(value).astype(SEQ_COLUMN_DTYPES[key]))
+            for key, value in columns.items()}
+
+
+def compile_seq_chunks(columns: dict,
+                       merge: bool = True,
+                       max_rows: int = SEQ_MAX_ROWS) -> list[dict]:
+
+    """
+
+    Like compile_seq_table but for tables of any length, the compiled rows
+
+    are cut into chunks of at most max_rows-1 rows, leaving room for the
+
+    row add_handoff may need, to be run one after the other
+
+    """
+
+    columns = _compile_rows(prepare_rows(columns, merge), merge)
+    n_rows = len(columns["repeats"])
+    chunk_rows = max_rows-1
+
+    return [_take(columns, np.arange(start, min(start+chunk_rows, n_rows)))
+            for start in range(0, max(n_rows, 1), chunk_rows)]
+
+
+def add_handoff(columns: dict, trigger: SeqTrigger) -> dict:
+
+    """
+
+    Makes compiled columns wait for trigger before their first row. If the
+
+    first row already waits for a trigger of its own, a one row wait of
+
+    1 prescale unit with every output low is put in front of it
+
+    """
+
+    columns = dict(columns)
+    columns["trigger"] = list(columns["trigger"])
+
+    if columns["trigger"][0] == SeqTrigger.IMMEDIATE:
+        columns["trigger"][0] = trigger
+        return columns
+
+    handoff = {key: np.zeros(1, dtype=dtype)
+               for key, dtype in SEQ_COLUMN_DTYPES.items()}
+    handoff["repeats"][0] = 1
+    handoff["time1"][0] = 1
+
+    return {key: ([trigger, *value] if key == "trigger"
+                  else np.concatenate([handoff[key], value]))
+            for key, value in columns.items()}
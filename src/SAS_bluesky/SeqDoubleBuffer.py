@@ -0,0 +1,168 @@
+"""
+
+Running profiles too long for one sequencer table on two SEQ blocks
+
+The compiled table is cut into chunks (Profile.seq_chunks) which are run in
+turn on two sequencers, A and B, ping-pong fashion. While one block runs a
+chunk the next chunk is uploaded to the other, which is enabled straight
+away and holds on its first row until the running block goes inactive:
+
+- A.<handoff bit> = SEQ<B>.ACTIVE and B.<handoff bit> = SEQ<A>.ACTIVE
+- every chunk but the very first waits for <handoff bit>_0 before its
+  first row (SeqCompiler.add_handoff)
+
+so a chunk starts on the clock tick after the previous one ends, with no
+software in the loop at the boundary. As long as each chunk takes longer to
+run than to upload there is no dead time between chunks. If an upload is
+late the chunk starts as soon as it is enabled and the gap is reported.
+
+The PandA wiring must take the pulse triggers from both sequencers (eg
+through LUTs OR-ing SEQ1.OUTA and SEQ2.OUTA) for the outputs to follow
+whichever block is running, see DOUBLE_BUFFER_SEQS in the beamline config.
+
+"""
+
+import asyncio
+
+from ophyd_async.core import FlyerController, wait_for_value
+from ophyd_async.fastcs.panda import (
+    HDFPanda,
+    PandaBitMux,
+    PandaTimeUnits,
+    SeqTable,
+    SeqTrigger,
+)
+from pydantic import BaseModel, Field
+
+from SAS_bluesky.SeqCompiler import SEQ_COLUMN_DTYPES, add_handoff
+from SAS_bluesky.SeqUploads import upload_seq
+
+
+class DoubleBufferedSeqTableInfo(BaseModel):
+
+    """
+
+    The chunks of a SeqTable, run in order repeats times over
+
+    """
+
+    chunks: list[SeqTable] = Field(min_length=1)
+    repeats: int = Field(default=1, ge=1)
+    prescale_as_us: float = Field(default=1, ge=0) #microseconds
+
+
+def handoff_table(table: SeqTable, trigger: SeqTrigger) -> SeqTable:
+
+    columns = {name: getattr(table, name) for name in ("trigger", *SEQ_COLUMN_DTYPES)}
+
+    return SeqTable(**add_handoff(columns, trigger))
+
+
+class DoubleBufferedSeqTriggerLogic(FlyerController[DoubleBufferedSeqTableInfo]):
+
+    """
+
+    Runs the chunks of a DoubleBufferedSeqTableInfo on panda.seq[a] and
+
+    panda.seq[b] in turn. handoff_bit is the bit input of the SEQ blocks
+
+    given over to the handoff (BITA, BITB or BITC), it mustn't be used by
+
+    any pause trigger of the profile
+
+    """
+
+    def __init__(self,
+                 panda: HDFPanda,
+                 seq_numbers: tuple[int, int] = (1, 2),
+                 handoff_bit: str = "BITC"):
+
+        self.panda = panda
+        self.seq_numbers = tuple(int(n) for n in seq_numbers)
+        self.seqs = tuple(panda.seq[n] for n in self.seq_numbers)
+        self.handoff_bit = handoff_bit.upper()
+        self.handoff_trigger = SeqTrigger[f"{self.handoff_bit}_0"]
+
+        self.gaps: list[int] = [] #chunks which started late
+        self._order: list[SeqTable] = []
+        self._prescale = 1.0
+        self._feeder: asyncio.Task | None = None
+
+    async def _load(self, n: int):
+
+        seq = self.seqs[n % 2]
+        await seq.enable.set(PandaBitMux.ZERO)
+        await upload_seq(seq, self._order[n], 1, self._prescale, PandaTimeUnits.US)
+
+    async def prepare(self, value: DoubleBufferedSeqTableInfo):
+
+        for chunk in value.chunks:
+            if any(t.name.startswith(self.handoff_bit) for t in chunk.trigger):
+                raise ValueError(f"{self.handoff_bit} is used for the sequencer "
+                                 "handoff, it can't be a pause trigger")
+
+        handoff = [handoff_table(chunk, self.handoff_trigger) for chunk in value.chunks]
+        n_chunks = len(value.chunks)*value.repeats
+        self._order = [value.chunks[0]] + [handoff[n % len(handoff)]
+                                           for n in range(1, n_chunks)]
+        self._prescale = value.prescale_as_us
+        self.gaps = []
+
+        bit = self.handoff_bit.lower()
+        seq_a, seq_b = self.seqs
+        number_a, number_b = self.seq_numbers
+
+        await asyncio.gather(seq_a.enable.set(PandaBitMux.ZERO),
+                             seq_b.enable.set(PandaBitMux.ZERO),
+                             getattr(seq_a, bit).set(f"SEQ{number_b}.ACTIVE"),
+                             getattr(seq_b, bit).set(f"SEQ{number_a}.ACTIVE"))
+
+        await asyncio.gather(*[self._load(n) for n in range(min(2, len(self._order)))])
+
+    async def kickoff(self):
+
+        seq_a, seq_b = self.seqs
+
+        await seq_a.enable.set(PandaBitMux.ONE)
+        await wait_for_value(seq_a.active, True, timeout=1)
+
+        if len(self._order) > 1:
+            #holds on its first row until seq_a is done
+            await seq_b.enable.set(PandaBitMux.ONE)
+            self._feeder = asyncio.create_task(self._feed())
+
+    async def _feed(self):
+
+        for n in range(2, len(self._order)):
+
+            idle, running = self.seqs[n % 2], self.seqs[(n-1) % 2]
+
+            #idle has finished chunk n-2 and handed over to running
+            await wait_for_value(idle.active, False, timeout=None)
+            await self._load(n)
+            await idle.enable.set(PandaBitMux.ONE)
+
+            if not await running.active.get_value():
+                #chunk n-1 was over before chunk n was ready
+                self.gaps.append(n)
+                print(f"Sequencer chunk {n} was uploaded after chunk {n-1} "
+                      "finished, there was a gap between them")
+
+    async def complete(self):
+
+        if self._feeder is not None:
+            await self._feeder
+            self._feeder = None
+
+        await asyncio.gather(*[wait_for_value(seq.active, False, timeout=None)
+                               for seq in self.seqs])
+
+    async def stop(self):
+
+        if self._feeder is not None:
+            self._feeder.cancel()
+            self._feeder = None
+
+        await asyncio.gather(*[seq.enable.set(PandaBitMux.ZERO) for seq in self.seqs])
+        await asyncio.gather(*[wait_for_value(seq.active, False, timeout=1)
+                               for seq in self.seqs])
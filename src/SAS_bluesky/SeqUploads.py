@@ -0,0 +1,148 @@
+"""
+
+Record of the sequencer tables written to each PandA
+
+Writing a SeqTable makes the PandA reload the whole table, which is most of
+the setup time when the same profile is run again and again. Every upload
+made through upload_seq is recorded by the name of the SEQ block (eg
+"panda1-seq-1", so per PandA and per sequencer) as a sha256 of the table,
+repeats, prescale and prescale units. When the same settings are asked for
+again they are read back from the PandA, which is only gets, and if they
+still match nothing is written. A table changed by anything else (the web
+GUI, a restart) fails the readback and is written again.
+
+"""
+
+import asyncio
+import hashlib
+
+import numpy as np
+from ophyd_async.fastcs.panda import (
+    PandaBitMux,
+    PandaTimeUnits,
+    SeqTable,
+    SeqTableInfo,
+    SeqTrigger,
+    StaticSeqTableTriggerLogic,
+)
+
+from SAS_bluesky.SeqCompiler import SEQ_COLUMN_DTYPES
+
+#SEQ block name -> digest of the last settings written to it
+SEQ_UPLOADS: dict[str, str] = {}
+
+
+def seq_digest(table: SeqTable, repeats: int, prescale: float, prescale_units) -> str:
+
+    """
+
+    sha256 of a sequencer table and the settings it runs with, the same for
+
+    a table as built and as read back from the PandA
+
+    """
+
+    digest = hashlib.sha256()
+    units = PandaTimeUnits(prescale_units).value
+    digest.update(f"{int(repeats)}|{float(prescale)!r}|{units}".encode())
+
+    triggers = [SeqTrigger(t).name for t in table.trigger]
+    digest.update("|".join(triggers).encode())
+
+    for name, dtype in SEQ_COLUMN_DTYPES.items():
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(getattr(table, name), dtype=dtype).tobytes())
+
+    return digest.hexdigest()
+
+
+def forget_seq_uploads(prefix: str = ""):
+
+    """
+
+    Forgets the uploads to every SEQ block whose name starts with prefix,
+
+    eg after a PandA has been rebooted or had settings loaded
+
+    """
+
+    for name in [name for name in SEQ_UPLOADS if name.startswith(prefix)]:
+        del SEQ_UPLOADS[name]
+
+
+async def seq_is_current(seq, digest: str) -> bool:
+
+    """
+
+    True if digest was the last upload to seq and the PandA still has it
+
+    """
+
+    if SEQ_UPLOADS.get(seq.name) != digest:
+        return False
+
+    table, repeats, prescale, prescale_units = await asyncio.gather(
+        seq.table.get_value(),
+        seq.repeats.get_value(),
+        seq.prescale.get_value(),
+        seq.prescale_units.get_value())
+
+    if seq_digest(table, repeats, prescale, prescale_units) == digest:
+        return True
+
+    #changed behind our back, it has to be written again
+    del SEQ_UPLOADS[seq.name]
+
+    return False
+
+
+async def upload_seq(seq,
+                     table: SeqTable,
+                     repeats: int,
+                     prescale: float = 1,
+                     prescale_units=PandaTimeUnits.US,
+                     force: bool = False) -> bool:
+
+    """
+
+    Writes table, repeats and prescale to the SEQ block seq unless it
+
+    already has them. Returns True if anything was written
+
+    """
+
+    digest = seq_digest(table, repeats, prescale, prescale_units)
+
+    if not force and await seq_is_current(seq, digest):
+        return False
+
+    SEQ_UPLOADS.pop(seq.name, None)
+
+    await seq.prescale_units.set(PandaTimeUnits(prescale_units))
+    await asyncio.gather(seq.prescale.set(prescale),
+                         seq.repeats.set(repeats),
+                         seq.table.set(table))
+
+    SEQ_UPLOADS[seq.name] = digest
+
+    return True
+
+
+class CachedSeqTableTriggerLogic(StaticSeqTableTriggerLogic):
+
+    """
+
+    StaticSeqTableTriggerLogic which only writes the table, repeats and
+
+    prescale if they differ from what the sequencer already has
+
+    """
+
+    async def prepare(self, value: SeqTableInfo):
+
+        await self.seq.enable.set(PandaBitMux.ZERO)
+        await upload_seq(self.seq,
+                         value.sequence_table,
+                         value.repeats,
+                         value.prescale_as_us,
+                         PandaTimeUnits.US)
@@ -58,6 +58,11 @@ PULSE_CONNECTIONS = {1: [TTLOUT[1]],
 
 DEADTIME_BUFFER = 20e-6 #Buffer added to deadtime to handle minor discrepencies between detector and panda clocks #noqa
 DEFAULT_SEQ = 2 #default sequencer is this one, b21 currently uses seq 1 for somthing else #noqa
+#profiles too long for one sequencer table are run on these two sequencers in turn,
+#eg (1, 2). Needs the pulse triggers wired to both sequencers (SEQ1.OUTx OR SEQ2.OUTx)
+#None runs everything on DEFAULT_SEQ, see SeqDoubleBuffer
+DOUBLE_BUFFER_SEQS = None
+SEQ_HANDOFF_BIT = "BITC" #given over to the handoff between the two sequencers
 GENERAL_TIMEOUT = 30 #seconds before each wait times out
 
 CONFIG_NAME = "PandaTriggerWithCounterAndPCAP"
@@ -1,12 +1,11 @@
 import os #noqa
-from enum import Enum
+import asyncio
 from datetime import datetime
 from pathlib import Path
 from typing import Annotated
 import numpy as np
 from importlib import import_module
 
-from pydantic_core import from_json
 from pydantic import validate_call #,NonNegativeFloat,
 
 
@@ -23,23 +22,19 @@ from ophyd_async.core import (
     DetectorTrigger,
     StandardFlyer,
     TriggerInfo,
-    wait_for_value,
     AsyncStatus,
     StandardDetector)
 
 
 from ophyd_async.fastcs.panda import (
     HDFPanda,
-    SeqTableInfo,
-    StaticSeqTableTriggerLogic)
+    SeqTableInfo)
 #     PandaPcompDirection,
 #     PcompInfo,
 #     SeqTrigger,
 #     SeqTable,
 # )
 
-from ophyd_async.plan_stubs import (ensure_connected,
-                                    get_current_settings)
 
 
 # from dodal.beamlines.i22 import saxs, waxs, i0, it, TetrammDetector, panda1
@@ -52,12 +47,34 @@ from dodal.common.beamlines.beamline_utils import (
 
 from SAS_bluesky.ProfileGroups import (Profile,
                            ProfileLoader) # Group
-
+from SAS_bluesky.ProfileChecks import check_profile
+from SAS_bluesky.SeqCompiler import SEQ_MAX_ROWS
+from SAS_bluesky.SeqDoubleBuffer import (DoubleBufferedSeqTableInfo,
+                                         DoubleBufferedSeqTriggerLogic)
+from SAS_bluesky.SeqUploads import (CachedSeqTableTriggerLogic,
+                                    forget_seq_uploads,
+                                    upload_seq)
+
+from SAS_bluesky.stubs.ConnectStubs import (DevicesNotConnected,
+                                            connect_devices,
+                                            format_connection_results)
 from SAS_bluesky.stubs.PandAStubs import (return_connected_device,
-                                  make_beamline_devices,
-                                  fly_and_collect_with_wait,
-                                  load_settings_from_yaml,
-                                  upload_yaml_to_panda)
+                                  get_beamline_devices,
+                                  forget_beamline_devices,
+                                  load_settings_from_yaml)
+from SAS_bluesky.stubs.SettingsStubs import (apply_settings_diff,
+                                             format_settings_diff,
+                                             preload_settings_yamls)
+from SAS_bluesky.stubs.TriggerStubs import (PANDA,
+                                            PreparedTriggering,
+                                            format_dead_times,
+                                            rearm_panda_triggering,  # noqa: F401
+                                            repeat_prepared_triggering,
+                                            set_pulse_enables,
+                                            stage_and_prepare_detectors,
+                                            trigger_and_collect,
+                                            update_path_provider,
+                                            wait_until_complete)
 
 # from stubs.PandAStubs import save_device_to_yaml, return_module_name
 
@@ -69,29 +86,14 @@ DEADTIME_BUFFER = BL_config.DEADTIME_BUFFER
 DEFAULT_SEQ = BL_config.DEFAULT_SEQ
 GENERAL_TIMEOUT = BL_config.GENERAL_TIMEOUT
 PULSEBLOCKS = BL_config.PULSEBLOCKS
+DOUBLE_BUFFER_SEQS = BL_config.DOUBLE_BUFFER_SEQS
+SEQ_HANDOFF_BIT = BL_config.SEQ_HANDOFF_BIT
 CONFIG_NAME = BL_config.CONFIG_NAME
 
-
-class PANDA(Enum):
-    Enable = "ONE"
-    Disable = "ZERO"
-
-
-
-def wait_until_complete(pv_obj, waiting_value=0, timeout=None):
-    """
-    An async wrapper for the ophyd async wait_for_value function,
-    to allow it to run inside the bluesky run engine
-    Typical use case is waiting for an active pv to change to 0,
-    indicating that the run has finished, which then allows the
-    run plan to disarm all the devices.
-    """
-
-    async def _wait():
-        await wait_for_value(pv_obj, waiting_value, timeout=timeout)
-
-    yield from bps.wait_for([_wait])
-
+#this is the directory where the yaml files are stored
+PANDA_YAML_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)),"ophyd_panda_yamls") #noqa
+#parsed once when the plans are loaded, not on every configure
+preload_settings_yamls(PANDA_YAML_DIRECTORY)
 
 
 def set_experiment_directory(beamline: str, visit_path: Path):
@@ -107,12 +109,16 @@ def set_experiment_directory(beamline: str, visit_path: Path):
         )
     )
 
-    suffix = datetime.now().strftime("_%Y%m%d%H%M%S")
+    yield from new_data_collection(visit_path)
+
 
-    async def set_panda_dir():
-        await get_path_provider().update(directory=visit_path, suffix=suffix)
+def new_data_collection(visit_path: Path | str):
+
+    """
+    Asks the path provider for new file names, each run needs its own files
+    """
 
-    yield from bps.wait_for([set_panda_dir])
+    yield from update_path_provider(get_path_provider(), visit_path)
 
 
 
@@ -132,13 +138,13 @@ def modify_panda_seq_table(panda: HDFPanda, profile: Profile, n_seq=1):
     n_cycles = profile.cycles
     # time_unit = profile.best_time_unit
 
-    group = "modify-seq"
-    # yield from bps.stage(panda, group=group) ###maybe need this
-    yield from bps.abs_set(panda.seq[int(n_seq)].table, seq_table, group=group)
-    yield from bps.abs_set(panda.seq[int(n_seq)].repeats, n_cycles, group=group)
-    yield from bps.abs_set(panda.seq[int(n_seq)].prescale, 1, group=group)
-    yield from bps.abs_set(panda.seq[int(n_seq)].prescale_units, 's', group=group)
-    yield from bps.wait(group=group, timeout=GENERAL_TIMEOUT)
+    #nothing is written if the sequencer already has this table
+    async def _upload():
+        await asyncio.wait_for(upload_seq(panda.seq[int(n_seq)], seq_table, n_cycles,
+                                          prescale=1, prescale_units="s"),
+                               timeout=GENERAL_TIMEOUT)
+
+    yield from bps.wait_for([_upload])
 
 
 def set_pulses(panda: HDFPanda,
@@ -180,12 +186,8 @@ def arm_panda_pulses(panda: HDFPanda, pulses: list | None, n_seq=1, group="arm_p
     # yield from wait_until_complete(panda.seq[n_seq].enable, PANDA.Enable.value)
 
 
-    for n_pulse in pulses:
-        yield from bps.abs_set(panda.pulse[int(n_pulse)].enable,
-                               PANDA.Enable.value,
-                               group=group)  # type: ignore
-
-    yield from bps.wait(group=group, timeout=GENERAL_TIMEOUT)
+    yield from set_pulse_enables(panda, pulses, PANDA.Enable.value,
+                                 group=group, timeout=GENERAL_TIMEOUT)
 
 
 
@@ -207,12 +209,8 @@ def disarm_panda_pulses(panda: HDFPanda, pulses: list | None, n_seq = 1, group="
     if isinstance(pulses, int):
         pulses = list(range(PULSEBLOCKS)+1)
 
-    for n_pulse in pulses:
-        yield from bps.abs_set(panda.pulse[n_pulse].enable,
-                               PANDA.Disable.value,
-                               group=group)
-
-    yield from bps.wait(group=group, timeout=GENERAL_TIMEOUT)
+    yield from set_pulse_enables(panda, pulses, PANDA.Disable.value,
+                                 group=group, timeout=GENERAL_TIMEOUT)
 
 
 
@@ -261,27 +259,6 @@ def disable_sequencer(panda: HDFPanda, n_seq: int = 1,  wait: bool = False, grou
 
 
 
-def stage_and_prepare_detectors(detectors: list,
-                                flyer: StandardFlyer,
-                                trigger_info: TriggerInfo,
-                                group="det_atm"):
-
-    """
-
-    Iterates through all of the detectors specified and prepares them.
-
-    """
-
-    yield from bps.stage_all(*detectors, flyer, group=group)
-
-    for det in detectors:
-        ###this tells the detector how may triggers to expect and sets the CAN aquire on
-        yield from bps.prepare(det, trigger_info, wait=False, group=group)
-
-    yield from bps.wait(group=group, timeout=GENERAL_TIMEOUT)
-
-
-
 def return_deadtime(detectors: list, exposure=1) -> np.ndarray:
 
     """
@@ -378,9 +355,9 @@ def check_and_apply_panda_settings(panda: HDFPanda, panda_name: str) -> MsgGener
 
     Checks the settings currently on the PandA
 
-    - if different they will be overwritten with the ones
+    - any which differ will be overwritten with the ones
 
-    specified in the CONFIG_NAME
+    specified in the CONFIG_NAME, the rest are left alone
 
     Settings may have changed due to Malcolm or
 
@@ -390,23 +367,20 @@ def check_and_apply_panda_settings(panda: HDFPanda, panda_name: str) -> MsgGener
 
     """
 
-    #this is the directory where the yaml files are stored
-    yaml_directory = os.path.join(os.path.dirname(os.path.realpath(__file__)),"ophyd_panda_yamls") #noqa
+    yaml_directory = PANDA_YAML_DIRECTORY
     yaml_file_name = f"{BL}_{CONFIG_NAME}_{panda_name}"
 
-    current_panda_settings = yield from get_current_settings(panda)
     yaml_settings = yield from load_settings_from_yaml(yaml_directory, yaml_file_name)
 
-    if current_panda_settings.__dict__ != yaml_settings.__dict__:
-        print("Current Panda settings do not match the yaml settings, loading yaml settings to panda") #noqa
-        LOGGER.info("Current Panda settings do not match the yaml settings, loading yaml settings to panda")  #noqa
+    #only the signals which differ are written, units first then the rest in parallel
+    diff = yield from apply_settings_diff(panda, yaml_settings)
 
-        print(f"{yaml_file_name}.yaml has been uploaded to PandA")
-        LOGGER.info(f"{yaml_file_name}.yaml has been uploaded to PandA")
-        ######### make sure correct yaml is loaded
-        yield from upload_yaml_to_panda(yaml_directory=yaml_directory,
-                                        yaml_file_name=yaml_file_name,
-                                        panda=panda)
+    if diff:
+        print(f"{len(diff)} PandA settings differ from {yaml_file_name}.yaml, applying them:") #noqa
+        print(format_settings_diff(diff))
+        LOGGER.info(f"{len(diff)} PandA settings differ from {yaml_file_name}.yaml, applying them:\n{format_settings_diff(diff)}") #noqa
+        #the yaml may have changed the sequencers
+        forget_seq_uploads(f"{panda.name}-")
 
 
 def check_tetramm():
@@ -471,7 +445,8 @@ def configure_panda_triggering(beamline: Annotated[str, "Name of the beamline to
     active_detector_names: Annotated[list, "List of str of the detector names, eg. saxs, waxs, i0, it"] = ["saxs","waxs"], #noqa
     run_immediately: bool = True,
     panda_name="panda1",
-    force_load=True) -> MsgGenerator[None]:
+    force_load=True,
+    save_frame_index: Annotated[bool, "Write the planned timing of every frame (Profile.write_frame_index) next to the data"] = False) -> MsgGenerator[PreparedTriggering]: #noqa
 
 
     """
@@ -482,16 +457,23 @@ def configure_panda_triggering(beamline: Annotated[str, "Name of the beamline to
 
     settings and then may or may not run the flyscanning
 
+    Returns the PreparedTriggering, to run the same profile again
+
+    with rearm_panda_triggering
+
     """
 
     if isinstance(profile, str):
-        #convert from json to Profile object
-        profile = Profile.model_validate(from_json(profile, allow_partial=True))
+        #convert from json (Profile.to_wire) to Profile object
+        profile = Profile.from_wire(profile)
     elif isinstance(profile, Profile):
         pass
     else:
         raise TypeError("Profile must be a Profile object or a json string of a Profile object") #noqa
 
+    #reject a profile the hardware can't run before connecting to anything
+    max_rows = None if DOUBLE_BUFFER_SEQS else SEQ_MAX_ROWS
+    check_profile(profile, n_pulses=PULSEBLOCKS, max_rows=max_rows).raise_for_errors()
 
     visit_path = os.path.join(f"/dls/{beamline}/data",str(datetime.now().year), experiment) #noqa
 
@@ -500,15 +482,16 @@ def configure_panda_triggering(beamline: Annotated[str, "Name of the beamline to
 
     yield from set_experiment_directory(beamline, visit_path)
 
-    #could this be done faster with make_devices instead of make_all_devices?
-    beamline_devices = make_beamline_devices(beamline)
-    panda = beamline_devices[panda_name]
+    if save_frame_index:
+        frame_index_path = os.path.join(visit_path, f"{panda_name}_frame_index{datetime.now():_%Y%m%d%H%M%S}.npy") #noqa
+        try:
+            profile.write_frame_index(frame_index_path)
+            LOGGER.info(f"Frame index written to {frame_index_path}")
+        except OSError as e:
+            LOGGER.warning(f"Could not write frame index {frame_index_path}: {e}")
 
-    try:
-        yield from ensure_connected(panda) #ensure the panda is connected
-    except Exception as e:
-        LOGGER.error(f"Failed to connect to PandA: {e}")
-        raise
+    #only the devices needed, made once per process and reused by every later run
+    panda = get_beamline_devices(beamline, [panda_name])[panda_name]
 
     ####################
     # v CHECK TO SEE IF THIS CAN BE PERFORMED IN A SMARTER WAY v
@@ -519,26 +502,38 @@ def configure_panda_triggering(beamline: Annotated[str, "Name of the beamline to
     except Exception as e:
         LOGGER.error(f"Failed to inject active detectors: {e}")
         ###must be a tuple to be hashable and therefore work with bps.stage_all or whatever #noqa
+        beamline_devices = get_beamline_devices(beamline, active_detector_names)
         active_detectors = tuple([beamline_devices[det_name] for det_name in active_detector_names])#noqa
     ######################
 
     print("\n",active_detectors,"\n")
     LOGGER.info("\n",active_detectors,"\n")
 
-    for device, device_name in zip(active_detectors,
-                                   active_detector_names,
-                                   strict=True):
-        try:
-            yield from ensure_connected(device)
-            print(f"{device_name} is connected")
-        except Exception as e:
-            LOGGER.error(f"{device} not connected: {e}")
-            raise
+    #the panda and every detector connect at once, within one GENERAL_TIMEOUT
+    devices = {panda_name: panda, **dict(zip(active_detector_names, active_detectors, strict=True))} #noqa
+    try:
+        connections = yield from connect_devices(devices, timeout=GENERAL_TIMEOUT)
+    except DevicesNotConnected as e:
+        LOGGER.error(f"Devices not connected:\n{format_connection_results(e.results)}")
+        #make them again next time
+        forget_beamline_devices(beamline, [name for name, result in e.results.items() if not result.connected]) #noqa
+        raise
+
+    print(format_connection_results(connections))
 
     detector_deadtime = return_deadtime(detectors=active_detectors,
                                         exposure=profile.duration)
 
     max_deadtime = max(detector_deadtime)
+
+    #and again now the detector deadtimes are known, before the panda is changed
+    report = check_profile(profile,
+                           deadtime=dict(zip(active_detector_names, detector_deadtime, strict=True)), #noqa
+                           n_pulses=PULSEBLOCKS,
+                           max_rows=max_rows)
+    if not report.ok:
+        LOGGER.error("\n".join(report.messages()))
+        report.raise_for_errors()
     # show_deadtime(detector_deadtime, max_deadtime)
 
     #load Panda setting to panda
@@ -549,17 +544,22 @@ def configure_panda_triggering(beamline: Annotated[str, "Name of the beamline to
     active_pulses = profile.active_out+1
     n_cycles = profile.cycles
     #seq table should be grabbed from the panda and used instead, in order to decouple run from setup panda #noqa
-    seq_table = profile.seq_table()
-    n_triggers = [group.frames for group in profile.groups] #[3, 1, 1, 1, 1] or something #noqa
+    #too long for one sequencer, run it in chunks on both
+    double_buffer = DOUBLE_BUFFER_SEQS is not None and report.seq_rows > SEQ_MAX_ROWS
+    #frames of every group for every cycle, [3, 1, 1, 1, 1, 3, 1, ...] or something
+    n_triggers = profile.trigger_events().tolist()
     duration = profile.duration
 
     ############################################################
     # ###setup triggering of detectors
-    table_info = SeqTableInfo(sequence_table=seq_table, repeats=n_cycles)
+    if double_buffer:
+        table_info = DoubleBufferedSeqTableInfo(chunks=profile.seq_chunks(), repeats=n_cycles) #noqa
+    else:
+        table_info = SeqTableInfo(sequence_table=profile.seq_table(), repeats=n_cycles)
 
 
     #set up trigger info etc
-    trigger_info = TriggerInfo(number_of_events = n_triggers*n_cycles,
+    trigger_info = TriggerInfo(number_of_events = n_triggers,
                             trigger=DetectorTrigger.CONSTANT_GATE, # or maybe EDGE_TRIGGER #noqa
                             deadtime=max_deadtime,
                             livetime=np.amax(profile.duration_per_cycle),
@@ -569,54 +569,88 @@ def configure_panda_triggering(beamline: Annotated[str, "Name of the beamline to
 
     ############################################################
     #flyer and prepare fly, sets the sequencers table
-    trigger_logic = StaticSeqTableTriggerLogic(panda.seq[DEFAULT_SEQ])
+    if double_buffer:
+        trigger_logic = DoubleBufferedSeqTriggerLogic(panda, DOUBLE_BUFFER_SEQS, SEQ_HANDOFF_BIT) #noqa
+    else:
+        trigger_logic = CachedSeqTableTriggerLogic(panda.seq[DEFAULT_SEQ])
     flyer = StandardFlyer(trigger_logic)
 
     # ####stage the detectors, the flyer, the panda
-    #setup triggering on panda - changes the sequence table - wait otherwise risking _context missing error #noqa
+    #setup triggering on panda - changes the sequence table, unless it is already loaded - wait otherwise risking _context missing error #noqa
     yield from bps.prepare(flyer, table_info, wait=True)
 
     ###change the sequence table
     # this is the last thing setting up the panda
-    yield from stage_and_prepare_detectors(active_detectors, flyer, trigger_info)
+    yield from stage_and_prepare_detectors(active_detectors, flyer, trigger_info,
+                                           timeout=GENERAL_TIMEOUT)
 
     if run_immediately:
-        yield from run_panda_triggering(panda, active_detectors, active_pulses)
+        yield from run_panda_triggering(panda, active_detectors, active_pulses, flyer=flyer)
+
+    return PreparedTriggering(panda, active_detectors, active_pulses, flyer,
+                              table_info, trigger_info, visit_path,
+                              path_provider=get_path_provider(),
+                              n_seq=DEFAULT_SEQ,
+                              timeout=GENERAL_TIMEOUT)
 
 
 @bpp.run_decorator() #    # open/close run
 @validate_call(config={"arbitrary_types_allowed": True})
 def run_panda_triggering(panda: HDFPanda,
                          active_detectors,
-                         active_pulses, group="run") -> MsgGenerator[None]:
+                         active_pulses, group="run",
+                         flyer: StandardFlyer | None = None) -> MsgGenerator[None]:
 
     """
 
     This will run whatever flyscanning settings
-    are currenly loaded on the PandA and start it triggering
+    are currenly loaded on the PandA and start it triggering,
+    with the flyer that was prepared if there is one
 
     """
     #flyer and prepare fly, sets the sequencers table
-    trigger_logic = StaticSeqTableTriggerLogic(panda.seq[DEFAULT_SEQ])
-    flyer = StandardFlyer(trigger_logic)
+    if flyer is None:
+        trigger_logic = CachedSeqTableTriggerLogic(panda.seq[DEFAULT_SEQ])
+        flyer = StandardFlyer(trigger_logic)
 
-    ##########################
-    #arm the panda pulses
-    yield from arm_panda_pulses(panda=panda, pulses=active_pulses)
+    yield from trigger_and_collect(panda, active_detectors, active_pulses, flyer,
+                                   n_seq=DEFAULT_SEQ, timeout=GENERAL_TIMEOUT)
 
-    ###########################
-    yield from fly_and_collect_with_wait(
-        stream_name='primary',
-        detectors=active_detectors,
-        flyer=flyer,
-    )
-    ##########################
-    ###########################
-    ####start diabling and unstaging everything
-    yield from wait_until_complete(panda.seq[DEFAULT_SEQ].active, False)
-    #start set to false because currently don't actually want to collect data
-    yield from disarm_panda_pulses(panda=panda, pulses=active_pulses)
-    yield from bps.unstage_all(*active_detectors, flyer)  #stops the hdf capture mode
+
+@validate_call(config={"arbitrary_types_allowed": True})
+def repeat_panda_triggering(beamline: Annotated[str, "Name of the beamline to run the scan on eg. i22 or b21."], #noqa
+    experiment: Annotated[str, "Experiment name eg. cm12345. This will go into /dls/data/beamline/experiment"], #noqa
+    profile: Annotated[Profile | str, "Profile or json of a Profile containing the infomation required to setup the panda, triggers, times etc"], #noqa
+    n_runs: Annotated[int, "Number of times to run the profile, each run has its own files and run number"] = 2, #noqa
+    active_detector_names: Annotated[list, "List of str of the detector names, eg. saxs, waxs, i0, it"] = ["saxs","waxs"], #noqa
+    panda_name="panda1",
+    force_load=True) -> MsgGenerator[list[dict[str, float]]]:
+
+    """
+
+    Runs the same profile n_runs times back to back. Everything is set up once
+
+    by configure_panda_triggering, between runs only rearm_panda_triggering is
+
+    done. Returns, and logs, the dead time between the end of each run
+
+    (sequencer finished) and the kickoff of the next, along with its stages
+
+    """
+
+    prepared = yield from configure_panda_triggering(beamline, experiment, profile,
+                                                     active_detector_names=active_detector_names, #noqa
+                                                     run_immediately=False,
+                                                     panda_name=panda_name,
+                                                     force_load=force_load)
+
+    dead_times = yield from repeat_prepared_triggering(prepared, n_runs)
+
+    report = format_dead_times(dead_times)
+    print(report)
+    LOGGER.info(f"Dead time between {n_runs} runs of the profile:\n{report}")
+
+    return dead_times
 
 
 
@@ -653,7 +687,7 @@ if __name__ == "__main__":
     profile = configuration.profiles[1]
     # RE(setup_panda("i22", "cm40643-3/bluesky", profile, active_detector_names=["saxs", "waxs", "i0", "it"], force_load=False)) ) #noqa
 
-    # for i in range(20):
+    # RE(repeat_panda_triggering("i22", "cm40643-3/bluesky", profile, n_runs=20, active_detector_names=["saxs", "waxs", "i0", "it"], force_load=False)) #noqa
 
     RE(configure_panda_triggering("i22", "cm40643-3/bluesky", profile, active_detector_names=["saxs", "waxs", "i0", "it"], force_load=False)) #noqa
 
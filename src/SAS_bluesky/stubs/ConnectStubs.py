@@ -0,0 +1,134 @@
+"""
+
+Connecting several devices at once
+
+connect_devices connects every device concurrently against one shared
+deadline, so setup takes as long as the slowest device rather than the sum
+of all of them. Each device gets a ConnectionResult (connected, seconds,
+error) and if any fails the rest are cancelled and a DevicesNotConnected
+listing every failure is raised straight away.
+
+"""
+
+import asyncio
+import time
+from collections.abc import Mapping
+from typing import NamedTuple
+
+from bluesky.utils import MsgGenerator
+from ophyd_async.core import DEFAULT_TIMEOUT, Device, NotConnected
+from ophyd_async.plan_stubs._wait_for_awaitable import wait_for_awaitable
+
+
+class ConnectionResult(NamedTuple):
+
+    name: str
+    connected: bool
+    seconds: float
+    error: Exception | None = None
+
+
+class DevicesNotConnected(NotConnected):
+
+    """
+
+    NotConnected for every device which failed, results holds the
+
+    ConnectionResult of every device
+
+    """
+
+    def __init__(self, results: dict[str, ConnectionResult]):
+
+        self.results = results
+        super().__init__({name: result.error for name, result in results.items()
+                          if not result.connected})
+
+
+def format_connection_results(results: Mapping[str, ConnectionResult]) -> str:
+
+    lines = [f"{'device':<20} {'connected':<10} {'seconds':>8}  error"]
+
+    for result in results.values():
+        error = "" if result.error is None else f"{type(result.error).__name__}: {result.error}".strip() #noqa
+        lines.append(f"{result.name:<20} {str(result.connected):<10} {result.seconds:>8.3f}  {error}") #noqa
+
+    return "\n".join(lines)
+
+
+async def connect_concurrently(devices: Mapping[str, Device],
+                               timeout: float = DEFAULT_TIMEOUT,
+                               fail_fast: bool = True,
+                               mock: bool = False,
+                               force_reconnect: bool = False) -> dict[str, ConnectionResult]: #noqa
+
+    """
+
+    Connects every device of devices (name: device) at the same time, all
+
+    within timeout seconds of the start. Returns the ConnectionResult of
+
+    every device, or raises DevicesNotConnected if any failed. With
+
+    fail_fast the first failure cancels the devices still connecting
+
+    """
+
+    start = time.monotonic()
+    deadline = start + timeout
+    results: dict[str, ConnectionResult] = {}
+
+    async def connect(name, device):
+        await device.connect(mock=mock, timeout=timeout, force_reconnect=force_reconnect)
+        return name
+
+    tasks = {asyncio.create_task(connect(name, device)): name for name, device in devices.items()} #noqa
+    pending = set(tasks)
+    failed = False
+
+    while pending and not (failed and fail_fast):
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+
+        done, pending = await asyncio.wait(pending, timeout=remaining,
+                                           return_when=asyncio.FIRST_COMPLETED)
+
+        for task in done:
+            name = tasks[task]
+            error = None if task.cancelled() else task.exception()
+            results[name] = ConnectionResult(name, error is None, time.monotonic()-start, error) #noqa
+            failed |= error is not None
+
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    for task in pending:
+        name = tasks[task]
+        reason = "another device failed to connect" if failed else f"not connected within {timeout} s" #noqa
+        results[name] = ConnectionResult(name, False, time.monotonic()-start, TimeoutError(reason)) #noqa
+
+    #in the order they were given
+    results = {name: results[name] for name in devices}
+
+    if not all(result.connected for result in results.values()):
+        raise DevicesNotConnected(results)
+
+    return results
+
+
+def connect_devices(devices: Mapping[str, Device],
+                    timeout: float = DEFAULT_TIMEOUT,
+                    fail_fast: bool = True) -> MsgGenerator[dict[str, ConnectionResult]]:
+
+    """
+
+    Plan stub of connect_concurrently, returns the ConnectionResult of every device
+
+    """
+
+    results = yield from wait_for_awaitable(connect_concurrently(devices, timeout, fail_fast)) #noqa
+
+    return results
@@ -0,0 +1,127 @@
+"""
+
+Process wide cache of beamline devices
+
+Making every device of a beamline module (make_all_devices) each time a plan
+runs is slow and mostly wasted, a plan only needs the PandA and a few
+detectors. DeviceRegistry makes only the devices asked for, with their
+dependencies, and keeps them for later calls, so a repeated plan doesn't
+construct any devices at all. Devices are only made again once they are
+invalidated, eg after failing to connect or being restarted.
+
+The registry remembers which devices it has connected. Asking for a device
+with connect_immediately=True connects it first if it was cached by a call
+that didn't connect it, so a caller asking for a connected device always
+gets one.
+
+"""
+
+import threading
+from collections.abc import Callable, Iterable
+
+from bluesky.run_engine import call_in_bluesky_event_loop
+from ophyd_async.core import DEFAULT_TIMEOUT, Device
+
+#(dodal beamline module, device name, **kwargs) -> {name: device} of the device and its dependencies #noqa
+DeviceFactory = Callable[..., dict[str, Device]]
+
+
+def connect_in_bluesky_event_loop(device: Device, timeout: float = DEFAULT_TIMEOUT):
+
+    """
+    Connects device from outside a plan, as make_device(connect_immediately=True) does
+    """
+
+    call_in_bluesky_event_loop(device.connect(timeout=timeout))
+
+
+class DeviceRegistry:
+
+    """
+
+    Devices by (beamline, device name), made with factory when first asked for
+
+    """
+
+    def __init__(self,
+                 factory: DeviceFactory,
+                 module_name: Callable[[str], str] = str,
+                 connect: Callable[[Device], None] = connect_in_bluesky_event_loop):
+
+        self.factory = factory
+        self.module_name = module_name
+        self.connect = connect
+        self._devices: dict[tuple[str, str], Device] = {}
+        #keys of the devices connected by the registry
+        self._connected: set[tuple[str, str]] = set()
+        self._lock = threading.RLock()
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        return key in self._devices
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def is_connected(self, beamline: str, device_name: str) -> bool:
+        return (beamline, device_name) in self._connected
+
+    def get(self,
+            beamline: str,
+            device_names: Iterable[str],
+            connect_immediately: bool = False,
+            **factory_kwargs) -> dict[str, Device]:
+
+        """
+
+        Returns {name: device} for device_names, making (with factory_kwargs)
+
+        only those which aren't already cached. With connect_immediately
+
+        new devices are made connected and cached ones which haven't been
+
+        connected yet are connected
+
+        """
+
+        device_names = list(device_names)
+
+        with self._lock:
+            for name in device_names:
+                key = (beamline, name)
+
+                if key not in self._devices:
+                    made = self.factory(self.module_name(beamline), name,
+                                        connect_immediately=connect_immediately,
+                                        **factory_kwargs)
+                    for made_name, device in made.items():
+                        #dependencies already cached are kept, they are the same device
+                        made_key = (beamline, made_name)
+                        if self._devices.setdefault(made_key, device) is device and connect_immediately: #noqa
+                            self._connected.add(made_key)
+
+                if connect_immediately and key not in self._connected:
+                    self.connect(self._devices[key])
+                    self._connected.add(key)
+
+            return {name: self._devices[(beamline, name)] for name in device_names}
+
+    def invalidate(self, beamline: str | None = None, device_names: Iterable[str] | None = None): #noqa
+
+        """
+
+        Forgets devices so they are made again, every device if beamline is
+
+        None, otherwise those of beamline (all of them if device_names is None)
+
+        """
+
+        device_names = None if device_names is None else set(device_names)
+
+        with self._lock:
+            for key in list(self._devices):
+                if beamline is not None and key[0] != beamline:
+                    continue
+                if device_names is not None and key[1] not in device_names:
+                    continue
+                del self._devices[key]
+                self._connected.discard(key)
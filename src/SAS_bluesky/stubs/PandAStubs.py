@@ -1,37 +1,33 @@
-from bluesky.utils import MsgGenerator, short_uid
+from bluesky.utils import MsgGenerator
 import bluesky.plan_stubs as bps
 
 
-from ophyd_async.core import (
-    StandardDetector,
-    StandardFlyer,
-    YamlSettingsProvider)
-
-
 from ophyd_async.plan_stubs._wait_for_awaitable import wait_for_awaitable
 from ophyd_async.plan_stubs import (apply_panda_settings, 
 									retrieve_settings, 
 									store_settings)
 
-from ophyd_async.fastcs.panda import (
-    HDFPanda,
-    SeqTableInfo,
-    PcompInfo
-)
+from ophyd_async.fastcs.panda import HDFPanda
 
 from dodal.beamlines import module_name_for_beamline
-from dodal.utils import make_device, make_all_devices
+from dodal.utils import make_device
 
 from dodal.devices.oav.oav_detector import OAV
 from dodal.devices.oav.oav_parameters import OAVParameters
 from dodal.devices.areadetector.plugins.CAM import ColorMode
 
+from SAS_bluesky.SeqUploads import forget_seq_uploads
+from SAS_bluesky.stubs.DeviceRegistry import DeviceRegistry
+from SAS_bluesky.stubs.SettingsStubs import CachedYamlSettingsProvider
+
 
 
 
 def return_connected_device(beamline: str, device_name: str):
     """
     Connect to a device on the specified beamline and return the connected device.
+    The device is only made the first time, see DEVICE_REGISTRY, and connected
+    the first time it is asked for here.
 
     Args:
         beamline (str): Name of the beamline.
@@ -40,8 +36,7 @@ def return_connected_device(beamline: str, device_name: str):
     Returns:
         StandardDetector: The connected device.
     """
-    module_name = module_name_for_beamline(beamline)
-    devices = make_device(f"dodal.beamlines.{module_name}", device_name, connect_immediately=True)
+    devices = DEVICE_REGISTRY.get(beamline, [device_name], connect_immediately=True)
     return devices[device_name]
 
 
@@ -54,64 +49,38 @@ def return_module_name(beamline: str) -> str:
     return f"dodal.beamlines.{module_name}"
 
 
-def make_beamline_devices(beamline: str) -> list:
-    
-    """
-    Takes the name of a beamline and async creates all the devices for a beamline, whether they are connected or not. 
-    """
+#devices made so far by this process, see get_beamline_devices
+DEVICE_REGISTRY = DeviceRegistry(make_device, module_name=return_module_name)
 
-    module = return_module_name(beamline)
-    beamline_devices = make_all_devices(module)[0]
 
-    return beamline_devices
+def get_beamline_devices(beamline: str, device_names: list[str]) -> dict:
 
+    """
+    Returns {name: device} for only the named devices of a beamline, made the first
+    time they are asked for and cached for every later call. They are not connected.
+    """
 
-def fly_and_collect_with_wait(
-    stream_name: str,
-    flyer: StandardFlyer[SeqTableInfo] | StandardFlyer[PcompInfo],
-    detectors: list[StandardDetector],
-):
-    """Kickoff, complete and collect with a flyer and multiple detectors and wait breifly.
+    return DEVICE_REGISTRY.get(beamline, device_names)
 
-    This stub takes a flyer and one or more detectors that have been prepared. It
-    declares a stream for the detectors, then kicks off the detectors and the flyer.
-    The detectors are collected until the flyer and detectors have completed.
 
-    see also from ophyd_async.plan_stubs import fly_and_collect
+def forget_beamline_devices(beamline: str | None = None,
+                            device_names: list[str] | None = None):
 
     """
-    yield from bps.declare_stream(*detectors, name=stream_name, collect=True)
-    yield from bps.kickoff(flyer, wait=True)
-    for detector in detectors:
-        yield from bps.kickoff(detector)
-
-    # collect_while_completing
-    group = short_uid(label="complete")
-
-    yield from bps.complete(flyer, wait=False, group=group)
-    for detector in detectors:
-        yield from bps.complete(detector, wait=False, group=group)
-
-    done = False
-    while not done:
-        try:
-            yield from bps.wait(group=group, timeout=1)
-        except TimeoutError:
-            pass
-        else:
-            done = True
-        yield from bps.collect(
-            *detectors,
-            return_payload=False,
-            name=stream_name,
-        )
-    yield from bps.wait(group=group)
-    yield from bps.sleep(2)
-    
+    Drops devices from DEVICE_REGISTRY so they are made again next time, all of them
+    if no beamline is given
+    """
+
+    DEVICE_REGISTRY.invalidate(beamline, device_names)
+
 
 def load_settings_from_yaml(yaml_directory: str, yaml_file_name: str):
 
-    provider = YamlSettingsProvider(yaml_directory)
+    """
+    Returns the named values of a settings yaml, only parsed again if the file has changed
+    """
+
+    provider = CachedYamlSettingsProvider(yaml_directory)
     settings = yield from wait_for_awaitable(provider.retrieve(yaml_file_name))
 
     return settings
@@ -123,12 +92,15 @@ def upload_yaml_to_panda(yaml_directory: str, yaml_file_name: str, panda: HDFPan
     Takes a folder of the directory where the yaml is saved, the name of the yaml file and the panda we want 
 
     to apply the settings to, and uploaded the ophyd async settings pv yaml to the panda
+
+    The settings may rewrite the sequencers, so their recorded uploads are forgotten
     
     """
 
-    provider = YamlSettingsProvider(yaml_directory)
+    provider = CachedYamlSettingsProvider(yaml_directory)
     settings = yield from retrieve_settings(provider, yaml_file_name, panda)
     yield from apply_panda_settings(settings)
+    forget_seq_uploads(f"{panda.name}-")
 	
 
 def save_device_to_yaml(yaml_directory: str, yaml_file_name: str, device) -> MsgGenerator:
@@ -141,7 +113,7 @@ def save_device_to_yaml(yaml_directory: str, yaml_file_name: str, device) -> Msg
     
     """
 
-    provider = YamlSettingsProvider(yaml_directory)
+    provider = CachedYamlSettingsProvider(yaml_directory)
     yield from store_settings(provider, yaml_file_name, device)
     
 
@@ -0,0 +1,232 @@
+"""
+
+Applying only the settings which differ
+
+Re-uploading a whole settings yaml (~900 signals for a PandA) because one
+PV drifted is slow. read_settings_diff reads just the signals named in the
+settings and returns those whose value differs, apply_settings_diff then
+writes only those (for a PandA the _units first, then the rest in parallel)
+so one drifted PV costs one write.
+
+Parsed settings cache
+
+The settings yamls are large and were parsed again by every plan.
+CachedYamlSettingsProvider keeps each parsed file in SETTINGS_CACHE along
+with its mtime, size and sha256. A file whose mtime and size haven't changed
+is never read again, and one which was only touched (same sha256) isn't
+parsed again. preload_settings_yamls parses a whole directory up front, eg
+when the plans are loaded by the server.
+
+"""
+
+import asyncio
+import os
+import threading
+import warnings
+from collections.abc import Callable, Mapping
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import numpy as np
+import yaml
+from bluesky.utils import MsgGenerator
+from ophyd_async.core import Device, Settings, YamlSettingsProvider, walk_rw_signals
+from ophyd_async.core._table import Table
+from ophyd_async.plan_stubs import apply_panda_settings
+from ophyd_async.plan_stubs._wait_for_awaitable import wait_for_awaitable
+
+from SAS_bluesky.ProfileCache import file_digest
+
+#name: (current value, required value)
+SettingsDiff = dict[str, tuple[Any, Any]]
+
+
+class SettingsFile(NamedTuple):
+
+    mtime_ns: int
+    size: int
+    digest: str
+    named_values: dict[str, Any]
+
+
+#absolute path of a settings yaml: its parsed settings
+SETTINGS_CACHE: dict[str, SettingsFile] = {}
+_SETTINGS_LOCK = threading.Lock()
+
+
+def is_different(current, required) -> bool:
+
+    """
+    Same comparison as ophyd_async's apply_settings_if_different, tables are
+    compared column by column and arrays element wise
+    """
+
+    if isinstance(current, Table):
+        current = current.model_dump()
+        if isinstance(required, Table):
+            required = required.model_dump()
+        return current.keys() != required.keys() or any(
+            is_different(current[k], required[k]) for k in current)
+    elif isinstance(current, np.ndarray):
+        return not np.array_equal(current, required)
+    else:
+        return current != required
+
+
+def format_settings_diff(diff: Mapping[str, tuple[Any, Any]], max_length: int = 60) -> str: #noqa
+
+    def short(value) -> str:
+        text = str(value).replace("\n", " ")
+        return text if len(text) <= max_length else text[:max_length-3] + "..."
+
+    return "\n".join(f"{name}: {short(current)} -> {short(required)}"
+                     for name, (current, required) in diff.items())
+
+
+async def read_settings_diff(device: Device, named_values: Mapping[str, Any]) -> SettingsDiff: #noqa
+
+    """
+
+    Reads the signals of device named in named_values (eg from a settings yaml)
+
+    and returns {name: (current, required)} for every one which differs.
+
+    None values are ignored, as they are by apply_settings
+
+    """
+
+    signals = walk_rw_signals(device)
+
+    unknown_names = set(named_values) - set(signals)
+    if unknown_names:
+        raise NameError(f"Unknown signal names {sorted(unknown_names)}")
+
+    names = [name for name, value in named_values.items() if value is not None]
+    current_values = await asyncio.gather(*[signals[name].get_value() for name in names])
+
+    return {name: (current, named_values[name])
+            for name, current in zip(names, current_values, strict=True)
+            if is_different(current, named_values[name])}
+
+
+def apply_settings_diff(device: Device,
+                        named_values: Mapping[str, Any],
+                        apply_plan: Callable[[Settings], MsgGenerator[None]] = apply_panda_settings) -> MsgGenerator[SettingsDiff]: #noqa
+
+    """
+
+    Writes only the settings of named_values which differ from those on device,
+
+    with apply_plan (which orders the writes), and returns what was changed
+
+    """
+
+    diff = yield from wait_for_awaitable(read_settings_diff(device, named_values))
+
+    if diff:
+        signals = walk_rw_signals(device)
+        settings = Settings(device, {signals[name]: required for name, (_, required) in diff.items()}) #noqa
+        yield from apply_plan(settings)
+
+    return diff
+
+
+def parse_settings_yaml(content: bytes, path: str = "") -> dict[str, Any]:
+
+    """
+    Same as YamlSettingsProvider.retrieve, old files (a list of dicts) are merged
+    """
+
+    data = yaml.full_load(content)
+
+    if isinstance(data, list):
+        warnings.warn(DeprecationWarning(f"Found old save file. Re-save your yaml settings file {path} using ophyd_async.plan_stubs.store_settings"), stacklevel=2) #noqa
+        merge = {}
+        for d in data:
+            merge.update(d)
+        return merge
+
+    return data
+
+
+def load_settings_file(path: str | Path) -> dict[str, Any]:
+
+    """
+
+    Returns the named values of a settings yaml, parsing it only if it has changed
+
+    since it was last loaded. The dict returned is a copy, it can be modified
+
+    """
+
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+
+    with _SETTINGS_LOCK:
+        cached = SETTINGS_CACHE.get(path)
+
+    if cached is not None and (cached.mtime_ns, cached.size) == (stat.st_mtime_ns, stat.st_size): #noqa
+        return dict(cached.named_values)
+
+    with open(path, "rb") as file:
+        content = file.read()
+
+    digest = file_digest(content)
+
+    if cached is not None and cached.digest == digest:
+        #touched but not changed
+        named_values = cached.named_values
+    else:
+        named_values = parse_settings_yaml(content, path)
+
+    with _SETTINGS_LOCK:
+        SETTINGS_CACHE[path] = SettingsFile(stat.st_mtime_ns, stat.st_size, digest, named_values) #noqa
+
+    return dict(named_values)
+
+
+def forget_settings_file(path: str | Path | None = None):
+
+    """
+    Drops a file from SETTINGS_CACHE, or every file if path is None
+    """
+
+    with _SETTINGS_LOCK:
+        if path is None:
+            SETTINGS_CACHE.clear()
+        else:
+            SETTINGS_CACHE.pop(os.path.abspath(path), None)
+
+
+def preload_settings_yamls(directory: str | Path) -> list[str]:
+
+    """
+    Parses every settings yaml in directory into SETTINGS_CACHE, returns their paths.
+    Files which can't be parsed are skipped and will fail when they are used
+    """
+
+    loaded = []
+
+    for path in sorted(Path(directory).glob("*.yaml")):
+        try:
+            load_settings_file(path)
+        except (OSError, yaml.YAMLError):
+            continue
+        loaded.append(str(path))
+
+    return loaded
+
+
+class CachedYamlSettingsProvider(YamlSettingsProvider):
+
+    """
+    YamlSettingsProvider reading through SETTINGS_CACHE
+    """
+
+    async def store(self, name: str, data: dict[str, Any]):
+
+        await super().store(name, data)
+        forget_settings_file(self._file_path(name))
+
+    async def retrieve(self, name: str) -> dict[str, Any]:
+        return load_settings_file(self._file_path(name))
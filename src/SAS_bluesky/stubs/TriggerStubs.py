@@ -0,0 +1,347 @@
+"""
+
+Running a prepared profile again
+
+configure_panda_triggering sets up the PandA, flyer and detectors once and
+returns them as a PreparedTriggering. run_prepared_triggering runs it in a
+run of its own, so every run gets its own run number, and between runs
+rearm_panda_triggering redoes only what a run uses up: new file names and
+staging and preparing the detectors for them. repeat_prepared_triggering
+does this n_runs times and returns the dead time between the runs.
+
+None of this needs dodal, the beamline specific values (the sequencer which
+runs the profile, the timeout, the path provider) are in the PreparedTriggering.
+
+"""
+
+import time
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+from typing import NamedTuple
+
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
+import numpy as np
+from bluesky.utils import MsgGenerator, short_uid
+from ophyd_async.core import (
+    DEFAULT_TIMEOUT,
+    PathProvider,
+    StandardDetector,
+    StandardFlyer,
+    TriggerInfo,
+    wait_for_value,
+)
+from ophyd_async.fastcs.panda import HDFPanda, PcompInfo, SeqTableInfo
+
+from SAS_bluesky.SeqDoubleBuffer import DoubleBufferedSeqTableInfo
+
+#time.monotonic() just before kickoff and once the sequencer finished
+RunTimes = tuple[float, float]
+#seconds taken by each stage
+Stages = dict[str, float]
+
+
+class PANDA(Enum):
+    Enable = "ONE"
+    Disable = "ZERO"
+
+
+class PreparedTriggering(NamedTuple):
+
+    """
+    Everything configure_panda_triggering set up, kept so the same profile
+    can be run again without setting it all up again, see rearm_panda_triggering.
+    path_provider must have dodal's async update(directory, suffix)
+    """
+
+    panda: HDFPanda
+    active_detectors: tuple
+    active_pulses: np.ndarray
+    flyer: StandardFlyer
+    table_info: SeqTableInfo | DoubleBufferedSeqTableInfo
+    trigger_info: TriggerInfo
+    visit_path: str
+    path_provider: PathProvider
+    n_seq: int = 1
+    timeout: float = DEFAULT_TIMEOUT
+
+
+def wait_until_complete(pv_obj, waiting_value=0, timeout=None):
+    """
+    An async wrapper for the ophyd async wait_for_value function,
+    to allow it to run inside the bluesky run engine
+    Typical use case is waiting for an active pv to change to 0,
+    indicating that the run has finished, which then allows the
+    run plan to disarm all the devices.
+    """
+
+    async def _wait():
+        await wait_for_value(pv_obj, waiting_value, timeout=timeout)
+
+    yield from bps.wait_for([_wait])
+
+
+def set_pulse_enables(panda: HDFPanda,
+                      pulses,
+                      value: str,
+                      group="pulse_enable",
+                      timeout: float = DEFAULT_TIMEOUT):
+
+    """
+    Sets enable of every numbered pulse block to value and waits for them all
+    """
+
+    for n_pulse in pulses:
+        yield from bps.abs_set(panda.pulse[int(n_pulse)].enable, value, group=group)
+
+    yield from bps.wait(group=group, timeout=timeout)
+
+
+def update_path_provider(path_provider: PathProvider, visit_path: Path | str):
+
+    """
+    Asks the path provider for new file names, each run needs its own files
+    """
+
+    suffix = datetime.now().strftime("_%Y%m%d%H%M%S")
+
+    async def set_panda_dir():
+        await path_provider.update(directory=Path(visit_path), suffix=suffix)
+
+    yield from bps.wait_for([set_panda_dir])
+
+
+def stage_and_prepare_detectors(detectors: list,
+                                flyer: StandardFlyer,
+                                trigger_info: TriggerInfo,
+                                group="det_atm",
+                                timeout: float = DEFAULT_TIMEOUT):
+
+    """
+
+    Iterates through all of the detectors specified and prepares them.
+
+    """
+
+    yield from bps.stage_all(*detectors, flyer, group=group)
+
+    for det in detectors:
+        ###this tells the detector how may triggers to expect and sets the CAN aquire on
+        yield from bps.prepare(det, trigger_info, wait=False, group=group)
+
+    yield from bps.wait(group=group, timeout=timeout)
+
+
+def fly_and_collect_with_wait(
+    stream_name: str,
+    flyer: StandardFlyer[SeqTableInfo] | StandardFlyer[PcompInfo],
+    detectors: list[StandardDetector],
+    settle_time: float = 2,
+):
+    """Kickoff, complete and collect with a flyer and multiple detectors, wait breifly.
+
+    This stub takes a flyer and one or more detectors that have been prepared. It
+    declares a stream for the detectors, then kicks off the detectors and the flyer.
+    The detectors are collected until the flyer and detectors have completed, then
+    it sleeps for settle_time seconds (none if 0).
+
+    see also from ophyd_async.plan_stubs import fly_and_collect
+
+    """
+    yield from bps.declare_stream(*detectors, name=stream_name, collect=True)
+    yield from bps.kickoff(flyer, wait=True)
+    for detector in detectors:
+        yield from bps.kickoff(detector)
+
+    # collect_while_completing
+    group = short_uid(label="complete")
+
+    yield from bps.complete(flyer, wait=False, group=group)
+    for detector in detectors:
+        yield from bps.complete(detector, wait=False, group=group)
+
+    done = False
+    while not done:
+        try:
+            yield from bps.wait(group=group, timeout=1)
+        except TimeoutError:
+            pass
+        else:
+            done = True
+        yield from bps.collect(
+            *detectors,
+            return_payload=False,
+            name=stream_name,
+        )
+    yield from bps.wait(group=group)
+    if settle_time:
+        yield from bps.sleep(settle_time)
+
+
+def trigger_and_collect(panda: HDFPanda,
+                        active_detectors,
+                        active_pulses,
+                        flyer: StandardFlyer,
+                        n_seq: int = 1,
+                        timeout: float = DEFAULT_TIMEOUT,
+                        settle_time: float = 2) -> MsgGenerator[RunTimes]:
+
+    """
+
+    Arms the pulses, flys the prepared flyer and detectors until sequencer n_seq
+
+    finishes, then disarms and unstages everything. Returns the time.monotonic()
+
+    just before kickoff and once the sequencer finished, before the settle_time
+
+    sleep (which fly_and_collect_with_wait would otherwise do).
+
+    Must be inside a run, see run_prepared_triggering
+
+    """
+
+    ##########################
+    #arm the panda pulses
+    yield from set_pulse_enables(panda, active_pulses, PANDA.Enable.value,
+                                 group="arm_panda", timeout=timeout)
+
+    started = time.monotonic()
+    ###########################
+    yield from fly_and_collect_with_wait(
+        stream_name='primary',
+        detectors=active_detectors,
+        flyer=flyer,
+        settle_time=0,
+    )
+    ##########################
+    ###########################
+    ####start diabling and unstaging everything
+    yield from wait_until_complete(panda.seq[n_seq].active, False)
+    finished = time.monotonic()
+    if settle_time:
+        yield from bps.sleep(settle_time)
+    #start set to false because currently don't actually want to collect data
+    yield from set_pulse_enables(panda, active_pulses, PANDA.Disable.value,
+                                 group="disarm_panda", timeout=timeout)
+    yield from bps.unstage_all(*active_detectors, flyer)  #stops the hdf capture mode
+
+    return started, finished
+
+
+def run_prepared_triggering(prepared: PreparedTriggering,
+                            md: dict | None = None,
+                            settle_time: float = 2) -> MsgGenerator[RunTimes]:
+
+    """
+    Runs the prepared profile once, in a run of its own (with md), and returns
+    the times from trigger_and_collect
+    """
+
+    times = {}
+
+    def _run():
+        times["started"], times["finished"] = yield from trigger_and_collect(
+            prepared.panda, prepared.active_detectors, prepared.active_pulses,
+            prepared.flyer, n_seq=prepared.n_seq, timeout=prepared.timeout,
+            settle_time=settle_time)
+
+    #run_wrapper returns the run uid, not what the plan returns
+    yield from bpp.run_wrapper(_run(), md=md)
+
+    return times["started"], times["finished"]
+
+
+def rearm_panda_triggering(prepared: PreparedTriggering) -> MsgGenerator[Stages]:
+
+    """
+
+    Gets a configured PandA, flyer and detectors ready to run the same profile
+
+    again, redoing only what the last run used up: new file names and staging
+
+    and preparing the detectors for them. The settings check, device setup and
+
+    seq table upload aren't repeated (the flyer prepare only checks the table is
+
+    still loaded). Returns the seconds taken by each stage
+
+    """
+
+    stages = {}
+
+    start = time.monotonic()
+    yield from update_path_provider(prepared.path_provider, prepared.visit_path)
+    stages["new_collection"] = time.monotonic() - start
+
+    start = time.monotonic()
+    yield from bps.prepare(prepared.flyer, prepared.table_info, wait=True)
+    stages["flyer"] = time.monotonic() - start
+
+    start = time.monotonic()
+    yield from stage_and_prepare_detectors(prepared.active_detectors,
+                                           prepared.flyer,
+                                           prepared.trigger_info,
+                                           timeout=prepared.timeout)
+    stages["detectors"] = time.monotonic() - start
+
+    return stages
+
+
+def repeat_prepared_triggering(prepared: PreparedTriggering,
+                               n_runs: int,
+                               settle_time: float = 0) -> MsgGenerator[list[Stages]]:
+
+    """
+
+    Runs the prepared profile n_runs times back to back, each in its own run,
+
+    with only rearm_panda_triggering between them. Returns the dead time between
+
+    the end of each run (sequencer finished) and the kickoff of the next, along
+
+    with its stages. There is no settle_time sleep after each run unless given,
+
+    any there is counts towards finish_run
+
+    """
+
+    def run(repeat: int):
+        md = {"repeat": repeat, "n_runs": n_runs}
+        return run_prepared_triggering(prepared, md=md, settle_time=settle_time)
+
+    dead_times = []
+    _, finished = yield from run(1)
+
+    for repeat in range(2, n_runs + 1):
+
+        rearm_start = time.monotonic()
+        stages = yield from rearm_panda_triggering(prepared)
+
+        started, next_finished = yield from run(repeat)
+
+        rearmed = rearm_start + sum(stages.values())
+        dead_times.append({"finish_run": rearm_start - finished,
+                           **stages,
+                           "arm": started - rearmed,
+                           "dead_time": started - finished})
+        finished = next_finished
+
+    return dead_times
+
+
+def format_dead_times(dead_times: list[Stages]) -> str:
+
+    if not dead_times:
+        return "no dead time, only one run"
+
+    names = list(dead_times[0])
+    lines = [f"{'run':>5} " + " ".join(f"{name:>15}" for name in names)]
+    for run, times in enumerate(dead_times, start=2):
+        lines.append(f"{run:>5} " + " ".join(f"{times[name]:>15.3f}" for name in names))
+
+    totals = [times["dead_time"] for times in dead_times]
+    lines.append(f"dead time between runs (s): mean {np.mean(totals):.3f}, "
+                 f"max {np.max(totals):.3f}")
+
+    return "\n".join(lines)
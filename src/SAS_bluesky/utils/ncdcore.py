@@ -6,6 +6,14 @@ Useful functions
 
 """
 
+import numpy as np
+
+CLOCK_FREQUENCY = 125_000_000 #PandA FPGA clock, Hz
+TICKS_PER_US = CLOCK_FREQUENCY // 1_000_000
+NS_PER_TICK = 1_000_000_000 // CLOCK_FREQUENCY
+NS_PER_US = 1_000
+
+
 class ncdcore:
 
 	@staticmethod
@@ -59,4 +67,88 @@ class ncdcore:
 		time_units = {"ns": 1e-9, "nsec": 1e-9, "usec": 1e-6, "us": 1e-6, "ms": 1e-3, "msec": 1e-3,
 			"s": 1, "sec": 1, "min": 60, "m": 60, "hour": 60*60, "h": 60*60 }
 
-		return time_units[unit]
\ No newline at end of file
+		return time_units[unit]
+
+
+	@staticmethod
+	def to_nanoseconds(unit: str) -> int:
+
+		"""
+		
+		takes a unit and gives back the unit as an integer number of nanoseconds
+
+		eg to_nanoseconds("msec") = 1000000
+
+		"""
+
+		unit = unit.lower()
+
+		time_units = {"ns": 1, "nsec": 1, "usec": 10**3, "us": 10**3,
+			"ms": 10**6, "msec": 10**6, "s": 10**9, "sec": 10**9,
+			"min": 60*10**9, "m": 60*10**9, "hour": 60*60*10**9, "h": 60*60*10**9 }
+
+		return time_units[unit]
+
+
+	@staticmethod
+	def to_ticks(time: int, unit: str) -> int:
+
+		"""
+		
+		takes a time and unit and gives back the time in PandA clock ticks (8 ns),
+		rounded up to the next whole microsecond, the resolution of the sequencer
+		table, so the ticks are what the sequencer actually plays. Integer only,
+		so exact for any whole number of time units
+
+		eg to_ticks(1, "ms") = 125000, to_ticks(500, "ns") = 125
+
+		"""
+
+		return ncdcore.ns_to_ticks(int(time)*ncdcore.to_nanoseconds(unit))
+
+
+	@staticmethod
+	def ns_to_ticks(time_ns):
+
+		"""
+		
+		converts nanoseconds (int or int array) to clock ticks, rounded up to
+		the next whole microsecond like the sequencer table times
+
+		"""
+
+		return -(-time_ns // NS_PER_US)*TICKS_PER_US
+
+
+	@staticmethod
+	def ticks_to_micros(ticks):
+
+		"""
+		
+		converts clock ticks (int or int array) to whole microseconds,
+		rounded up like ophyd_async in_micros
+
+		"""
+
+		return -(-ticks // TICKS_PER_US)
+
+
+	@staticmethod
+	def to_ticks_array(times, units) -> np.ndarray:
+
+		"""
+		
+		vectorised to_ticks, takes arrays of times and unit names and gives
+		back an int64 array of clock ticks
+
+		"""
+
+		units = np.char.lower(np.asarray(units, dtype=str))
+		unique_units, inverse = np.unique(units, return_inverse=True)
+		unit_ns = np.array([ncdcore.to_nanoseconds(u) for u in unique_units],
+						   dtype=np.int64)
+
+		time_ns = np.asarray(times, dtype=np.int64)
+		time_ns = time_ns*unit_ns[inverse.reshape(units.shape)]
+
+		return ncdcore.ns_to_ticks(time_ns)
@@ -0,0 +1,148 @@
+"""
+
+Timing harness for the benchmarks
+
+Each benchmark times a function over a few rounds and compares the median
+with the baseline stored for its test id in baselines.json. A benchmark more
+than --benchmark-tolerance times slower than its baseline fails. Baselines
+only mean anything on the machine they were measured on, so they aren't
+committed (baselines.json is ignored by git). Save them on your machine
+before making a change, then compare:
+
+    pytest tests/benchmarks --benchmark --benchmark-save
+    pytest tests/benchmarks --benchmark
+
+Without a baseline a benchmark is only timed and reported.
+
+"""
+
+import json
+import statistics
+import time
+from pathlib import Path
+
+import pytest
+
+from SAS_bluesky.ProfileCache import ARTIFACT_CACHE
+
+BASELINES = Path(__file__).parent/"baselines.json"
+
+
+def pytest_collection_modifyitems(config, items):
+
+    if config.getoption("--benchmark"):
+        return
+
+    skip = pytest.mark.skip(reason="benchmarks only run with --benchmark")
+    for item in items:
+        if BASELINES.parent in Path(item.fspath).parents:
+            item.add_marker(skip)
+
+
+class Bench:
+
+    def __init__(self, name: str, baseline: dict | None, tolerance: float):
+
+        self.name = name
+        self.baseline = baseline
+        self.tolerance = tolerance
+        self.timings: list[float] = []
+
+    def __call__(self, func, *args, setup=None, rounds: int = 5, max_time: float = 5, **kwargs): #noqa
+
+        """
+
+        Times func(*args, **kwargs) after calling setup (untimed) each round,
+
+        stopping early once max_time (s) has been spent. Returns the result
+
+        of the last call
+
+        """
+
+        spent = 0.0
+        result = None
+
+        for _ in range(rounds):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            self.timings.append(time.perf_counter() - start)
+            spent += self.timings[-1]
+            if spent > max_time:
+                break
+
+        return result
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.timings)
+
+    @property
+    def ratio(self) -> float | None:
+        return None if self.baseline is None else self.median/self.baseline["median_s"]
+
+    def record(self) -> dict:
+        return {"median_s": self.median, "min_s": min(self.timings), "rounds": len(self.timings)} #noqa
+
+
+#every benchmark timed this session, for the terminal summary
+RESULTS = pytest.StashKey[dict[str, Bench]]()
+
+
+@pytest.fixture(scope="session")
+def baselines(request):
+
+    stored = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+    results: dict[str, Bench] = {}
+
+    yield stored, results
+
+    if request.config.getoption("--benchmark-save") and results:
+        stored.update({name: bench.record() for name, bench in results.items()})
+        BASELINES.write_text(json.dumps(dict(sorted(stored.items())), indent=1)+"\n")
+
+    request.config.stash[RESULTS] = results
+
+
+@pytest.fixture
+def bench(request, baselines):
+
+    stored, results = baselines
+    name = request.node.nodeid.split("::", 1)[1]
+
+    ARTIFACT_CACHE.clear()
+    disk_dir, ARTIFACT_CACHE.disk_dir = ARTIFACT_CACHE.disk_dir, None
+
+    timer = Bench(name, stored.get(name), request.config.getoption("--benchmark-tolerance")) #noqa
+
+    yield timer
+
+    ARTIFACT_CACHE.disk_dir = disk_dir
+    ARTIFACT_CACHE.clear()
+
+    if not timer.timings:
+        return
+
+    results[name] = timer
+
+    if not request.config.getoption("--benchmark-save") and timer.ratio is not None:
+        if timer.ratio > timer.tolerance:
+            pytest.fail(f"{name} took {timer.median:.4g} s, {timer.ratio:.2f}x its baseline of {timer.baseline['median_s']:.4g} s") #noqa
+
+
+def pytest_terminal_summary(terminalreporter, config):
+
+    results = config.stash.get(RESULTS, None)
+
+    if not results:
+        return
+
+    terminalreporter.section("profile benchmarks")
+    terminalreporter.write_line(f"{'benchmark':<60} {'median (s)':>12} {'baseline':>12} {'ratio':>7}") #noqa
+
+    for name, timer in sorted(results.items()):
+        baseline = "" if timer.baseline is None else f"{timer.baseline['median_s']:.4g}"
+        ratio = "" if timer.ratio is None else f"{timer.ratio:.2f}"
+        terminalreporter.write_line(f"{name:<60} {timer.median:>12.4g} {baseline:>12} {ratio:>7}") #noqa
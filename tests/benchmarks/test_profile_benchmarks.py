@@ -0,0 +1,81 @@
+import pytest
+
+from SAS_bluesky.ProfileCache import ARTIFACT_CACHE
+from SAS_bluesky.ProfileGroups import _WIRE_CACHE, Profile, ProfileLoader
+
+#kept small enough that the whole suite runs in well under a minute
+SIZES = [10, 1_000, 10_000]
+
+
+@pytest.fixture
+def alternating(make_profile):
+
+    def make(n_groups: int, frames: int = 1) -> Profile:
+        #alternating groups, so nothing merges in the SeqTable
+        return make_profile(n_groups, frames=frames,
+                            wait_time=[1, 2]*(n_groups//2) + [1]*(n_groups % 2),
+                            run_pulses=[1, 0, 1, 0])
+
+    return make
+
+
+@pytest.mark.parametrize("n_groups", SIZES)
+def test_build_groups(bench, alternating, n_groups):
+    bench(alternating, n_groups)
+
+
+@pytest.mark.parametrize("n_groups", SIZES)
+def test_analyse_profile(bench, alternating, n_groups):
+
+    profile = alternating(n_groups)
+    bench(profile.analyse_profile)
+
+
+@pytest.mark.parametrize("n_groups,frames", [(n, 1) for n in SIZES] + [(10, 10_000)])
+def test_build_veto_signal(bench, alternating, n_groups, frames):
+
+    profile = alternating(n_groups, frames)
+    bench(profile.build_veto_signal, setup=ARTIFACT_CACHE.clear)
+
+
+@pytest.mark.parametrize("n_groups", [10, 1_000, 4_000])
+def test_seq_table(bench, alternating, n_groups):
+
+    profile = alternating(n_groups)
+    bench(profile.seq_table, setup=ARTIFACT_CACHE.clear)
+
+
+@pytest.mark.parametrize("n_groups", SIZES)
+def test_model_validate_json(bench, alternating, n_groups):
+
+    wire = alternating(n_groups).model_dump_json()
+    bench(Profile.model_validate_json, wire)
+
+
+@pytest.mark.parametrize("n_groups", SIZES)
+def test_wire_round_trip(bench, alternating, n_groups):
+
+    profile = alternating(n_groups)
+    bench(lambda: Profile.from_wire(profile.to_wire()), setup=_WIRE_CACHE.clear)
+
+
+@pytest.mark.parametrize("n_groups", SIZES)
+def test_save_to_yaml(bench, alternating, tmp_path, n_groups):
+
+    loader = ProfileLoader(profiles=[alternating(n_groups)], instrument="i22",
+                           experiment="cm00000", detectors=["saxs"])
+    bench(loader.save_to_yaml, str(tmp_path/"profiles.yaml"), rounds=3)
+
+
+@pytest.mark.parametrize("n_groups", SIZES)
+def test_read_from_yaml(bench, alternating, tmp_path, n_groups):
+
+    path = str(tmp_path/"profiles.yaml")
+    ProfileLoader(profiles=[alternating(n_groups)], instrument="i22",
+                  experiment="cm00000", detectors=["saxs"]).save_to_yaml(path)
+
+    def read():
+        #building the profile is part of reading it
+        return ProfileLoader.read_from_yaml(path, use_cache=False).profiles[0]
+
+    bench(read, rounds=3)
@@ -0,0 +1,80 @@
+import pytest
+
+from SAS_bluesky.ProfileGroups import GROUP_INPUTS, PROFILE_INPUTS, Profile
+
+#every group is 1 ms waiting then 1 ms with output A high, unless told otherwise
+GROUP_DEFAULTS = {"frames": 1,
+                  "wait_time": 1,
+                  "wait_units": "MS",
+                  "run_time": 1,
+                  "run_units": "MS",
+                  "pause_trigger": "IMMEDIATE",
+                  "wait_pulses": [0, 0, 0, 0],
+                  "run_pulses": [1, 0, 0, 0]}
+
+
+def pytest_addoption(parser):
+
+    group = parser.getgroup("benchmark", "profile benchmarks (tests/benchmarks)")
+    group.addoption("--benchmark", action="store_true", default=False,
+                    help="run the benchmarks, which are skipped otherwise")
+    group.addoption("--benchmark-save", action="store_true", default=False,
+                    help="store the timings as the new baselines")
+    group.addoption("--benchmark-tolerance", type=float, default=1.5,
+                    help="fail a benchmark slower than tolerance x its baseline")
+
+
+def profile_columns(n_groups: int | None = None, **fields) -> dict:
+
+    """
+    Columns of group fields (the kwargs of Profile.from_columns and check_profile),
+    each field is a value for every group or a list with one per group. Profile
+    fields (cycles, seq_trigger, multiplier) are passed through, cycles defaults to 1
+    """
+
+    def is_column(name, value):
+        if name.endswith("pulses"):
+            return len(value) > 0 and isinstance(value[0], list | tuple)
+        return isinstance(value, list | tuple)
+
+    group_fields = {**GROUP_DEFAULTS, **{name: fields.pop(name) for name in GROUP_INPUTS if name in fields}} #noqa
+
+    if n_groups is None:
+        n_groups = max((len(v) for k, v in group_fields.items() if is_column(k, v)), default=1) #noqa
+
+    columns = {name: list(value) if is_column(name, value) else [value]*n_groups
+               for name, value in group_fields.items()}
+    #separate lists, so a test can edit one group
+    columns = {name: [list(v) if name.endswith("pulses") else v for v in value]
+               for name, value in columns.items()}
+
+    unknown = set(fields) - set(PROFILE_INPUTS)
+    if unknown:
+        raise TypeError(f"Unknown fields {sorted(unknown)}")
+
+    return {**columns, "cycles": 1, **fields}
+
+
+@pytest.fixture
+def make_columns():
+    return profile_columns
+
+
+@pytest.fixture
+def make_records():
+
+    def make(n_groups: int | None = None, **fields) -> list[dict]:
+        columns = profile_columns(n_groups, **fields)
+        return [dict(zip(GROUP_INPUTS, row, strict=True))
+                for row in zip(*(columns[name] for name in GROUP_INPUTS), strict=True)]
+
+    return make
+
+
+@pytest.fixture
+def make_profile():
+
+    def make(n_groups: int | None = None, **fields) -> Profile:
+        return Profile.from_columns(**profile_columns(n_groups, **fields))
+
+    return make
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from SAS_bluesky.ColumnarProfile import ColumnarProfile
+
+
+@pytest.fixture
+def profile(make_profile):
+
+    return make_profile(frames=[5, 1], wait_time=[1, 3], wait_units=["MS", "S"],
+                        run_time=[20, 1], run_units=["US", "S"],
+                        pause_trigger=["IMMEDIATE", "BITA_1"],
+                        wait_pulses=[[0, 0, 0, 0], [0, 1, 0, 0]],
+                        run_pulses=[[1, 0, 1, 0], [0, 0, 0, 0]], cycles=3)
+
+
+def test_columnar_profile_matches_profile(profile):
+
+    columnar = ColumnarProfile.from_profile(profile)
+
+    assert columnar.total_frames == profile.total_frames
+    assert columnar.duration_ticks == profile.duration_ticks
+    np.testing.assert_array_equal(columnar.active_out, profile.active_out)
+    np.testing.assert_array_equal(columnar.build_trigger_timeline().edge_ticks,
+                                  profile.build_trigger_timeline().edge_ticks)
+
+    expected = profile.seq_table()
+    table = columnar.seq_table()
+    for column in type(expected).model_fields:
+        np.testing.assert_array_equal(getattr(table, column), getattr(expected, column))
+
+    assert columnar.to_profile().groups == profile.groups
+
+
+def test_columnar_profile_edits(profile):
+
+    columnar = ColumnarProfile.from_profile(profile)
+
+    columnar.append_group(profile.groups[1])
+    columnar.delete_group(0)
+    profile.append_group(profile.groups[1])
+    profile.delete_group(0)
+
+    assert len(columnar.groups) == 2
+    assert columnar.groups[-1].pause_trigger == "BITA_1"
+    assert columnar.total_frames == profile.total_frames
+    assert columnar.duration_ticks == profile.duration_ticks
+
+
+def test_inserted_pulses_are_kept(profile):
+
+    columnar = ColumnarProfile.from_profile(profile)
+    group = profile.groups[0].model_copy(update={"run_pulses": [0, 0, 0, 0, 0, 1]})
+
+    columnar.insert_group(1, group)
+
+    assert columnar.n_pulses == 6
+    assert columnar.groups[1].run_pulses == [0, 0, 0, 0, 0, 1]
+    assert columnar.groups[0].run_pulses == [1, 0, 1, 0, 0, 0]
+    assert 5 in columnar.active_out
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from SAS_bluesky.stubs.ConnectStubs import DevicesNotConnected, connect_concurrently
+
+
+class FakeDevice:
+
+    def __init__(self, delay, error=None):
+        self.delay = delay
+        self.error = error
+
+    async def connect(self, mock=False, timeout=10, force_reconnect=False):
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+
+
+def test_devices_connect_concurrently():
+
+    devices = {name: FakeDevice(0.2) for name in ("panda1", "saxs", "waxs", "i0")}
+    results = asyncio.run(connect_concurrently(devices, timeout=5))
+
+    assert list(results) == list(devices)
+    assert all(result.connected for result in results.values())
+    #together, not one after another
+    assert max(result.seconds for result in results.values()) < 0.6
+
+
+def test_failure_is_reported_for_every_device():
+
+    devices = {"panda1": FakeDevice(0.01),
+               "saxs": FakeDevice(0.02, ConnectionError("no PV")),
+               "waxs": FakeDevice(5)}
+
+    with pytest.raises(DevicesNotConnected) as e:
+        asyncio.run(connect_concurrently(devices, timeout=2))
+
+    results = e.value.results
+    assert results["panda1"].connected
+    assert isinstance(results["saxs"].error, ConnectionError)
+    #cancelled as soon as saxs failed
+    assert not results["waxs"].connected and results["waxs"].seconds < 1
+    assert set(e.value.sub_errors) == {"saxs", "waxs"}
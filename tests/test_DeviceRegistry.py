@@ -0,0 +1,79 @@
+from ophyd_async.core import Device
+
+from SAS_bluesky.stubs.DeviceRegistry import DeviceRegistry
+
+
+def make_registry(connected=None):
+
+    made = []
+
+    def factory(module, name, connect_immediately=False, **kwargs):
+        made.append((module, name))
+        #every device depends on a shared "base" device
+        return {name: Device(name=name), "base": Device(name="base")}
+
+    def connect(device):
+        connected.append(device)
+
+    return DeviceRegistry(factory,
+                          module_name=lambda beamline: f"dodal.beamlines.{beamline}",
+                          connect=connect), made
+
+
+def test_devices_made_once():
+
+    registry, made = make_registry()
+
+    first = registry.get("i22", ["panda1", "saxs"])
+    again = registry.get("i22", ["saxs", "panda1", "base"])
+
+    assert made == [("dodal.beamlines.i22", "panda1"), ("dodal.beamlines.i22", "saxs")]
+    assert again["panda1"] is first["panda1"] and again["saxs"] is first["saxs"]
+    assert len(registry) == 3
+
+    #another beamline is its own set of devices
+    registry.get("b21", ["panda1"])
+    assert len(made) == 3 and ("b21", "panda1") in registry
+
+
+def test_invalidate():
+
+    registry, made = make_registry()
+    panda = registry.get("i22", ["panda1", "saxs"])["panda1"]
+    registry.get("b21", ["panda1"])
+
+    registry.invalidate("i22", ["panda1"])
+    assert ("i22", "panda1") not in registry and ("i22", "saxs") in registry
+    assert registry.get("i22", ["panda1"])["panda1"] is not panda
+
+    registry.invalidate("i22")
+    assert ("i22", "saxs") not in registry and ("b21", "panda1") in registry
+
+    registry.invalidate()
+    assert len(registry) == 0
+
+
+def test_cached_device_connected_when_asked_for():
+
+    connected = []
+    registry, made = make_registry(connected)
+
+    saxs = registry.get("i22", ["saxs"])["saxs"]
+    assert connected == [] and not registry.is_connected("i22", "saxs")
+
+    #cached unconnected, so connected now (once) rather than made again
+    assert registry.get("i22", ["saxs"], connect_immediately=True)["saxs"] is saxs
+    registry.get("i22", ["saxs"], connect_immediately=True)
+    assert connected == [saxs] and len(made) == 1
+
+    #made connected by the factory, so not connected again
+    registry.get("i22", ["panda1"], connect_immediately=True)
+    assert connected == [saxs] and registry.is_connected("i22", "panda1")
+
+    #"base" was cached by the first, unconnected, call
+    assert not registry.is_connected("i22", "base")
+
+    registry.invalidate("i22", ["saxs"])
+    assert not registry.is_connected("i22", "saxs")
+    new_saxs = registry.get("i22", ["saxs"], connect_immediately=True)["saxs"]
+    assert new_saxs is not saxs and connected == [saxs]
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from SAS_bluesky.ProfileGroups import Group, Profile
+
+
+@pytest.fixture
+def mixed_records(make_records):
+
+    def make(n_groups=20):
+        return make_records(frames=[n % 5 + 1 for n in range(n_groups)],
+                            wait_time=[n+1 for n in range(n_groups)], wait_units="ms",
+                            run_time=2, run_units="us",
+                            pause_trigger=["bita_1" if n % 3 == 0 else "immediate" for n in range(n_groups)], #noqa
+                            wait_pulses=[[0, n % 2, 0, 0] for n in range(n_groups)])
+
+    return make
+
+
+def test_from_records_matches_groups(mixed_records):
+
+    records = mixed_records()
+
+    profile = Profile.from_records(records, cycles=3)
+    expected = Profile(cycles=3, groups=[Group(**record) for record in records])
+
+    assert profile == expected
+    np.testing.assert_array_equal(profile.active_out, expected.active_out)
+    np.testing.assert_array_equal(profile.group_start_ticks(), expected.group_start_ticks())
+
+    table, expected_table = profile.seq_table(), expected.seq_table()
+    for column in type(table).model_fields:
+        np.testing.assert_array_equal(getattr(table, column), getattr(expected_table, column))
+
+
+def test_from_columns_broadcasts_and_validates(mixed_records):
+
+    profile = Profile.from_columns(frames=np.arange(1, 4), wait_time=1, wait_units="S",
+                                   run_time=[1, 2, 3], run_units="MS",
+                                   pause_trigger="IMMEDIATE", wait_pulses=[0, 0, 0, 0],
+                                   run_pulses=np.eye(3, 4, dtype=int))
+
+    assert profile.total_frames == 6
+    assert profile.groups[2].run_pulses == [0, 0, 1, 0]
+    np.testing.assert_array_equal(profile.active_out, [0, 1, 2])
+
+    records = mixed_records(3)
+    records[1]["frames"] = "many"
+    with pytest.raises(ValidationError, match="frames.1"):
+        Profile.from_records(records)
+
+    del records[1]["frames"]
+    with pytest.raises(ValidationError, match="frames"):
+        Profile.from_records(records)
+
+
+def test_wire_format_round_trip(mixed_records):
+
+    profile = Profile.from_records(mixed_records(), cycles=2, multiplier=[1, 2, 4, 8])
+    wire = profile.to_wire()
+
+    assert "group_duration" not in wire and "wait_ticks" not in wire
+    assert len(wire) < len(profile.model_dump_json())/2
+
+    decoded = Profile.from_wire(wire)
+    assert decoded == profile
+    assert Profile.from_wire(profile.model_dump_json()) == profile
+
+    #a cache hit is a new profile, editing one doesn't change the next
+    decoded.cycles += 1
+    decoded.groups[0].run_pulses[1] = 1
+    decoded.delete_group(-1)
+    again = Profile.from_wire(wire)
+    assert again is not decoded and again == profile
+    assert again.content_hash() == profile.content_hash()
+
+    empty = Profile(groups=[]).to_wire()
+    assert Profile.from_wire(empty) == Profile.from_wire(empty) == Profile(groups=[])
+
+    with pytest.raises(ValueError, match="version"):
+        Profile.from_wire(wire.replace('"version":1', '"version":99'))
@@ -0,0 +1,170 @@
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from ophyd_async.fastcs.panda import SeqTrigger
+from pydantic import ValidationError
+
+from SAS_bluesky import ProfileGroups
+from SAS_bluesky.ProfileCache import ARTIFACT_CACHE, ArtifactCache, load_sidecar, sidecar_path
+from SAS_bluesky.ProfileGroups import GROUP_INPUTS, Profile, ProfileLoader
+from SAS_bluesky.SeqCompiler import compile_seq_table
+from SAS_bluesky.utils.ncdcore import ncdcore
+
+CONFIG = Path(__file__).parents[1]/"src"/"SAS_bluesky"/"profile_yamls"/"panda_config.yaml"
+
+
+def test_sidecar_matches_yaml(tmp_path, monkeypatch):
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path/"cache"))
+    config_filepath = str(tmp_path/"panda_config.yaml")
+    shutil.copy(CONFIG, config_filepath)
+
+    parsed = ProfileLoader.read_from_yaml(config_filepath)
+    assert os.path.exists(sidecar_path(config_filepath))
+
+    cached = ProfileLoader.read_from_yaml(config_filepath)
+    assert list(cached.profiles) == list(parsed.profiles)
+    assert cached.detectors == parsed.detectors
+
+    for profile, expected in zip(cached.profiles, parsed.profiles, strict=True):
+        np.testing.assert_array_equal(profile.active_out, expected.active_out)
+
+    #same content with a new mtime is still a hit, new content is a miss
+    os.utime(config_filepath, ns=(0, 0))
+    assert load_sidecar(config_filepath, GROUP_INPUTS) is not None
+
+    with open(config_filepath, "a") as file:
+        file.write("\n# edited\n")
+    assert load_sidecar(config_filepath, GROUP_INPUTS) is None
+
+
+def test_sidecar_hit_is_not_validated(tmp_path, monkeypatch):
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path/"cache"))
+    config_filepath = str(tmp_path/"panda_config.yaml")
+    shutil.copy(CONFIG, config_filepath)
+    expected = list(ProfileLoader.read_from_yaml(config_filepath).profiles)
+
+    def no_validation(*args, **kwargs):
+        raise AssertionError("validated a cached profile")
+
+    monkeypatch.setattr(ProfileGroups.GroupColumns, "model_validate", no_validation)
+    monkeypatch.setattr(ProfileGroups.Group, "model_validate", no_validation)
+
+    assert list(ProfileLoader.read_from_yaml(config_filepath).profiles) == expected
+
+
+@pytest.mark.parametrize("field,value", [("frames", "1.5"), ("pause_trigger", "False")])
+def test_invalid_yaml_is_not_cached(tmp_path, monkeypatch, field, value):
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path/"cache"))
+    config_filepath = str(tmp_path/"panda_config.yaml")
+    text = CONFIG.read_text()
+    shutil.copy(CONFIG, config_filepath)
+    Path(config_filepath).write_text(text.replace(f"    {field}: ", f"    {field}: {value} #", 1)) #noqa
+
+    for _ in range(2):
+        with pytest.raises(ValidationError):
+            ProfileLoader.read_from_yaml(config_filepath).profiles[0]
+
+    assert not os.path.exists(sidecar_path(config_filepath))
+
+
+def test_content_hash_and_artifact_cache(tmp_path):
+
+    configuration = ProfileLoader.read_from_yaml(str(CONFIG), use_cache=False)
+    profile = configuration.profiles[0]
+    decoded = Profile.from_wire(profile.to_wire())
+
+    assert decoded.content_hash() == profile.content_hash()
+    assert decoded.groups[0].content_hash() == profile.groups[0].content_hash()
+
+    #edit a private copy, not anything the caches may hold
+    copy = decoded.model_copy(deep=True)
+    copy.groups[0].group_duration = -1.0
+    assert copy.groups[0].content_hash() == profile.groups[0].content_hash()
+
+    copy.cycles += 1
+    assert copy.content_hash() != profile.content_hash()
+
+    cache = ArtifactCache(max_bytes=200, disk_dir=str(tmp_path))
+    built = []
+
+    def build():
+        built.append(1)
+        return {"data": np.arange(20)}
+
+    artifact = cache.get_or_build("a", "test", build)
+    assert not artifact["data"].flags.writeable
+    cache.get_or_build("a", "test", build)
+    cache.put("b", "test", {"data": np.arange(20)})
+    assert ("a", "test") not in cache and len(cache) == 1
+
+    #evicted from memory, read back from disk
+    np.testing.assert_array_equal(cache.get_or_build("a", "test", build)["data"], np.arange(20)) #noqa
+    assert len(built) == 1
+
+
+def test_artifacts_follow_an_edit_in_place(make_profile):
+
+    ARTIFACT_CACHE.clear()
+    profile = make_profile(2, wait_time=1)
+    profile.seq_table()
+    profile.build_trigger_timeline()
+
+    profile.groups[0].wait_time = 5
+    fresh = make_profile(2, wait_time=[5, 1])
+    assert fresh.content_hash() == profile.content_hash()
+
+    five_ms = ncdcore.to_ticks(5, "MS")
+    for edited in (profile, fresh):
+        assert edited.seq_table().time1.tolist() == [5_000, 1_000]
+        #wait of the first frame ends at 5 ms
+        assert edited.build_trigger_timeline().edge_ticks[1] == five_ms
+        assert edited.compact_timeline().wait_ticks[0] == five_ms
+
+
+def test_seq_table_rebuilt_only_after_edits(monkeypatch):
+
+    compiled = []
+
+    def counting_compile(*args, **kwargs):
+        compiled.append(1)
+        return compile_seq_table(*args, **kwargs)
+
+    monkeypatch.setattr(ProfileGroups, "compile_seq_table", counting_compile)
+    ARTIFACT_CACHE.clear()
+
+    profile = ProfileLoader.read_from_yaml(str(CONFIG), use_cache=False).profiles[0]
+    #different to every other group, so never merged with them
+    group = profile.groups[0].model_copy(update={"wait_time": 12345}, deep=True)
+    group.recalc_times()
+    seq_table = profile.seq_table
+
+    n_groups = len(seq_table())
+    profile.seq_table()
+    assert len(compiled) == 1
+
+    profile.append_group(group)
+    assert len(seq_table()) == n_groups + 1
+
+    profile.groups[0].frames += 1
+    assert seq_table().repeats[0] == profile.groups[0].frames
+
+    profile.groups[0].pause_trigger = "BITA_1"
+    assert seq_table().trigger[0] == SeqTrigger.BITA_1
+
+    profile.delete_group(-1)
+    assert len(seq_table()) == n_groups
+
+    #the derived times aren't recalculated by an edit in place
+    profile.groups[0].wait_time += 1
+    assert seq_table().time1[0] == ncdcore.ticks_to_micros(
+        ncdcore.to_ticks(profile.groups[0].wait_time, profile.groups[0].wait_units))
+
+    n_compiled = len(compiled)
+    profile.seq_table()
+    assert len(compiled) == n_compiled
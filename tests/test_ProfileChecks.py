@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from SAS_bluesky.ProfileChecks import check_profile
+
+
+def test_check_profile_flags_each_group(make_columns):
+
+    columns = make_columns(6, frames=5, run_time=10, run_pulses=[1, 0, 1, 0])
+    columns["run_pulses"] = [*columns["run_pulses"][:1], [1, 2, 0], *columns["run_pulses"][2:]] #noqa
+    columns["pause_trigger"][2] = "NOT_A_TRIGGER"
+    columns["wait_units"][3] = "fortnight"
+    columns["frames"][4] = 0
+    columns["wait_time"][5] = 0
+
+    report = check_profile(columns, deadtime={"saxs": 500e-6, "waxs": 2e-3}, n_pulses=4)
+
+    assert not report.ok
+    assert report.groups["pulse_length"].tolist() == [False, True, False, False, False, False] #noqa
+    assert report.groups["pulse_values"][1]
+    assert report.groups["trigger"][2]
+    assert report.groups["units"][3]
+    assert report.groups["no_frames"][4]
+    #1 ms wait is enough for saxs but not waxs
+    assert report.groups["deadtime"].tolist() == [True, True, True, False, True, True]
+    assert report.groups["slack_ticks"][0] == 125_000 - 250_000
+
+    with pytest.raises(ValueError, match="waxs"):
+        report.raise_for_errors()
+
+
+def test_check_profile_sequencer_rows(make_profile):
+
+    profile = make_profile(10, pause_trigger="BITA_1")
+
+    report = check_profile(profile, deadtime=np.array([100e-6]), n_pulses=4)
+
+    assert report.ok
+    assert report.seq_rows == len(profile.seq_table().repeats)
+
+    report = check_profile(profile, max_rows=4)
+
+    assert not report.ok
+    assert "sequencer" in report.messages()[0]
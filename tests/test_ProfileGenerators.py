@@ -0,0 +1,38 @@
+import numpy as np
+
+from SAS_bluesky.ProfileGenerators import geometric_times, linear_times
+from SAS_bluesky.ProfileGroups import Profile
+
+
+def test_generated_frames_collapse_into_groups():
+
+    profile = Profile.from_callback(lambda n: 1e-3*2**(n//100), 1000, wait_time=500e-6)
+
+    assert len(profile.groups) == 10
+    assert profile.total_frames == 1000
+    assert [(g.frames, g.run_time, g.run_units) for g in profile.groups[:2]] == [(100, 1, "MS"), (100, 2, "MS")] #noqa
+    assert profile.groups[0].wait_time == 500 and profile.groups[0].wait_units == "US"
+    assert profile.groups[-1].run_ticks == 512*125_000
+
+
+def test_generated_times_are_quantised():
+
+    profile = Profile.geometric(200, 1e-3, 1, wait_time=1e-3, pause_trigger="BITA_1")
+
+    run_ticks = np.repeat([g.run_ticks for g in profile.groups], [g.frames for g in profile.groups]) #noqa
+    expected = np.rint(geometric_times(200, 1e-3, 1)*1e6).astype(np.int64)*125
+
+    np.testing.assert_array_equal(run_ticks, expected)
+    #only the first frame waits for the trigger
+    assert profile.groups[0].frames == 1 and profile.groups[0].pause_trigger == "BITA_1"
+    assert {g.pause_trigger for g in profile.groups[1:]} == {"IMMEDIATE"}
+
+
+def test_piecewise_profile():
+
+    profile = Profile.piecewise([(linear_times(100, 1e-3, 1e-3), 1e-3),
+                                 (linear_times(10, 1, 1), 10e-3)],
+                                cycles=2)
+
+    assert [(g.frames, g.run_time, g.run_units, g.wait_time) for g in profile.groups] == [(100, 1, "MS", 1), (10, 1, "S", 10)] #noqa
+    assert profile.cycles == 2
@@ -0,0 +1,53 @@
+from pathlib import Path
+
+from SAS_bluesky.ProfileGroups import Profile, ProfileLoader
+
+CONFIG = Path(__file__).parents[1]/"src"/"SAS_bluesky"/"profile_yamls"/"panda_config.yaml"
+
+
+def test_profiles_are_built_lazily_and_evicted():
+
+    configuration = ProfileLoader.read_from_yaml(str(CONFIG), use_cache=False, max_cached=2)
+    profiles = configuration.profiles
+
+    assert configuration.n_profiles == len(profiles) > 3
+    assert not any(profiles.is_built(n) for n in range(len(profiles)))
+
+    edited = profiles[0]
+    edited.append_group(edited.groups[0])
+    total_frames = edited.total_frames
+
+    profiles[1]
+    profiles[2]
+    assert not profiles.is_built(0) and profiles.is_built(2)
+
+    #the edit survives being evicted
+    assert profiles[0].total_frames == total_frames
+
+    #profiles put in by the caller are kept
+    profiles[3] = Profile()
+    for n in range(len(profiles)):
+        profiles[n]
+    assert profiles[3] == Profile()
+    assert profiles.is_built(3)
+
+    eager = ProfileLoader.read_from_yaml(str(CONFIG), use_cache=False, max_cached=None)
+    assert list(eager.profiles)[1:3] == profiles[1:3]
+
+
+def test_save_to_yaml_round_trip(tmp_path):
+
+    configuration = ProfileLoader.read_from_yaml(str(CONFIG), use_cache=False)
+    edited = configuration.profiles[1]
+    edited.append_group(edited.groups[0])
+
+    config_filepath = str(tmp_path/"saved.yaml")
+    configuration.save_to_yaml(config_filepath, chunk_size=2)
+
+    saved = ProfileLoader.read_from_yaml(config_filepath, use_cache=False)
+    assert list(saved.profiles) == list(configuration.profiles)
+
+    with open(config_filepath) as file:
+        text = file.read()
+    assert "group_duration" not in text and "total_frames" not in text
+    assert list(tmp_path.iterdir()) == [tmp_path/"saved.yaml"]
@@ -0,0 +1,56 @@
+import matplotlib
+import numpy as np
+import pytest
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt #noqa
+
+from SAS_bluesky.ProfilePlot import TriggerPlot #noqa
+
+
+@pytest.fixture
+def plot(make_profile):
+
+    #100 frames of 1 ms + 1 ms, output B only high in the second group
+    profile = make_profile(frames=[50, 50], run_pulses=[[1, 0, 0, 0], [1, 1, 0, 0]])
+    plot = TriggerPlot(profile.compact_timeline(), unit="ms", scale=1e-3, max_bins=10)
+    yield plot
+    plt.close(plot.figure)
+
+
+def test_window_is_exact_or_binned(plot):
+
+    timeline = plot.timeline
+
+    #10 frames fit in 10 bins, drawn exactly
+    x, signals = plot.window_signals(0, 19.5e-3)
+    window = timeline.slice(0, 19.5e-3)
+    np.testing.assert_allclose(x, window.edge_times)
+    np.testing.assert_array_equal(signals[0], np.append(window.veto, False))
+    assert len(signals) == 1 + len(timeline.active_out)
+
+    #one more frame doesn't
+    assert len(plot.window_signals(0, 20.5e-3)[0]) == 2*plot.max_bins + 1
+
+    #the whole profile is 100 frames, drawn as 10 min/max bins
+    x, signals = plot.window_signals(0, timeline.duration)
+    assert len(x) == 2*plot.max_bins + 1
+    veto, usr1 = signals[0], signals[2]
+    #every bin of the veto goes low then high, usr1 is only high in the second half
+    np.testing.assert_array_equal(veto[:-1], [0, 1]*plot.max_bins)
+    np.testing.assert_array_equal(usr1[:-1:2], [0]*plot.max_bins)
+    np.testing.assert_array_equal(usr1[1:-1:2], [0]*5 + [1]*5)
+
+
+def test_zooming_redraws_the_lines(plot):
+
+    plot.figure.canvas.draw()
+    assert plot._background is not None
+
+    #x limits in ms
+    plot.axes[0].set_xlim(0, 4)
+    x, signals = plot.window_signals(0, 4e-3)
+    np.testing.assert_allclose(plot.lines[0].get_xdata(), x/plot.scale)
+    np.testing.assert_array_equal(plot.lines[0].get_ydata(), signals[0])
+    assert plot.lines[0].get_xdata()[-1] < 10
@@ -0,0 +1,155 @@
+import numpy as np
+import pytest
+
+from SAS_bluesky.ProfileGroups import Group, Profile
+from SAS_bluesky.utils.ncdcore import TICKS_PER_US
+
+
+@pytest.fixture
+def two_groups(make_profile):
+
+    def make(cycles=2):
+        return make_profile(frames=[2, 3], wait_time=[1, 10], wait_units=["S", "MS"],
+                            run_time=[2, 5], run_units=["S", "MS"],
+                            wait_pulses=[[1, 0, 0, 0], [0, 0, 0, 0]],
+                            run_pulses=[[0, 1, 0, 0], [0, 0, 0, 0]], cycles=cycles)
+
+    return make
+
+
+def test_trigger_timeline_matches_frame_loop(two_groups):
+
+    profile = two_groups()
+    timeline = profile.build_trigger_timeline()
+
+    edges = [0.0]
+    veto = []
+    for _ in range(profile.cycles):
+        for group in profile.groups:
+            for _ in range(group.frames):
+                edges.append(edges[-1] + group.wait_time_s)
+                edges.append(edges[-1] + group.run_time_s)
+                veto += [False, any(group.run_pulses)]
+
+    np.testing.assert_allclose(timeline.edge_times, edges)
+    assert timeline.edge_ticks[-1] == profile.duration_ticks
+    np.testing.assert_array_equal(timeline.veto, veto)
+    np.testing.assert_array_equal(timeline.active_out, [0, 1])
+    assert timeline.outputs.shape == (2, 2*profile.total_frames*profile.cycles)
+    np.testing.assert_array_equal(timeline.outputs[:, :4], [[1, 0, 1, 0],
+                                                            [0, 1, 0, 1]])
+
+
+def test_compact_timeline_matches_expanded_timeline(two_groups):
+
+    profile = two_groups()
+    expanded = profile.build_trigger_timeline()
+    compact = profile.compact_timeline()
+
+    assert compact.duration == profile.duration
+
+    #sample the middle of every phase
+    t = (expanded.edge_times[:-1] + expanded.edge_times[1:])/2
+    veto, outputs = compact.state_at(t)
+
+    np.testing.assert_array_equal(veto, expanded.veto)
+    np.testing.assert_array_equal(outputs, expanded.outputs)
+
+    location = compact.locate(t)
+    np.testing.assert_array_equal(location.frame_index, np.arange(len(t))//2)
+    np.testing.assert_array_equal(location.phase, np.arange(len(t)) % 2)
+    assert location.cycle[-1] == profile.cycles-1
+    assert compact.locate(compact.duration + 1).group == -1
+
+    window = compact.slice(t[3], t[12])
+    np.testing.assert_allclose(window.edge_times, expanded.edge_times[2:15])
+    np.testing.assert_array_equal(window.outputs, expanded.outputs[:, 2:14])
+
+
+def test_group_indexes_follow_edits(two_groups):
+
+    profile = two_groups()
+    group = Group(frames=4, wait_time=3, wait_units="MS", run_time=1, run_units="S",
+                  pause_trigger="IMMEDIATE", wait_pulses=[0, 0, 0, 1],
+                  run_pulses=[0, 0, 0, 0])
+
+    profile.append_group(group)
+    profile.insert_group(0, group)
+    profile.delete_group(1)
+    profile.insert_group(-1, profile.groups[0])
+
+    expected = Profile(cycles=profile.cycles, groups=list(profile.groups))
+
+    assert profile.total_frames == expected.total_frames
+    assert np.isclose(profile.duration_per_cycle, expected.duration_per_cycle)
+    np.testing.assert_array_equal(profile.active_out, [3])
+    np.testing.assert_allclose(profile.group_start_times(),
+                               expected.compact_timeline().group_start[:-1])
+    np.testing.assert_array_equal(profile.group_frame_offsets(),
+                                  expected.compact_timeline().frame_start[:-1])
+
+
+def test_envelope_bounds_the_signals(two_groups):
+
+    compact = two_groups(cycles=3).compact_timeline()
+    edges, veto_min, veto_max, outputs_min, outputs_max = compact.envelope(0, compact.duration, 97) #noqa
+
+    #sample densely inside every bin
+    t = edges[:-1, None] + np.linspace(0, 1, 50, endpoint=False)*(edges[1]-edges[0])
+    veto, outputs = compact.state_at(t)
+
+    assert np.all(veto_min <= veto.min(axis=1)) and np.all(veto.max(axis=1) <= veto_max)
+    assert np.all(outputs_min <= outputs.min(axis=2))
+    assert np.all(outputs.max(axis=2) <= outputs_max)
+
+    #bins inside one phase hold the state of that phase
+    single = ~(outputs_max & ~outputs_min).any(axis=0)
+    np.testing.assert_array_equal(outputs_min[:, single], outputs[:, single, 0])
+
+
+def test_frame_index_matches_timeline(tmp_path, two_groups):
+
+    profile = two_groups()
+    expanded = profile.build_trigger_timeline()
+    index = profile.frame_index()
+
+    assert len(index) == profile.total_frames*profile.cycles
+    np.testing.assert_array_equal(index["start_ticks"], expanded.edge_ticks[:-1:2])
+    np.testing.assert_array_equal(index["run_start_ticks"], expanded.edge_ticks[1::2])
+    np.testing.assert_array_equal(index["end_ticks"], expanded.edge_ticks[2::2])
+    np.testing.assert_array_equal(index["group"], [0, 0, 1, 1, 1]*2)
+    np.testing.assert_array_equal(index["frame_in_group"], [0, 1, 0, 1, 2]*2)
+    np.testing.assert_array_equal(index["cycle"], [0]*5 + [1]*5)
+    np.testing.assert_array_equal(index["run_outputs"], [2, 2, 0, 0, 0]*2)
+
+    path = profile.write_frame_index(str(tmp_path / "index.npy"), chunk_frames=3)
+    np.testing.assert_array_equal(np.load(path, mmap_mode="r"), index)
+
+    with np.load(profile.write_frame_index(str(tmp_path / "index.npz"))) as stored:
+        np.testing.assert_array_equal(stored["end_ticks"], index["end_ticks"])
+
+
+def test_empty_profile_has_an_empty_signal(make_profile):
+
+    profile = make_profile(0)
+    trigger_time, veto_signal, active_out = profile.build_veto_signal()
+
+    np.testing.assert_array_equal(trigger_time, [0, 0])
+    np.testing.assert_array_equal(veto_signal, [0, 0])
+    assert len(active_out) == 0
+    assert profile.build_trigger_timeline().outputs.shape == (0, 0)
+    assert len(profile.frame_index()) == 0
+
+
+def test_sub_microsecond_times_match_the_seq_table(make_profile):
+
+    #the sequencer plays whole microseconds, 1500 ns runs for 2 us
+    profile = make_profile(frames=3, wait_time=1500, wait_units="NS", run_time=10, run_units="NS") #noqa
+    table = profile.seq_table()
+    index = profile.frame_index()
+
+    assert (table.time1[0], table.time2[0]) == (2, 1)
+    np.testing.assert_array_equal(index["run_start_ticks"] - index["start_ticks"], 2*TICKS_PER_US) #noqa
+    np.testing.assert_array_equal(index["end_ticks"] - index["run_start_ticks"], TICKS_PER_US) #noqa
+    assert profile.duration_ticks == 3*3*TICKS_PER_US
+    assert np.isclose(profile.build_trigger_timeline().edge_times[-1], 9e-6)
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from SAS_bluesky.SeqCompiler import SEQ_MAX_REPEATS, SEQ_MAX_TIME
+
+
+def test_equivalent_groups_are_merged(make_profile):
+
+    profile = make_profile(frames=[2, 3, 1, 4],
+                           pause_trigger=["IMMEDIATE", "IMMEDIATE", "BITA_1", "IMMEDIATE"])
+    table = profile.seq_table()
+
+    np.testing.assert_array_equal(table.repeats, [5, 1, 4])
+    assert np.sum(table.repeats) == profile.total_frames
+
+
+def test_overflowing_groups_are_split(make_profile):
+
+    table = make_profile(frames=3*SEQ_MAX_REPEATS).seq_table()
+    assert np.sum(table.repeats, dtype=np.int64) == 3*SEQ_MAX_REPEATS
+
+    table = make_profile(frames=2, wait_time=2, wait_units="H").seq_table()
+    assert np.all(table.time1 <= SEQ_MAX_TIME) and np.all(table.time2 <= SEQ_MAX_TIME)
+    total_time = np.sum(table.repeats*(table.time1.astype(np.int64) + table.time2))
+    assert total_time == 2*(2*60*60*1e6 + 1e3)
+
+
+def test_profile_too_long_for_sequencer(make_profile):
+
+    with pytest.raises(ValueError, match="sequencer rows"):
+        make_profile(frames=10**5, wait_time=2, wait_units="H").seq_table()
+
+
+def test_long_profile_is_chunked(make_profile):
+
+    profile = make_profile(wait_time=[n+1 for n in range(25)],
+                           pause_trigger=["BITA_1" if n % 7 == 0 else "IMMEDIATE" for n in range(25)]) #noqa
+    chunks = profile.seq_chunks(max_rows=8)
+
+    assert [len(chunk.repeats) for chunk in chunks] == [7, 7, 7, 4]
+    np.testing.assert_array_equal(np.concatenate([chunk.time1 for chunk in chunks]),
+                                  [1000*(n+1) for n in range(25)])
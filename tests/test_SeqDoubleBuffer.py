@@ -0,0 +1,57 @@
+import asyncio
+
+from ophyd_async.core import Device, DeviceVector, soft_signal_r_and_setter, soft_signal_rw
+from ophyd_async.fastcs.panda import PandaBitMux, PandaTimeUnits, SeqTable, SeqTrigger
+
+from SAS_bluesky.ProfileGroups import Profile
+from SAS_bluesky.SeqDoubleBuffer import DoubleBufferedSeqTableInfo, DoubleBufferedSeqTriggerLogic #noqa
+
+
+class MockSeq(Device):
+
+    def __init__(self, name=""):
+        self.table = soft_signal_rw(SeqTable, SeqTable())
+        self.repeats = soft_signal_rw(int)
+        self.prescale = soft_signal_rw(float)
+        self.prescale_units = soft_signal_rw(PandaTimeUnits)
+        self.enable = soft_signal_rw(PandaBitMux)
+        self.bitc = soft_signal_rw(str)
+        self.active, _ = soft_signal_r_and_setter(bool)
+        super().__init__(name)
+
+
+class MockPandA(Device):
+
+    def __init__(self, name=""):
+        self.seq = DeviceVector({1: MockSeq(), 2: MockSeq()})
+        super().__init__(name)
+
+
+def test_chunks_are_loaded_on_both_sequencers():
+
+    async def run():
+
+        panda = MockPandA(name="test_db_panda")
+        await panda.connect(mock=True)
+
+        profile = Profile.linear(30, 1e-3, 30e-3, wait_time=1e-3, pause_trigger="BITA_1")
+        chunks = profile.seq_chunks(max_rows=11)
+        logic = DoubleBufferedSeqTriggerLogic(panda, (1, 2), "BITC")
+
+        await logic.prepare(DoubleBufferedSeqTableInfo(chunks=chunks, repeats=2))
+
+        assert len(logic._order) == 2*len(chunks)
+        assert await panda.seq[1].bitc.get_value() == "SEQ2.ACTIVE"
+        assert await panda.seq[2].bitc.get_value() == "SEQ1.ACTIVE"
+
+        first = await panda.seq[1].table.get_value()
+        second = await panda.seq[2].table.get_value()
+        assert first.trigger[0] == SeqTrigger.BITA_1
+        #the next chunk waits for seq 1 to finish
+        assert second.trigger[0] == SeqTrigger.BITC_0
+        assert len(second.repeats) == len(chunks[1].repeats)
+
+        #the first chunk has its own trigger, so coming round again it gets a handoff row
+        assert logic._order[len(chunks)].trigger[:2] == [SeqTrigger.BITC_0, SeqTrigger.BITA_1] #noqa
+
+    asyncio.run(run())
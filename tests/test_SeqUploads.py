@@ -0,0 +1,42 @@
+import asyncio
+
+from ophyd_async.core import Device, soft_signal_rw
+from ophyd_async.fastcs.panda import PandaTimeUnits, SeqTable
+from ophyd_async.testing import get_mock_put, set_mock_value
+
+from SAS_bluesky.ProfileGroups import Profile
+from SAS_bluesky.SeqUploads import SEQ_UPLOADS, forget_seq_uploads, upload_seq
+
+
+class MockSeq(Device):
+
+    def __init__(self, name=""):
+        self.table = soft_signal_rw(SeqTable, SeqTable())
+        self.repeats = soft_signal_rw(int)
+        self.prescale = soft_signal_rw(float)
+        self.prescale_units = soft_signal_rw(PandaTimeUnits)
+        super().__init__(name)
+
+
+def test_unchanged_table_is_not_uploaded_again():
+
+    async def run():
+
+        seq = MockSeq(name="test_panda-seq-1")
+        await seq.connect(mock=True)
+        table = Profile.linear(10, 1e-3, 1e-3, wait_time=1e-3, pause_trigger="BITA_1").seq_table() #noqa
+
+        assert await upload_seq(seq, table, 2)
+        assert not await upload_seq(seq, table, 2)
+        assert get_mock_put(seq.table).call_count == 1
+
+        #different settings, or changed on the PandA, are written
+        assert await upload_seq(seq, table, 3)
+        set_mock_value(seq.repeats, 7)
+        assert await upload_seq(seq, table, 3)
+
+        forget_seq_uploads("test_panda-")
+        assert "test_panda-seq-1" not in SEQ_UPLOADS
+        assert await upload_seq(seq, table, 3)
+
+    asyncio.run(run())
@@ -0,0 +1,74 @@
+import asyncio
+import os
+
+from bluesky import RunEngine
+from ophyd_async.core import Device, soft_signal_rw
+from ophyd_async.fastcs.panda import PandaTimeUnits
+from ophyd_async.testing import get_mock_put, set_mock_value
+
+from SAS_bluesky.stubs.SettingsStubs import (
+    SETTINGS_CACHE,
+    CachedYamlSettingsProvider,
+    apply_settings_diff,
+    forget_settings_file,
+    load_settings_file,
+    preload_settings_yamls,
+    read_settings_diff,
+)
+
+
+class MockPulse(Device):
+
+    def __init__(self, name=""):
+        self.width = soft_signal_rw(float)
+        self.width_units = soft_signal_rw(PandaTimeUnits)
+        self.label = soft_signal_rw(str)
+        super().__init__(name)
+
+
+def test_only_changed_settings_are_written():
+
+    RE = RunEngine(call_returns_result=True)
+
+    pulse = MockPulse(name="pulse")
+    #connected on the RunEngine's loop
+    asyncio.run_coroutine_threadsafe(pulse.connect(mock=True), RE.loop).result()
+
+    named_values = {"width": 1.0, "width_units": "ms", "label": None}
+    set_mock_value(pulse.width, 1.0)
+
+    diff = asyncio.run_coroutine_threadsafe(read_settings_diff(pulse, named_values), RE.loop).result() #noqa
+    assert diff == {"width_units": (PandaTimeUnits.MIN, "ms")}
+
+    assert RE(apply_settings_diff(pulse, named_values)).plan_result == diff
+    assert get_mock_put(pulse.width_units).call_count == 1
+    assert get_mock_put(pulse.width).call_count == 0
+    assert get_mock_put(pulse.label).call_count == 0
+
+    #nothing left to write
+    assert RE(apply_settings_diff(pulse, named_values)).plan_result == {}
+    assert get_mock_put(pulse.width_units).call_count == 1
+
+
+def test_settings_yaml_parsed_only_when_changed(tmp_path):
+
+    path = tmp_path/"panda.yaml"
+    path.write_text("seq.1.repeats: 1\nseq.1.prescale_units: us\n")
+
+    assert preload_settings_yamls(tmp_path) == [str(path)]
+    cached = SETTINGS_CACHE[str(path)]
+
+    named_values = load_settings_file(path)
+    named_values["seq.1.repeats"] = 5
+    assert load_settings_file(path) == {"seq.1.repeats": 1, "seq.1.prescale_units": "us"}
+
+    #touched, the same content isn't parsed again
+    os.utime(path, ns=(cached.mtime_ns + 10**9, cached.mtime_ns + 10**9))
+    load_settings_file(path)
+    assert SETTINGS_CACHE[str(path)].named_values is cached.named_values
+
+    path.write_text("seq.1.repeats: 2\nseq.1.prescale_units: us\n")
+    assert asyncio.run(CachedYamlSettingsProvider(tmp_path).retrieve("panda"))["seq.1.repeats"] == 2 #noqa
+
+    forget_settings_file()
+    assert not SETTINGS_CACHE
@@ -0,0 +1,215 @@
+import asyncio
+from pathlib import Path
+
+import bluesky.plan_stubs as bps
+import numpy as np
+import pytest
+from bluesky import RunEngine
+from event_model import DataKey
+from ophyd_async.core import (
+    DetectorController,
+    DetectorTrigger,
+    DetectorWriter,
+    Device,
+    DeviceVector,
+    FlyerController,
+    StandardDetector,
+    StandardFlyer,
+    TriggerInfo,
+    soft_signal_rw,
+)
+from ophyd_async.fastcs.panda import SeqTable, SeqTableInfo
+from ophyd_async.testing import get_mock_put
+
+from SAS_bluesky.stubs.TriggerStubs import (
+    PANDA,
+    PreparedTriggering,
+    format_dead_times,
+    rearm_panda_triggering,
+    repeat_prepared_triggering,
+    stage_and_prepare_detectors,
+)
+
+
+class MockPulse(Device):
+
+    def __init__(self, name=""):
+        self.enable = soft_signal_rw(str)
+        super().__init__(name)
+
+
+class MockSeq(Device):
+
+    def __init__(self, name=""):
+        #False, so every run has already finished
+        self.active = soft_signal_rw(bool)
+        super().__init__(name)
+
+
+class MockPanda(Device):
+
+    def __init__(self, name=""):
+        self.seq = DeviceVector({1: MockSeq()})
+        self.pulse = DeviceVector({1: MockPulse(), 2: MockPulse()})
+        super().__init__(name)
+
+
+class MockTriggerLogic(FlyerController):
+
+    def __init__(self):
+        self.prepared = []
+
+    async def prepare(self, value):
+        self.prepared.append(value)
+
+    async def kickoff(self):
+        pass
+
+    async def complete(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class MockController(DetectorController):
+
+    def __init__(self):
+        self.prepared = []
+
+    def get_deadtime(self, exposure):
+        return 0.0
+
+    async def prepare(self, trigger_info):
+        self.prepared.append(trigger_info)
+
+    async def arm(self):
+        pass
+
+    async def wait_for_idle(self):
+        pass
+
+    async def disarm(self):
+        pass
+
+
+class MockWriter(DetectorWriter):
+
+    """
+    Writes every frame as soon as it is kicked off, but no files
+    """
+
+    async def open(self, name, exposures_per_event=1):
+        return {name: DataKey(source="mock",
+                              shape=[],
+                              dtype="number",
+                              external="STREAM:")}
+
+    async def get_indices_written(self):
+        return 1
+
+    async def observe_indices_written(self, timeout):
+        yield 1
+
+    async def collect_stream_docs(self, name, indices_written):
+        for doc in ():
+            yield doc
+
+    async def close(self):
+        pass
+
+
+class MockPathProvider:
+
+    def __init__(self):
+        self.updates = []
+
+    async def update(self, directory, suffix):
+        self.updates.append(directory)
+
+
+def make_prepared(RE) -> PreparedTriggering:
+
+    panda = MockPanda(name="panda1")
+    detector = StandardDetector(MockController(), MockWriter(), name="saxs")
+    #connected on the RunEngine's loop
+    for device in (panda, detector):
+        asyncio.run_coroutine_threadsafe(device.connect(mock=True), RE.loop).result()
+
+    table_info = SeqTableInfo(sequence_table=SeqTable(), repeats=1)
+    trigger_info = TriggerInfo(number_of_events=1,
+                               trigger=DetectorTrigger.CONSTANT_GATE,
+                               deadtime=1e-3,
+                               livetime=1e-3)
+
+    return PreparedTriggering(panda=panda,
+                              active_detectors=(detector,),
+                              active_pulses=np.array([1, 2]),
+                              flyer=StandardFlyer(MockTriggerLogic()),
+                              table_info=table_info,
+                              trigger_info=trigger_info,
+                              visit_path="/tmp/cm12345",
+                              path_provider=MockPathProvider(),
+                              timeout=5)
+
+
+def configure(prepared: PreparedTriggering):
+
+    #what configure_panda_triggering does to the flyer and detectors
+    yield from stage_and_prepare_detectors(prepared.active_detectors, prepared.flyer,
+                                           prepared.trigger_info)
+    yield from bps.prepare(prepared.flyer, prepared.table_info, wait=True)
+
+
+def test_rearm_panda_triggering():
+
+    RE = RunEngine(call_returns_result=True)
+    prepared = make_prepared(RE)
+
+    stages = RE(rearm_panda_triggering(prepared)).plan_result
+
+    assert list(stages) == ["new_collection", "flyer", "detectors"]
+    assert prepared.path_provider.updates == [Path("/tmp/cm12345")]
+    assert prepared.flyer._trigger_logic.prepared == [prepared.table_info]
+    assert prepared.active_detectors[0]._controller.prepared == [prepared.trigger_info]
+
+
+@pytest.mark.parametrize("n_runs", [1, 2])
+def test_repeat_prepared_triggering(n_runs):
+
+    RE = RunEngine(call_returns_result=True)
+    prepared = make_prepared(RE)
+
+    docs = []
+    RE.subscribe(lambda name, doc: docs.append((name, doc)))
+
+    RE(configure(prepared))
+    commands = []
+    RE.msg_hook = lambda msg: commands.append(msg.command)
+    dead_times = RE(repeat_prepared_triggering(prepared, n_runs)).plan_result
+
+    #no settle time between repeats
+    assert "sleep" not in commands
+
+    #every run opened (so its stream could be declared) and closed by itself
+    starts = [doc for name, doc in docs if name == "start"]
+    stops = [doc for name, doc in docs if name == "stop"]
+    assert [start["repeat"] for start in starts] == list(range(1, n_runs + 1))
+    assert [stop["exit_status"] for stop in stops] == ["success"] * n_runs
+    assert len({start["uid"] for start in starts}) == n_runs
+
+    #rearmed between runs only
+    assert len(dead_times) == n_runs - 1
+    assert len(prepared.path_provider.updates) == n_runs - 1
+    assert len(prepared.flyer._trigger_logic.prepared) == n_runs
+    names = ["finish_run", "new_collection", "flyer", "detectors", "arm", "dead_time"]
+    for times in dead_times:
+        assert list(times) == names
+        assert times["dead_time"] >= 0
+
+    #pulses armed then disarmed for every run
+    for pulse in prepared.panda.pulse.values():
+        values = [call.args[0] for call in get_mock_put(pulse.enable).call_args_list]
+        assert values == [PANDA.Enable.value, PANDA.Disable.value] * n_runs
+
+    assert format_dead_times(dead_times).count("\n") == (n_runs if n_runs > 1 else 0)